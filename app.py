@@ -1,36 +1,128 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from datetime import datetime
+from datetime import datetime, timedelta
+import io
 import os
-from database import init_db, get_db_connection
+import math
+import multiprocessing
+from database import init_db, get_db_connection, pool_stats, read_your_writes_flask, replica_stats
 from auth import (
+    auth_cache_stats,
     authenticate_user, 
+    bind_token_tenant,
+    client_ip,
     generate_token, 
+    login_limiter_stats,
+    login_retry_after,
+    record_login_failure,
+    TOKEN_LIFETIME_HOURS,
     token_required, 
     role_required,
+    verify_scan_token,
     verify_token
 )
 from models import (
     record_employee_attendance, 
+    record_employee_scans,
+    SCAN_BATCH_MAX_SIZE,
     get_employee_attendance, 
+    iter_employee_attendance,
+    ATTENDANCE_PAGE_SIZE,
     get_attendance_stats,
     record_student_attendance, 
-    get_students_by_grade_section,
-    generate_qr_code, 
+    student_roll_call_params,
+    get_roster,
+    get_teacher_grade,
+    roster_cache,
+    badge_data_url,
+    get_badge_users,
     get_employees, 
     add_employee, 
     activate_employee,
     add_student
 )
+from roster_import import import_roster
+from ingest import enqueue_roll_call, enqueue_scan, ingest_enabled, ingest_stats
+from badges import BADGE_FORMATS, badge_cache, get_badge, get_badges, package_pdf, package_zip
+from instrumentation import INSTRUMENTATION_ENABLED, instrument_flask, render_metrics
+from workers import WorkerPoolBusy, process_pool_stats
+from bitmaps import section_attendance_summary, student_attendance_summary
+from shifts import (
+    ShiftPolicyError,
+    assign_shift_policy,
+    clear_calendar_day,
+    delete_shift_policy,
+    list_calendar,
+    list_shift_policies,
+    recompute_employee_statuses,
+    save_shift_policy,
+    set_calendar_day,
+    shift_schedule
+)
+from reports import REPORT_EXPORTS, REPORT_FORMATS, ReportError, build_attendance_report
+from live import LiveFeedFull, LiveFeedUnavailable, get_live_feed, live_feed_stats, sse_stream, stream_deadline
+from serialization import COMPRESSION_ENABLED, compress_flask, fast_json_provider, list_payload, stream_json_list, wants_columns
+from tenants import MULTI_TENANT, bind_tenant_flask, current_tenant_key, get_tenant, tenant_keys
 
-# Initialize database on startup
-try:
-    init_db()
-except Exception as e:
-    print(f"⚠️  Database initialization warning: {e}")
+# Initialize database on startup (not again in badge render worker processes)
+if multiprocessing.parent_process() is None:
+    try:
+        init_db()
+    except Exception as e:
+        print(f"⚠️  Database initialization warning: {e}")
 
 app = Flask(__name__, static_folder='static')
+app.json = fast_json_provider(DefaultJSONProvider)(app)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
+bind_tenant_flask(app)
+read_your_writes_flask(app)
+if COMPRESSION_ENABLED:
+    compress_flask(app)
+if INSTRUMENTATION_ENABLED:
+    instrument_flask(app)
+
+# ======================
+# HEALTH
+# ======================
+
+def component_stats():
+    """Pool and cache statistics shared by /api/health and /metrics"""
+    return {
+        'pool': pool_stats(),
+        'replicas': replica_stats(),
+        'badge_cache': badge_cache.stats(),
+        'auth_cache': auth_cache_stats(),
+        'ingest': ingest_stats(),
+        'roster_cache': roster_cache.stats(),
+        'shift_schedule': shift_schedule.stats(),
+        'cpu_pool': process_pool_stats(),
+        'login_limits': login_limiter_stats(),
+        'live_feed': live_feed_stats()
+    }
+
+def health_check_tenants():
+    """Schools whose database /api/health pings: the request's, else one per database"""
+    if not MULTI_TENANT or current_tenant_key():
+        return [current_tenant_key()]
+    return list({get_tenant(key).database_url: key for key in tenant_keys()}.values())
+
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    try:
+        for tenant in health_check_tenants():
+            with get_db_connection(tenant) as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT 1')
+    except Exception as e:
+        return jsonify({'status': 'unhealthy', 'error': str(e), 'pool': pool_stats()}), 503
+    
+    return jsonify({'status': 'healthy', **component_stats()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint for this worker process"""
+    return Response(render_metrics(component_stats()), mimetype='text/plain; version=0.0.4')
 
 # ======================
 # AUTHENTICATION
@@ -43,12 +135,21 @@ def login():
     if not data or 'user_id' not in data or 'password' not in data or 'role' not in data:
         return jsonify({'error': 'Missing required fields (user_id, password, role)'}), 400
     
-    result = authenticate_user(data['user_id'], data['password'], data['role'])
+    retry_after = login_retry_after(client_ip(request), data['user_id'])
+    if retry_after:
+        return jsonify({'error': 'Too many login attempts. Try again later.'}), 429, \
+            {'Retry-After': str(math.ceil(retry_after))}
+    
+    try:
+        result = authenticate_user(data['user_id'], data['password'], data['role'])
+    except WorkerPoolBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
     
     if isinstance(result, dict) and 'error' in result:
         return jsonify(result), 403
     
     if not result:
+        record_login_failure(data['user_id'])
         return jsonify({'error': 'Invalid credentials or account not activated'}), 401
     
     token = generate_token(result['id'], result['role'])
@@ -75,7 +176,7 @@ def login():
 def get_employees_route():
     include_inactive = request.args.get('include_inactive', 'false').lower() == 'true'
     employees = get_employees(include_inactive=include_inactive)
-    return jsonify({'employees': employees}), 200
+    return jsonify({'employees': list_payload(employees, request.args)}), 200
 
 @app.route('/api/employees', methods=['POST'])
 @token_required
@@ -88,7 +189,10 @@ def add_employee_route():
         if field not in data:
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
-    result = add_employee(data, request.current_user['user_id'])
+    try:
+        result = add_employee(data, request.current_user['user_id'])
+    except WorkerPoolBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
     return jsonify(result), 201 if result['success'] else 400
 
 @app.route('/api/employees/<int:emp_id>/activate', methods=['POST'])
@@ -102,11 +206,10 @@ def activate_employee_route(emp_id):
 @token_required
 @role_required(['admin'])
 def delete_employee(emp_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET is_active = FALSE WHERE id = %s AND role = %s', (emp_id, 'teacher'))
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE users SET is_active = FALSE WHERE id = %s AND role = %s', (emp_id, 'teacher'))
+        conn.commit()
     
     return jsonify({'success': True, 'message': 'Teacher account deactivated'}), 200
 
@@ -124,8 +227,17 @@ def get_students_route():
         return jsonify({'error': 'Grade and section are required'}), 400
     
     teacher_id = request.current_user['user_id'] if request.current_user['role'] == 'teacher' else None
-    students = get_students_by_grade_section(grade, section, teacher_id)
-    return jsonify({'students': students}), 200
+    students, etag = get_roster(grade, section, teacher_id)
+    
+    # Unchanged roster: the client keeps its copy (weak match: compression weakens the ETag)
+    if etag and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify({'students': list_payload(students, request.args)})
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/api/students', methods=['POST'])
 @token_required
@@ -140,6 +252,70 @@ def add_student_route():
     result = add_student(data, request.current_user['user_id'], request.current_user['role'])
     return jsonify(result), 201 if result['success'] else 400
 
+def _term_day_arg():
+    """?date= picks the term (any day in it); today by default. Raises ValueError"""
+    day = request.args.get('date')
+    return datetime.strptime(day, '%Y-%m-%d').date() if day else None
+
+@app.route('/api/students/<int:student_id>/attendance', methods=['GET'])
+@token_required
+def student_attendance_route(student_id):
+    """A student's term: percentage, absence streaks and day-by-day calendar"""
+    try:
+        day = _term_day_arg()
+    except ValueError:
+        return jsonify({'error': 'Date must be in YYYY-MM-DD format'}), 400
+    
+    summary = student_attendance_summary(student_id, day)
+    if summary is None:
+        return jsonify({'error': 'Student not found'}), 404
+    user = request.current_user
+    if user['role'] == 'teacher' and get_teacher_grade(user['user_id']) != summary['student']['grade']:
+        return jsonify({'error': 'Student is not in your assigned grade'}), 403
+    return jsonify(summary), 200
+
+@app.route('/api/students/attendance', methods=['GET'])
+@token_required
+def section_attendance_route():
+    """Term percentage and absence streaks of every student in a grade/section"""
+    grade = request.args.get('grade')
+    section = request.args.get('section')
+    
+    if not grade or not section:
+        return jsonify({'error': 'Grade and section are required'}), 400
+    try:
+        day = _term_day_arg()
+    except ValueError:
+        return jsonify({'error': 'Date must be in YYYY-MM-DD format'}), 400
+    
+    user = request.current_user
+    if user['role'] == 'teacher' and get_teacher_grade(user['user_id']) != grade:
+        return jsonify({'error': 'You can only view your assigned grade'}), 403
+    
+    summary = section_attendance_summary(grade, section, day)
+    summary['students'] = list_payload(summary['students'], request.args)
+    return jsonify(summary), 200
+
+@app.route('/api/import/<kind>', methods=['POST'])
+@token_required
+@role_required(['admin', 'teacher'])
+def import_roster_route(kind):
+    if kind not in ('students', 'teachers'):
+        return jsonify({'error': 'Import type must be students or teachers'}), 404
+    if kind == 'teachers' and request.current_user['role'] != 'admin':
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'CSV or XLSX file required (form field "file")'}), 400
+    
+    file_format = upload.filename.rsplit('.', 1)[-1].lower()
+    if file_format not in ('csv', 'xlsx'):
+        return jsonify({'error': 'Only .csv and .xlsx files are supported'}), 400
+    
+    result = import_roster(kind, upload.stream, file_format, request.current_user['user_id'], request.current_user['role'])
+    return jsonify(result), 200 if result['success'] else 400
+
 # ======================
 # ATTENDANCE
 # ======================
@@ -149,24 +325,120 @@ def add_student_route():
 def get_employee_attendance_route():
     date = request.args.get('date')
     grade = request.args.get('grade')
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    
+    for value in (date, date_from, date_to):
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
     
     user_id = request.current_user['user_id'] if request.current_user['role'] == 'teacher' else None
+    filters = {
+        'user_id': user_id,
+        'date': date,
+        'grade': grade,
+        'role': request.current_user['role'],
+        'date_from': date_from,
+        'date_to': date_to
+    }
     
-    records = get_employee_attendance(
-        user_id=user_id,
-        date=date,
-        grade=grade,
-        role=request.current_user['role']
-    )
+    # Streamed export: rows go out as they come off a server-side cursor
+    if request.args.get('stream', 'false').lower() == 'true':
+        records = iter_employee_attendance(**filters)
+        return Response(stream_with_context(stream_json_list('attendance', records, wants_columns(request.args))),
+                        mimetype='application/json')
+    
+    try:
+        limit = int(request.args.get('limit', ATTENDANCE_PAGE_SIZE))
+        records, next_cursor = get_employee_attendance(cursor=request.args.get('cursor'), limit=limit, **filters)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
     
-    return jsonify({'attendance': records}), 200
+    return jsonify({'attendance': list_payload(records, request.args), 'next_cursor': next_cursor}), 200
 
 @app.route('/api/attendance/employees/stats', methods=['GET'])
 @token_required
 def get_employee_stats():
+    try:
+        date_from = request.args.get('from')
+        date_to = request.args.get('to')
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
     user_id = request.current_user['user_id'] if request.current_user['role'] == 'teacher' else None
-    stats = get_attendance_stats(user_id=user_id, role=request.current_user['role'])
-    return jsonify({'stats': stats}), 200
+    stats, date_from, date_to = get_attendance_stats(
+        user_id=user_id,
+        role=request.current_user['role'],
+        date_from=date_from,
+        date_to=date_to,
+        grade=request.args.get('grade')
+    )
+    return jsonify({'stats': stats, 'from': date_from.isoformat(), 'to': date_to.isoformat()}), 200
+
+# ======================
+# LIVE FEED
+# ======================
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+@app.route('/api/live/attendance', methods=['GET'])
+@token_required
+def live_attendance_feed():
+    """Server-sent attendance events; see live.py. Teachers only see their own records and grade"""
+    user = request.current_user
+    grade = get_teacher_grade(user['user_id']) if user['role'] == 'teacher' else None
+    try:
+        subscription = get_live_feed().subscribe(user['role'], user['user_id'], grade,
+                                                 request.headers.get('Last-Event-ID'))
+    except LiveFeedFull:
+        return jsonify({'error': 'Too many live connections, please retry'}), 503, {'Retry-After': '30'}
+    except LiveFeedUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    
+    return Response(sse_stream(subscription, stream_deadline(user)), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+# ======================
+# REPORTS
+# ======================
+
+@app.route('/api/reports/attendance', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def attendance_report_route():
+    fmt = request.args.get('format', 'json').lower()
+    if fmt not in REPORT_FORMATS:
+        return jsonify({'error': f'Format must be one of: {", ".join(REPORT_FORMATS)}'}), 400
+    try:
+        date_from = request.args.get('from')
+        date_to = request.args.get('to')
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    try:
+        report = build_attendance_report(
+            request.args.get('kind', 'teachers'),
+            date_from=date_from,
+            date_to=date_to,
+            grade=request.args.get('grade'),
+            section=request.args.get('section'),
+            group=request.args.get('group', 'month')
+        )
+        if fmt == 'json':
+            return jsonify(report), 200
+        render, mimetype = REPORT_EXPORTS[fmt]
+        payload = render(report)
+    except ReportError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return send_file(io.BytesIO(payload), mimetype=mimetype, as_attachment=True,
+                     download_name=f"attendance_{report['kind']}_{report['from']}_{report['to']}.{fmt}")
 
 @app.route('/api/attendance/scan', methods=['POST'])
 def scan_qr_code():
@@ -184,9 +456,15 @@ def scan_qr_code():
         token = parts[2]
         
         payload = verify_token(token)
-        if not payload or payload['user_id'] != user_id:
+        # The badge's school is the scan's (a kiosk may also name it)
+        if not payload or payload['user_id'] != user_id or not bind_token_tenant(payload):
             return jsonify({'error': 'Invalid QR token'}), 401
         
+        # Write-behind mode: acknowledge once the scan is in the local log
+        if ingest_enabled():
+            enqueue_scan(user_id)
+            return jsonify({'success': True, 'queued': True, 'message': 'Attendance queued'}), 202
+        
         attendance_record = record_employee_attendance(user_id, action='auto')
         
         return jsonify({
@@ -197,6 +475,56 @@ def scan_qr_code():
     except Exception as e:
         return jsonify({'error': f'QR processing failed: {str(e)}'}), 400
 
+# Clock skew tolerated on kiosk timestamps
+SCAN_CLOCK_SKEW = timedelta(minutes=5)
+
+@app.route('/api/attendance/scan/batch', methods=['POST'])
+def scan_batch():
+    """Sync scans a kiosk queued while offline.
+
+    Body: {'kiosk_id': optional, 'scans': [{'qr_data', 'scanned_at': ISO 8601}]}.
+    Each QR token must have been valid at scanned_at. Invalid scans are
+    rejected individually; the rest are applied in one transaction.
+    """
+    data = request.get_json(silent=True)
+    
+    if not data or not isinstance(data.get('scans'), list):
+        return jsonify({'error': 'Scans required as array'}), 400
+    if len(data['scans']) > SCAN_BATCH_MAX_SIZE:
+        return jsonify({'error': f'At most {SCAN_BATCH_MAX_SIZE} scans per batch'}), 400
+    
+    latest = datetime.now() + SCAN_CLOCK_SKEW
+    scans, rejected = [], []
+    for index, scan in enumerate(data['scans']):
+        try:
+            parts = scan['qr_data'].split(':')
+            scanned_at = datetime.fromisoformat(scan['scanned_at'])
+        except (KeyError, TypeError, AttributeError, ValueError):
+            rejected.append({'index': index, 'reason': 'Invalid entry (qr_data and ISO scanned_at required)'})
+            continue
+        
+        # Timestamps with an offset are converted to server local time
+        if scanned_at.tzinfo is not None:
+            scanned_at = scanned_at.astimezone().replace(tzinfo=None)
+        if len(parts) != 3 or parts[0] != 'ATTENDANCE' or not parts[1].isdigit():
+            rejected.append({'index': index, 'reason': 'Invalid QR format'})
+            continue
+        if scanned_at > latest:
+            rejected.append({'index': index, 'reason': 'Scan time is in the future'})
+            continue
+        
+        user_id = int(parts[1])
+        payload = verify_scan_token(parts[2], scanned_at.timestamp())
+        # One school per batch: the first valid badge's, unless the kiosk named it
+        if not payload or payload['user_id'] != user_id or not bind_token_tenant(payload):
+            rejected.append({'index': index, 'reason': 'Invalid QR token'})
+            continue
+        scans.append((user_id, scanned_at))
+    
+    result = record_employee_scans(scans, data.get('kiosk_id')) if scans else {'applied': 0, 'duplicates': 0, 'attendance': []}
+    
+    return jsonify({'success': True, **result, 'rejected': rejected}), 200
+
 @app.route('/api/attendance/students', methods=['POST'])
 @token_required
 @role_required(['teacher'])
@@ -206,30 +534,153 @@ def record_student_attendance_route():
     if not data or 'attendance' not in data or not isinstance(data['attendance'], list):
         return jsonify({'error': 'Attendance data required as array'}), 400
     
-    success_count = record_student_attendance(data['attendance'], request.current_user['user_id'])
+    if ingest_enabled():
+        # Grade and existence checks run when the flusher applies it
+        params, rejected = student_roll_call_params(data['attendance'], request.current_user['user_id'])
+        enqueue_roll_call(params)
+        return jsonify({
+            'success': True,
+            'queued': True,
+            'message': f'Attendance queued for {len(params["ids"])} students',
+            'count': len(params['ids']),
+            'rejected': rejected
+        }), 202
+    
+    result = record_student_attendance(data['attendance'], request.current_user['user_id'])
     
     return jsonify({
         'success': True,
-        'message': f'Attendance recorded for {success_count} students',
-        'count': success_count
+        'message': f'Attendance recorded for {result["count"]} students',
+        'count': result['count'],
+        'rejected': result['rejected']
     }), 200
 
+# ======================
+# SHIFT POLICIES
+# ======================
+
+# Longest range one recompute request may cover; run longer ones with the CLI
+SHIFT_RECOMPUTE_MAX_DAYS = 400
+
+def _parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+@app.route('/api/shifts', methods=['GET'])
+@token_required
+@role_required(['admin'])
+def get_shift_policies_route():
+    return jsonify(list_shift_policies()), 200
+
+@app.route('/api/shifts', methods=['POST'])
+@token_required
+@role_required(['admin'])
+def save_shift_policy_route():
+    try:
+        policy = save_shift_policy(request.get_json() or {})
+    except ShiftPolicyError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'policy': policy}), 200
+
+@app.route('/api/shifts/<int:policy_id>', methods=['DELETE'])
+@token_required
+@role_required(['admin'])
+def delete_shift_policy_route(policy_id):
+    if not delete_shift_policy(policy_id):
+        return jsonify({'success': False, 'error': 'Policy not found'}), 404
+    return jsonify({'success': True, 'message': 'Shift policy deleted'}), 200
+
+@app.route('/api/shifts/assignments', methods=['PUT'])
+@token_required
+@role_required(['admin'])
+def assign_shift_policy_route():
+    """{policy_id (null to remove), grade or user_id (neither: the whole school)}"""
+    data = request.get_json() or {}
+    if 'policy_id' not in data:
+        return jsonify({'success': False, 'error': 'Missing required field: policy_id'}), 400
+    try:
+        assign_shift_policy(data['policy_id'], grade=data.get('grade'), user_id=data.get('user_id'))
+    except ShiftPolicyError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'message': 'Shift policy assigned' if data['policy_id'] is not None else 'Shift policy removed'}), 200
+
+@app.route('/api/calendar', methods=['GET'])
+@token_required
+def get_calendar_route():
+    """Holidays, make-up days and half-days from ?from= (today) to ?to= (a year on)"""
+    try:
+        date_from = _parse_day(request.args['from']) if request.args.get('from') else datetime.now().date()
+        date_to = _parse_day(request.args['to']) if request.args.get('to') else date_from + timedelta(days=365)
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    return jsonify({'calendar': list_calendar(date_from, date_to)}), 200
+
+@app.route('/api/calendar/<day>', methods=['PUT'])
+@token_required
+@role_required(['admin'])
+def set_calendar_day_route(day):
+    data = request.get_json() or {}
+    try:
+        day = _parse_day(day)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Date must be in YYYY-MM-DD format'}), 400
+    if not isinstance(data.get('is_working_day'), bool):
+        return jsonify({'success': False, 'error': 'is_working_day (true or false) is required'}), 400
+    try:
+        set_calendar_day(day, data['is_working_day'], data.get('description'), data.get('shift_policy_id'))
+    except ShiftPolicyError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'message': f'{day.isoformat()} updated'}), 200
+
+@app.route('/api/calendar/<day>', methods=['DELETE'])
+@token_required
+@role_required(['admin'])
+def clear_calendar_day_route(day):
+    try:
+        day = _parse_day(day)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Date must be in YYYY-MM-DD format'}), 400
+    if not clear_calendar_day(day):
+        return jsonify({'success': False, 'error': 'No calendar entry for that date'}), 404
+    return jsonify({'success': True, 'message': f'{day.isoformat()} reverted to its weekday default'}), 200
+
+@app.route('/api/shifts/recompute', methods=['POST'])
+@token_required
+@role_required(['admin'])
+def recompute_statuses_route():
+    """Re-derive recorded statuses from {from} to {to} (today) after a policy or calendar change"""
+    data = request.get_json() or {}
+    try:
+        date_from = _parse_day(data['from'])
+        date_to = _parse_day(data['to']) if data.get('to') else datetime.now().date()
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'from (and optionally to) must be YYYY-MM-DD dates'}), 400
+    if date_to < date_from or (date_to - date_from).days >= SHIFT_RECOMPUTE_MAX_DAYS:
+        return jsonify({'error': f'The range must be 1 to {SHIFT_RECOMPUTE_MAX_DAYS} days'}), 400
+    
+    result = recompute_employee_statuses(date_from, date_to)
+    return jsonify({'success': True, **result}), 200
+
 # ======================
 # QR CODES (IN-MEMORY)
 # ======================
 
+def make_qr_token(user_id):
+    return generate_token(user_id, 'qr_scan')
+
 @app.route('/api/qr/generate/<int:user_id>', methods=['GET'])
 @token_required
 def generate_qr_route(user_id):
     if request.current_user['role'] == 'teacher' and request.current_user['user_id'] != user_id:
         return jsonify({'error': 'You can only generate your own QR code'}), 403
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    fmt = request.args.get('format', 'png').lower()
+    if fmt not in BADGE_FORMATS:
+        return jsonify({'error': f'Format must be one of: {", ".join(BADGE_FORMATS)}'}), 400
     
-    cursor.execute('SELECT id, user_id, name, is_active FROM users WHERE id = %s', (user_id,))
-    user = cursor.fetchone()
-    conn.close()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, user_id, name, is_active, activated_at FROM users WHERE id = %s', (user_id,))
+        user = cursor.fetchone()
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -237,15 +688,46 @@ def generate_qr_route(user_id):
     if not user['is_active']:
         return jsonify({'error': 'Cannot generate QR for inactive account'}), 403
     
-    qr_token = generate_token(user['id'], 'qr_scan')
-    qr_base64 = generate_qr_code(user['user_id'], user['name'], qr_token)
+    # The QR encodes users.id, which is what /api/attendance/scan verifies against the token
+    qr_token, issued_at, badge = get_badge(user, make_qr_token, fmt)
     
     return jsonify({
         'success': True,
-        'qr_code': qr_base64,
-        'expires_at': (datetime.now() + datetime.timedelta(hours=24)).isoformat()
+        'qr_code': badge_data_url(badge, fmt),
+        'expires_at': (datetime.fromtimestamp(issued_at) + timedelta(hours=TOKEN_LIFETIME_HOURS)).isoformat()
     }), 200
 
+@app.route('/api/qr/bulk', methods=['POST'])
+@token_required
+@role_required(['admin'])
+def bulk_qr_route():
+    data = request.get_json(silent=True) or {}
+    fmt = str(data.get('format', 'png')).lower()
+    output = str(data.get('output', 'zip')).lower()
+    user_ids = data.get('user_ids')
+    
+    if fmt not in BADGE_FORMATS:
+        return jsonify({'error': f'Format must be one of: {", ".join(BADGE_FORMATS)}'}), 400
+    if output not in ('zip', 'pdf'):
+        return jsonify({'error': 'Output must be zip or pdf'}), 400
+    if user_ids is not None and (not isinstance(user_ids, list) or not all(isinstance(i, int) for i in user_ids)):
+        return jsonify({'error': 'user_ids must be an array of integer ids'}), 400
+    
+    users = get_badge_users(user_ids)
+    if not users:
+        return jsonify({'error': 'No active users to generate badges for'}), 404
+    
+    if output == 'pdf':
+        # PDF pages are raster images; SVG requests are rendered as PNG
+        pdf_fmt = 'png' if fmt == 'svg' else fmt
+        payload = package_pdf(get_badges(users, make_qr_token, pdf_fmt))
+        return send_file(io.BytesIO(payload), mimetype='application/pdf',
+                         as_attachment=True, download_name='badges.pdf')
+    
+    payload = package_zip(get_badges(users, make_qr_token, fmt), fmt)
+    return send_file(io.BytesIO(payload), mimetype='application/zip',
+                     as_attachment=True, download_name=f'badges_{fmt}.zip')
+
 # ======================
 # FRONTEND SERVING
 # ======================
@@ -0,0 +1,547 @@
+"""Async (ASGI) serving mode.
+
+The hot endpoints (login, scans, roll-call, rosters, attendance history and
+stats, QR badges) are served by native async handlers on a psycopg 3 async
+pool, so a worker keeps serving other requests while one waits on the
+database. Every other route falls through to the regular Flask app, which
+also stays deployable on its own with gunicorn (sync mode).
+
+Run with:  hypercorn asgi:app --workers 4 --bind 0.0.0.0:$PORT
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+from datetime import datetime, timedelta
+from functools import wraps
+from quart import Quart, Response, request, jsonify
+from quart.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from app import SSE_HEADERS, app as flask_app, health_check_tenants, make_qr_token
+from database import SQLITE, DB_REPLICA_CHECK_SECONDS, get_replica_set, init_db, read_your_writes_quart, replica_sets, replica_stats
+from async_database import open_async_pool, close_async_pool, async_pool_stats, get_async_connection
+from auth import (
+    AUTH_USER_SQL,
+    TOKEN_LIFETIME_HOURS,
+    UPDATE_PASSWORD_HASH_SQL,
+    auth_cache_stats,
+    bearer_token,
+    bind_token_tenant,
+    check_credentials,
+    client_ip,
+    generate_token,
+    login_limiter_stats,
+    login_retry_after,
+    record_login_failure,
+    REVOCATION_REFRESH_SECONDS,
+    revocations,
+    verify_token
+)
+from models import (
+    ATTENDANCE_ORDER_SQL,
+    ATTENDANCE_PAGE_SIZE,
+    ROSTER_CACHE_REFRESH_SECONDS,
+    ROSTER_SQL,
+    roster_cache,
+    STUDENT_ROLL_CALL_SQL,
+    TEACHER_GRADE_SQL,
+    attendance_stats_from_rows,
+    attendance_stats_query,
+    badge_data_url,
+    employee_attendance_page,
+    employee_attendance_page_query,
+    employee_attendance_query,
+    employee_scan_query,
+    employees_query,
+    serialize_attendance,
+    student_roll_call_params
+)
+from shifts import SHIFT_POLICY_REFRESH_SECONDS, shift_schedule
+from badges import BADGE_FORMATS, badge_cache, get_badge
+from ingest import enqueue_roll_call, enqueue_scan, ingest_enabled, ingest_stats
+from instrumentation import INSTRUMENTATION_ENABLED, instrument_quart, render_metrics
+from workers import WorkerPoolBusy, process_pool_stats
+from live import LiveFeedFull, get_live_feed, live_feed_stats, sse_stream_async, stream_deadline
+from serialization import (
+    COMPRESSION_ENABLED,
+    compress_quart,
+    fast_json_provider,
+    list_payload,
+    stream_json_list_async,
+    wants_columns
+)
+from tenants import MULTI_TENANT, bind_tenant_quart, tenant_context
+
+# The async handlers run psycopg 3 against PostgreSQL; SQLite sites serve app.py with gunicorn
+if SQLITE:
+    raise RuntimeError("The async server needs a PostgreSQL DATABASE_URL; serve a SQLite database with gunicorn app:app")
+
+# Request bodies handed to the Flask fallback are buffered up to this size (roster uploads)
+ASGI_MAX_BODY_SIZE = int(os.environ.get('ASGI_MAX_BODY_SIZE', str(32 * 1024 * 1024)))
+
+async_app = Quart(__name__)
+async_app.json = fast_json_provider(DefaultJSONProvider)(async_app)
+bind_tenant_quart(async_app)
+read_your_writes_quart(async_app)
+if COMPRESSION_ENABLED:
+    compress_quart(async_app)
+if INSTRUMENTATION_ENABLED:
+    instrument_quart(async_app)
+sync_fallback = AsyncioWSGIMiddleware(flask_app, max_body_size=ASGI_MAX_BODY_SIZE)
+
+@async_app.before_serving
+async def startup():
+    # app.py only initializes the schema in the main process; server workers
+    # spawned by hypercorn must do it here (migrations take an advisory lock)
+    if multiprocessing.parent_process() is not None:
+        await asyncio.to_thread(init_db)
+    # Each school's pool opens on its first request
+    if not MULTI_TENANT:
+        await open_async_pool()
+        # Measure replica lag before the first read-only query needs it
+        replicas = get_replica_set()
+        if replicas is not None:
+            await asyncio.to_thread(replicas.check_all_if_stale)
+        for cache in (revocations.instance(), roster_cache.instance(), shift_schedule.instance()):
+            await asyncio.to_thread(cache.refresh_if_stale)
+    async_app.revocation_task = asyncio.create_task(refresh_revocations())
+
+async def refresh_revocations():
+    # Keep the revocation list, roster versions and shift schedules fresh
+    # from a thread so request handlers never query them on the event loop
+    while True:
+        # Every school this worker has served so far
+        for cache in (*revocations.instances().values(), *roster_cache.instances().values(),
+                      *shift_schedule.instances().values()):
+            await asyncio.to_thread(cache.refresh_if_stale)
+        # Replica lag too: async reads pick replicas from the last check
+        for replicas in replica_sets().values():
+            await asyncio.to_thread(replicas.check_all_if_stale)
+        await asyncio.sleep(min(REVOCATION_REFRESH_SECONDS, ROSTER_CACHE_REFRESH_SECONDS,
+                                SHIFT_POLICY_REFRESH_SECONDS, DB_REPLICA_CHECK_SECONDS) / 2)
+
+async def current_shift_schedule():
+    """This school's CompiledSchedule as last loaded; only its first load runs here (in a thread)"""
+    schedule = shift_schedule.instance()
+    if schedule.loaded() is None:
+        await asyncio.to_thread(schedule.refresh_if_stale)
+    return schedule.loaded()
+
+async def verified_token(token):
+    """verify_token without querying on the loop; a school's revocation list first loads here (in a thread)"""
+    payload = verify_token(token, refresh=False)
+    if payload is not None and not revocations.instance(payload.get('tenant')).loaded():
+        await asyncio.to_thread(revocations.instance(payload.get('tenant')).refresh_if_stale)
+        payload = verify_token(token, refresh=False)
+    return payload
+
+async def cached_roster(grade, section):
+    """roster_cache.get without refreshing on the loop; the first refresh runs here (in a thread)"""
+    cache = roster_cache.instance()
+    if not cache.loaded():
+        await asyncio.to_thread(cache.refresh_if_stale)
+    return cache.get(grade, section, refresh=False)
+
+@async_app.after_serving
+async def shutdown():
+    async_app.revocation_task.cancel()
+    await close_async_pool()
+
+@async_app.after_request
+async def add_cors_headers(response):
+    # Same policy as Flask-CORS on the sync app; preflights go to Flask
+    if request.path.startswith('/api/'):
+        response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+def token_required(f):
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        token = bearer_token(request.headers)
+
+        if not token:
+            return jsonify({'error': 'Authentication token required'}), 401
+
+        payload = await verified_token(token)
+        if not payload or not bind_token_tenant(payload):
+            return jsonify({'error': 'Invalid or expired token'}), 401
+
+        request.current_user = payload
+        return await f(*args, **kwargs)
+    return decorated
+
+def role_required(allowed_roles):
+    def decorator(f):
+        @wraps(f)
+        async def decorated(*args, **kwargs):
+            if not hasattr(request, 'current_user'):
+                return jsonify({'error': 'Authentication required'}), 401
+
+            if request.current_user.get('role') not in allowed_roles:
+                return jsonify({'error': 'Insufficient permissions'}), 403
+
+            return await f(*args, **kwargs)
+        return decorated
+    return decorator
+
+async def fetchone(query, params=None, readonly=False):
+    async with get_async_connection(readonly) as conn:
+        cursor = await conn.execute(query, params)
+        return await cursor.fetchone()
+
+async def fetchall(query, params=None, readonly=False):
+    async with get_async_connection(readonly) as conn:
+        cursor = await conn.execute(query, params)
+        return await cursor.fetchall()
+
+async def get_teacher_grade(teacher_id):
+    """Async models.get_teacher_grade, sharing its per-process cache"""
+    found, teacher_grade = roster_cache.teacher_grade(teacher_id)
+    if not found:
+        teacher = await fetchone(TEACHER_GRADE_SQL, (teacher_id, 'teacher'))
+        teacher_grade = teacher['grade'] if teacher else None
+        roster_cache.put_teacher_grade(teacher_id, teacher_grade)
+    return teacher_grade
+
+# ======================
+# HEALTH
+# ======================
+
+def component_stats():
+    return {
+        'pool': async_pool_stats(),
+        'replicas': replica_stats(),
+        'badge_cache': badge_cache.stats(),
+        'auth_cache': auth_cache_stats(),
+        'ingest': ingest_stats(),
+        'roster_cache': roster_cache.stats(),
+        'shift_schedule': shift_schedule.stats(),
+        'cpu_pool': process_pool_stats(),
+        'login_limits': login_limiter_stats(),
+        'live_feed': live_feed_stats()
+    }
+
+@async_app.route('/api/health', methods=['GET'])
+async def health_check():
+    try:
+        for tenant in health_check_tenants():
+            with tenant_context(tenant):
+                await fetchone('SELECT 1')
+    except Exception as e:
+        return jsonify({'status': 'unhealthy', 'error': str(e), 'pool': async_pool_stats()}), 503
+
+    return jsonify({'status': 'healthy', **component_stats()}), 200
+
+@async_app.route('/metrics', methods=['GET'])
+async def metrics():
+    # Requests that fall through to the Flask app are counted in the same registry
+    return Response(render_metrics(component_stats()), mimetype='text/plain; version=0.0.4')
+
+# ======================
+# AUTHENTICATION
+# ======================
+
+@async_app.route('/api/login', methods=['POST'])
+async def login():
+    data = await request.get_json()
+
+    if not data or 'user_id' not in data or 'password' not in data or 'role' not in data:
+        return jsonify({'error': 'Missing required fields (user_id, password, role)'}), 400
+
+    retry_after = login_retry_after(client_ip(request), data['user_id'])
+    if retry_after:
+        return jsonify({'error': 'Too many login attempts. Try again later.'}), 429, \
+            {'Retry-After': str(math.ceil(retry_after))}
+
+    user = await fetchone(AUTH_USER_SQL, (data['user_id'], data['role']))
+    # The hash runs on the process pool; the thread only waits for it
+    try:
+        result = await asyncio.to_thread(check_credentials, user, data['password'])
+    except WorkerPoolBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
+
+    if isinstance(result, dict) and 'error' in result:
+        return jsonify(result), 403
+
+    if not result:
+        record_login_failure(data['user_id'])
+        return jsonify({'error': 'Invalid credentials or account not activated'}), 401
+
+    if result['rehash']:
+        async with get_async_connection() as conn:
+            await conn.execute(UPDATE_PASSWORD_HASH_SQL, (result['rehash'], user['id'], user['password']))
+
+    token = generate_token(result['id'], result['role'])
+
+    return jsonify({
+        'success': True,
+        'token': token,
+        'user': {
+            'id': result['id'],
+            'user_id': result['user_id'],
+            'name': result['name'],
+            'role': result['role'],
+            'grade': result['grade']
+        }
+    }), 200
+
+# ======================
+# EMPLOYEE MANAGEMENT
+# ======================
+
+@async_app.route('/api/employees', methods=['GET'])
+@token_required
+@role_required(['admin'])
+async def get_employees_route():
+    include_inactive = request.args.get('include_inactive', 'false').lower() == 'true'
+    employees = await fetchall(*employees_query(include_inactive), readonly=True)
+    return jsonify({'employees': list_payload(employees, request.args)}), 200
+
+# ======================
+# STUDENT MANAGEMENT
+# ======================
+
+@async_app.route('/api/students', methods=['GET'])
+@token_required
+async def get_students_route():
+    grade = request.args.get('grade')
+    section = request.args.get('section')
+
+    if not grade or not section:
+        return jsonify({'error': 'Grade and section are required'}), 400
+
+    if request.current_user['role'] == 'teacher':
+        if await get_teacher_grade(request.current_user['user_id']) != grade:
+            return jsonify({'students': list_payload([], request.args)}), 200
+
+    entry = await cached_roster(grade, section)
+    if entry is None:
+        generation = roster_cache.generation(grade, section)
+        entry = roster_cache.put(grade, section, await fetchall(ROSTER_SQL, (grade, section)), generation)
+
+    if request.if_none_match.contains_weak(entry['etag']):
+        response = Response(status=304)
+    else:
+        response = jsonify({'students': list_payload(entry['students'], request.args)})
+    response.set_etag(entry['etag'])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# ======================
+# ATTENDANCE
+# ======================
+
+@async_app.route('/api/attendance/employees', methods=['GET'])
+@token_required
+async def get_employee_attendance_route():
+    date = request.args.get('date')
+    grade = request.args.get('grade')
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+
+    for value in (date, date_from, date_to):
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+
+    user_id = request.current_user['user_id'] if request.current_user['role'] == 'teacher' else None
+    filters = {
+        'user_id': user_id,
+        'date': date,
+        'grade': grade,
+        'role': request.current_user['role'],
+        'date_from': date_from,
+        'date_to': date_to
+    }
+
+    # Streamed export from a server-side cursor, like the sync endpoint
+    if request.args.get('stream', 'false').lower() == 'true':
+        query, params = employee_attendance_query(**filters)
+
+        async def records():
+            async with get_async_connection(readonly=True) as conn:
+                async with conn.transaction():
+                    async with conn.cursor(name='employee_attendance_export') as db_cursor:
+                        db_cursor.itersize = 2000
+                        await db_cursor.execute(query + ATTENDANCE_ORDER_SQL, params)
+                        async for row in db_cursor:
+                            yield serialize_attendance(row)
+        body = stream_json_list_async('attendance', records(), wants_columns(request.args))
+        return Response(body, mimetype='application/json')
+
+    try:
+        limit = int(request.args.get('limit', ATTENDANCE_PAGE_SIZE))
+        query, params, limit = employee_attendance_page_query(request.args.get('cursor'), limit, **filters)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    records, next_cursor = employee_attendance_page(await fetchall(query, params, readonly=True), limit)
+    return jsonify({'attendance': list_payload(records, request.args), 'next_cursor': next_cursor}), 200
+
+@async_app.route('/api/attendance/employees/stats', methods=['GET'])
+@token_required
+async def get_employee_stats():
+    try:
+        date_from = request.args.get('from')
+        date_to = request.args.get('to')
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+
+    user_id = request.current_user['user_id'] if request.current_user['role'] == 'teacher' else None
+    query, params, date_from, date_to = attendance_stats_query(
+        user_id=user_id,
+        role=request.current_user['role'],
+        date_from=date_from,
+        date_to=date_to,
+        grade=request.args.get('grade')
+    )
+    stats = attendance_stats_from_rows(await fetchall(query, params, readonly=True))
+    return jsonify({'stats': stats, 'from': date_from.isoformat(), 'to': date_to.isoformat()}), 200
+
+@async_app.route('/api/live/attendance', methods=['GET'])
+@token_required
+async def live_attendance_feed():
+    user = request.current_user
+    grade = await get_teacher_grade(user['user_id']) if user['role'] == 'teacher' else None
+    try:
+        subscription = get_live_feed().subscribe(user['role'], user['user_id'], grade,
+                                                 request.headers.get('Last-Event-ID'))
+    except LiveFeedFull:
+        return jsonify({'error': 'Too many live connections, please retry'}), 503, {'Retry-After': '30'}
+
+    response = Response(sse_stream_async(subscription, stream_deadline(user)),
+                        mimetype='text/event-stream', headers=SSE_HEADERS)
+    # The stream ends on its own (stream_deadline); Quart's default would cut it at 60 s
+    response.timeout = None
+    return response
+
+@async_app.route('/api/attendance/scan', methods=['POST'])
+async def scan_qr_code():
+    data = await request.get_json()
+
+    if not data or 'qr_data' not in data:
+        return jsonify({'error': 'QR data required'}), 400
+
+    try:
+        parts = data['qr_data'].split(':')
+        if len(parts) != 3 or parts[0] != 'ATTENDANCE':
+            return jsonify({'error': 'Invalid QR format'}), 400
+
+        user_id = int(parts[1])
+        token = parts[2]
+
+        payload = await verified_token(token)
+        # The badge's school is the scan's (a kiosk may also name it)
+        if not payload or payload['user_id'] != user_id or not bind_token_tenant(payload):
+            return jsonify({'error': 'Invalid QR token'}), 401
+
+        if ingest_enabled():
+            # fsync blocks; keep it off the event loop
+            await asyncio.to_thread(enqueue_scan, user_id)
+            return jsonify({'success': True, 'queued': True, 'message': 'Attendance queued'}), 202
+
+        grade = await get_teacher_grade(user_id)
+        # refresh_revocations keeps the schedule fresh; never reload it on the loop
+        schedule = await current_shift_schedule()
+        attendance_record = await fetchone(*employee_scan_query(user_id, action='auto', grade=grade, schedule=schedule))
+
+        return jsonify({
+            'success': True,
+            'message': 'Attendance recorded successfully',
+            'attendance': attendance_record
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'QR processing failed: {str(e)}'}), 400
+
+@async_app.route('/api/attendance/students', methods=['POST'])
+@token_required
+@role_required(['teacher'])
+async def record_student_attendance_route():
+    data = await request.get_json()
+
+    if not data or 'attendance' not in data or not isinstance(data['attendance'], list):
+        return jsonify({'error': 'Attendance data required as array'}), 400
+
+    params, rejected = student_roll_call_params(data['attendance'], request.current_user['user_id'])
+
+    if ingest_enabled():
+        await asyncio.to_thread(enqueue_roll_call, params)
+        return jsonify({
+            'success': True,
+            'queued': True,
+            'message': f'Attendance queued for {len(params["ids"])} students',
+            'count': len(params['ids']),
+            'rejected': rejected
+        }), 202
+
+    result = await fetchone(STUDENT_ROLL_CALL_SQL, params)
+
+    return jsonify({
+        'success': True,
+        'message': f'Attendance recorded for {result["count"]} students',
+        'count': result['count'],
+        'rejected': rejected + result['rejected']
+    }), 200
+
+# ======================
+# QR CODES (IN-MEMORY)
+# ======================
+
+@async_app.route('/api/qr/generate/<int:user_id>', methods=['GET'])
+@token_required
+async def generate_qr_route(user_id):
+    if request.current_user['role'] == 'teacher' and request.current_user['user_id'] != user_id:
+        return jsonify({'error': 'You can only generate your own QR code'}), 403
+
+    fmt = request.args.get('format', 'png').lower()
+    if fmt not in BADGE_FORMATS:
+        return jsonify({'error': f'Format must be one of: {", ".join(BADGE_FORMATS)}'}), 400
+
+    user = await fetchone('SELECT id, user_id, name, is_active, activated_at FROM users WHERE id = %s', (user_id,))
+
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    if not user['is_active']:
+        return jsonify({'error': 'Cannot generate QR for inactive account'}), 403
+
+    # Rendering a cache miss is CPU-bound; keep it off the event loop
+    qr_token, issued_at, badge = await asyncio.to_thread(get_badge, user, make_qr_token, fmt)
+
+    return jsonify({
+        'success': True,
+        'qr_code': badge_data_url(badge, fmt),
+        'expires_at': (datetime.fromtimestamp(issued_at) + timedelta(hours=TOKEN_LIFETIME_HOURS)).isoformat()
+    }), 200
+
+@async_app.errorhandler(500)
+async def internal_error(e):
+    return jsonify({'error': 'Internal server error'}), 500
+
+# ======================
+# DISPATCH
+# ======================
+
+def _has_async_route(scope):
+    if scope['method'] == 'OPTIONS':
+        return False
+    try:
+        async_app.url_map.bind('').match(scope['path'], method=scope['method'])
+    except (NotFound, MethodNotAllowed):
+        return False
+    except Exception:
+        # Redirects and the like are Quart's to answer
+        pass
+    return True
+
+async def app(scope, receive, send):
+    """ASGI entry point: async handlers where they exist, the Flask app otherwise"""
+    if scope['type'] == 'http' and not _has_async_route(scope):
+        await sync_fallback(scope, receive, send)
+    else:
+        await async_app(scope, receive, send)
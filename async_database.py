@@ -0,0 +1,165 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from psycopg import AsyncCursor
+from psycopg.rows import dict_row
+from psycopg import OperationalError
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from database import (
+    DATABASE_URL,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_POOL_MAX_LIFETIME,
+    DB_POOL_MAX_IDLE,
+    TENANT_DB_POOL_MAX_SIZE,
+    DB_REPLICA_CONNECT_TIMEOUT,
+    get_replica_set,
+    reads_from_primary
+)
+from instrumentation import INSTRUMENTATION_ENABLED, record_query, record_checkout
+from tenants import MULTI_TENANT, current_tenant_key, get_tenant, search_path_options
+
+class InstrumentedAsyncCursor(AsyncCursor):
+    """AsyncCursor that records each statement's timing and row count"""
+
+    async def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+_connection_kwargs = {'row_factory': dict_row, 'autocommit': True}
+if INSTRUMENTATION_ENABLED:
+    _connection_kwargs['cursor_factory'] = InstrumentedAsyncCursor
+
+# Async pools per ASGI worker process by tenant key (None for a single school),
+# sized by the same DB_POOL_* settings
+_pools = {}
+# Replica pools by (tenant key, replica index); their lag is tracked by database.ReplicaSet
+_replica_pools = {}
+_open_lock = asyncio.Lock()
+
+async def open_async_pool(tenant=None):
+    """Create and fill this worker's async pool for tenant (default: the current school).
+
+    The single-school pool is opened from the server startup hook; each
+    school's opens on its first request.
+    """
+    config = get_tenant(tenant)
+    key = config.key if config else None
+    dsn = config.database_url if config else DATABASE_URL
+    if not dsn:
+        raise Exception("DATABASE_URL environment variable not set!")
+    async with _open_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            kwargs = dict(_connection_kwargs)
+            if config:
+                kwargs['options'] = search_path_options(config.schema)
+            pool = AsyncConnectionPool(
+                dsn,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=TENANT_DB_POOL_MAX_SIZE if config else DB_POOL_MAX_SIZE,
+                timeout=DB_POOL_TIMEOUT,
+                max_lifetime=DB_POOL_MAX_LIFETIME,
+                max_idle=DB_POOL_MAX_IDLE,
+                # Async handlers run one statement each, so skip the COMMIT round-trip;
+                # multi-statement work opens conn.transaction() explicitly
+                kwargs=kwargs,
+                # Ping on checkout, like the sync pool, so a dropped socket never reaches a handler
+                check=AsyncConnectionPool.check_connection,
+                open=False
+            )
+            await pool.open(wait=True)
+            _pools[key] = pool
+    return pool
+
+async def _open_replica_pool(key, index, replicas):
+    config = get_tenant(key)
+    async with _open_lock:
+        pool = _replica_pools.get((key, index))
+        if pool is None:
+            kwargs = dict(_connection_kwargs, connect_timeout=DB_REPLICA_CONNECT_TIMEOUT)
+            if config:
+                kwargs['options'] = search_path_options(config.schema)
+            pool = AsyncConnectionPool(
+                replicas.pools[index].dsn,
+                min_size=0,
+                max_size=TENANT_DB_POOL_MAX_SIZE if config else DB_POOL_MAX_SIZE,
+                timeout=DB_REPLICA_CONNECT_TIMEOUT,
+                max_lifetime=DB_POOL_MAX_LIFETIME,
+                max_idle=DB_POOL_MAX_IDLE,
+                kwargs=kwargs,
+                check=AsyncConnectionPool.check_connection,
+                open=False
+            )
+            await pool.open()
+            _replica_pools[(key, index)] = pool
+    return pool
+
+async def close_async_pool():
+    global _pools, _replica_pools
+    pools, _pools = _pools, {}
+    replica_pools, _replica_pools = _replica_pools, {}
+    for pool in (*pools.values(), *replica_pools.values()):
+        await pool.close()
+
+def async_pool_stats():
+    """Async pool statistics for this worker process ({tenant: stats} for several schools)"""
+    if MULTI_TENANT:
+        return {key: pool.get_stats() for key, pool in list(_pools.items())}
+    pool = _pools.get(None)
+    return pool.get_stats() if pool is not None else None
+
+async def _replica_connection(replicas):
+    """(pool, connection, index) of a fresh replica, or None to use the primary"""
+    # Lag checks run on the background refresh task, never on the event loop
+    index = replicas.choose(check=False)
+    if index is not None:
+        key = current_tenant_key()
+        pool = _replica_pools.get((key, index)) or await _open_replica_pool(key, index, replicas)
+        try:
+            conn = await pool.getconn()
+        except (OperationalError, PoolTimeout):
+            replicas.mark_down(index)
+        else:
+            replicas.record('replica_reads')
+            return pool, conn, index
+    replicas.record('primary_fallbacks')
+    return None
+
+@asynccontextmanager
+async def get_async_connection(readonly=False):
+    """Borrow an autocommit async connection to the current school for an async with-block.
+
+    With readonly it may be a read replica's, as with database.get_db_connection.
+    """
+    started = time.perf_counter()
+    replicas = get_replica_set() if readonly and not reads_from_primary() else None
+    checkout = await _replica_connection(replicas) if replicas is not None else None
+    if checkout is not None:
+        pool, conn, index = checkout
+        if INSTRUMENTATION_ENABLED:
+            record_checkout(time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            # As in database.get_db_connection: a lost connection takes the replica out
+            if conn.broken:
+                replicas.mark_down(index)
+            await pool.putconn(conn)
+        return
+    pool = _pools.get(current_tenant_key()) or await open_async_pool()
+    async with pool.connection() as conn:
+        if INSTRUMENTATION_ENABLED:
+            record_checkout(time.perf_counter() - started)
+        yield conn
@@ -1,44 +1,336 @@
 import jwt
+import json
 import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from flask import request, jsonify
-from werkzeug.security import check_password_hash
-from database import get_db_connection
+from database import SQLITE, get_db_connection
+from passwords import verify_password
+from instrumentation import span
+from tenants import MULTI_TENANT, TenantLocal, current_tenant_key, is_known_tenant, set_current_tenant
 import os
 
 SECRET_KEY = os.environ.get('SECRET_KEY', 'change-this-in-production-with-environment-variable')
+TOKEN_LIFETIME_HOURS = 8
+
+# Verified payloads are reused for up to AUTH_CACHE_TTL seconds (never past exp)
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', '10000'))
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', '300'))
+# How stale this process's copy of the revocation list may get
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('REVOCATION_REFRESH_SECONDS', '5'))
+
+# Login throttling (token buckets, per worker process). Schools log in from
+# shared NAT addresses, so the per-IP bucket is generous; the per-account one
+# only spends tokens on failed attempts.
+LOGIN_IP_PER_MINUTE = float(os.environ.get('LOGIN_IP_PER_MINUTE', '60'))
+LOGIN_IP_BURST = float(os.environ.get('LOGIN_IP_BURST', '120'))
+LOGIN_USER_FAILURES_PER_MINUTE = float(os.environ.get('LOGIN_USER_FAILURES_PER_MINUTE', '1'))
+LOGIN_USER_FAILURE_BURST = float(os.environ.get('LOGIN_USER_FAILURE_BURST', '5'))
+LOGIN_LIMITER_MAX_KEYS = int(os.environ.get('LOGIN_LIMITER_MAX_KEYS', '100000'))
+# Reverse proxies in front of the app that append to X-Forwarded-For
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', '0'))
 
 def generate_token(user_id, role):
     payload = {
         'user_id': user_id,
         'role': role,
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=8),
-        'iat': datetime.datetime.utcnow()
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=TOKEN_LIFETIME_HOURS),
+        'iat': datetime.datetime.utcnow(),
+        # iat is whole seconds; revocation checks need to tell apart tokens
+        # issued just before a deactivation from those just after a reactivation
+        'issued_at': time.time()
     }
+    # user_id is only unique within a school
+    if MULTI_TENANT:
+        payload['tenant'] = current_tenant_key()
     return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
 
-def verify_token(token):
-    try:
-        return jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
+class TokenCache:
+    """Thread-safe LRU of verified token payloads, keyed by token hash"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return entry[1]
+
+    def put(self, key, payload):
+        expires_at = min(time.time() + self.ttl, payload.get('exp', 0))
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, **self._counters}
+
+REVOCATIONS_SQL = '''
+    SELECT version,
+           CASE WHEN version IS DISTINCT FROM %(known)s THEN (
+               SELECT COALESCE(json_object_agg(user_id, EXTRACT(EPOCH FROM revoked_at)), '{}')
+               FROM token_revocations
+               WHERE revoked_at > now() - make_interval(hours => %(lifetime)s)
+           ) END AS revoked
+    FROM auth_revision
+'''
+# revoked_at is already seconds since the epoch in SQLite; the object comes back as text
+if SQLITE:
+    REVOCATIONS_SQL = '''
+        SELECT version,
+               CASE WHEN version IS NOT %(known)s THEN (
+                   SELECT json_group_object(user_id, revoked_at)
+                   FROM token_revocations
+                   WHERE revoked_at > (julianday('now') - 2440587.5) * 86400.0 - %(lifetime)s * 3600
+               ) END AS revoked
+        FROM auth_revision
+    '''
+
+class RevocationList:
+    """In-process copy of token_revocations, reloaded only when auth_revision changes.
+
+    The version is polled at most every ``refresh_after`` seconds, so a
+    deactivation reaches every worker within that delay without a query
+    per request. If the database can't be reached the last copy is kept.
+    One list is kept per school (``tenant``).
+    """
+
+    def __init__(self, refresh_after, tenant=None):
+        self.refresh_after = refresh_after
+        self.tenant = tenant
+        self.version = None
+        self._revoked = {}
+        self._checked_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._counters = {'refreshes': 0, 'reloads': 0, 'refresh_errors': 0, 'rejected': 0}
+
+    def refresh(self):
+        with get_db_connection(self.tenant) as conn:
+            cursor = conn.cursor()
+            cursor.execute(REVOCATIONS_SQL, {'known': self.version, 'lifetime': TOKEN_LIFETIME_HOURS})
+            row = cursor.fetchone()
+        self._counters['refreshes'] += 1
+        if row and row['revoked'] is not None:
+            revoked = json.loads(row['revoked']) if isinstance(row['revoked'], str) else row['revoked']
+            # Swap in a new dict; readers never see a half-built set
+            self._revoked = {int(user_id): revoked_at for user_id, revoked_at in revoked.items()}
+            self.version = row['version']
+            self._counters['reloads'] += 1
+        self._checked_at = time.monotonic()
+
+    def refresh_if_stale(self):
+        if time.monotonic() - self._checked_at < self.refresh_after:
+            return
+        # One thread refreshes; the others carry on with the current copy
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            self._counters['refresh_errors'] += 1
+            self._checked_at = time.monotonic()
+            print(f"⚠️  Token revocation refresh failed: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def loaded(self):
+        """Whether the list has been read from the database at least once"""
+        return self.version is not None
+
+    def is_revoked(self, payload, refresh=True):
+        if refresh:
+            self.refresh_if_stale()
+        revoked_at = self._revoked.get(payload.get('user_id'))
+        if revoked_at is not None and payload.get('issued_at', payload.get('iat', 0)) <= revoked_at:
+            self._counters['rejected'] += 1
+            return True
+        return False
+
+    def stats(self):
+        return {'version': self.version, 'revoked_users': len(self._revoked), **self._counters}
+
+class RateLimiter:
+    """Thread-safe token buckets keyed by string, refilled continuously.
+
+    A key's bucket starts full (burst tokens) and regains per_minute tokens
+    a minute. Least recently used keys are dropped past max_keys; a dropped
+    bucket simply starts full again.
+    """
+
+    def __init__(self, per_minute, burst, max_keys=100000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'limited': 0}
+
+    def _tokens(self, key, now):
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def _store(self, key, tokens, now):
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def retry_after(self, key):
+        """Seconds until key has a whole token (0 if it has one now)"""
+        with self._lock:
+            tokens = self._tokens(key, time.monotonic())
+            if tokens >= 1:
+                return 0.0
+            self._counters['limited'] += 1
+            return (1 - tokens) / self.rate if self.rate else float('inf')
+
+    def acquire(self, key):
+        """Take a token; returns 0 on success, else seconds to wait (nothing taken)"""
+        with self._lock:
+            now = time.monotonic()
+            tokens = self._tokens(key, now)
+            if tokens < 1:
+                self._counters['limited'] += 1
+                return (1 - tokens) / self.rate if self.rate else float('inf')
+            self._store(key, tokens - 1, now)
+            return 0.0
+
+    def spend(self, key):
+        """Take a token unconditionally (floors at zero)"""
+        with self._lock:
+            now = time.monotonic()
+            self._store(key, max(0.0, self._tokens(key, now) - 1), now)
+
+    def stats(self):
+        with self._lock:
+            return {'keys': len(self._buckets), **self._counters}
+
+token_cache = TokenCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL)
+revocations = TenantLocal(lambda tenant: RevocationList(REVOCATION_REFRESH_SECONDS, tenant))
+login_ip_limiter = RateLimiter(LOGIN_IP_PER_MINUTE, LOGIN_IP_BURST, LOGIN_LIMITER_MAX_KEYS)
+login_user_limiter = RateLimiter(LOGIN_USER_FAILURES_PER_MINUTE, LOGIN_USER_FAILURE_BURST, LOGIN_LIMITER_MAX_KEYS)
+
+def verify_token(token, refresh=True):
+    """Decoded payload for a valid, unrevoked token, else None.
+
+    With refresh=False the revocation list is used as last loaded (the
+    event loop must not query it).
+    """
+    with span('auth'):
+        key = hashlib.sha256(token.encode()).digest()
+        payload = token_cache.get(key)
+        if payload is None:
+            try:
+                payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+            except jwt.InvalidTokenError:
+                return None
+            token_cache.put(key, payload)
+        
+        if not is_known_tenant(payload.get('tenant')):
+            return None
+        # Checked on every call, so a cached payload can't outlive a revocation
+        if revocations.instance(payload.get('tenant')).is_revoked(payload, refresh):
+            return None
+        return dict(payload)
+
+def verify_scan_token(token, scanned_at):
+    """Payload if token was valid at epoch time scanned_at (offline kiosk scans)"""
+    payload = verify_token(token)
+    if payload is None:
+        # Expired by now is fine as long as it was live when the badge was scanned
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'], options={'verify_exp': False})
+        except jwt.InvalidTokenError:
+            return None
+        if not is_known_tenant(payload.get('tenant')) or revocations.instance(payload.get('tenant')).is_revoked(payload):
+            return None
+    if not payload.get('iat', 0) <= scanned_at <= payload.get('exp', 0):
         return None
+    return payload
+
+def is_token_revoked(token):
+    """Whether a token this process issued (e.g. a cached badge's) has since been revoked"""
+    payload = jwt.decode(token, options={'verify_signature': False})
+    return revocations.instance(payload.get('tenant')).is_revoked(payload)
+
+def bind_token_tenant(payload):
+    """Make a verified token's school the request's; False if the request named another school"""
+    if not MULTI_TENANT:
+        return True
+    current = current_tenant_key()
+    if current is None:
+        set_current_tenant(payload['tenant'])
+        return True
+    return current == payload['tenant']
+
+def auth_cache_stats():
+    return {'tokens': token_cache.stats(), 'revocations': revocations.stats()}
+
+def login_limiter_stats():
+    return {'ip': login_ip_limiter.stats(), 'user': login_user_limiter.stats()}
+
+def client_ip(req):
+    """Caller address for a Flask or Quart request, looking past TRUSTED_PROXY_COUNT proxies"""
+    if TRUSTED_PROXY_COUNT:
+        forwarded = [p.strip() for p in req.headers.get('X-Forwarded-For', '').split(',') if p.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_COUNT:
+            return forwarded[-TRUSTED_PROXY_COUNT]
+    return req.remote_addr or ''
+
+def _account_key(user_id):
+    tenant = current_tenant_key()
+    return f'{tenant}/{user_id}' if tenant else str(user_id)
+
+def login_retry_after(ip, user_id):
+    """Seconds the caller must wait before this login attempt may run (0 = go ahead).
+
+    Every attempt costs an IP token; the account's bucket (per school) is
+    only checked here and drained by record_login_failure.
+    """
+    return max(login_user_limiter.retry_after(_account_key(user_id)), login_ip_limiter.acquire(ip))
+
+def record_login_failure(user_id):
+    login_user_limiter.spend(_account_key(user_id))
+
+def bearer_token(headers):
+    auth_header = headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        return auth_header.split(' ')[1]
+    return None
 
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
+        token = bearer_token(request.headers)
         
         if not token:
             return jsonify({'error': 'Authentication token required'}), 401
         
         payload = verify_token(token)
-        if not payload:
+        if not payload or not bind_token_tenant(payload):
             return jsonify({'error': 'Invalid or expired token'}), 401
         
         request.current_user = payload
@@ -60,29 +352,52 @@ def role_required(allowed_roles):
         return decorated
     return decorator
 
-def authenticate_user(user_id, password, role):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, user_id, password, role, name, grade, is_active 
-        FROM users 
-        WHERE user_id = %s AND role = %s
-    ''', (user_id, role))
-    
-    user = cursor.fetchone()
-    conn.close()
-    
+AUTH_USER_SQL = '''
+    SELECT id, user_id, password, role, name, grade, is_active 
+    FROM users 
+    WHERE user_id = %s AND role = %s
+'''
+
+UPDATE_PASSWORD_HASH_SQL = 'UPDATE users SET password = %s WHERE id = %s AND password = %s'
+
+def check_credentials(user, password):
+    """Login result for the AUTH_USER_SQL row: user info, {'error': ...} or None.
+
+    Verification runs on the bounded process pool (workers.WorkerPoolBusy
+    when it is saturated). A successful result carries 'rehash', the
+    upgraded hash to store when the old one used outdated parameters.
+    """
     if user and not user['is_active']:
         return {'error': 'Account not activated. Contact administrator.'}
     
-    if user and check_password_hash(user['password'], password):
+    if not user:
+        return None
+    
+    with span('auth'):
+        valid, rehash = verify_password(user['password'], password)
+    if valid:
         return {
             'id': user['id'],
             'user_id': user['user_id'],
             'role': user['role'],
             'name': user['name'],
-            'grade': user['grade']
+            'grade': user['grade'],
+            'rehash': rehash
         }
     
-    return None
\ No newline at end of file
+    return None
+
+def authenticate_user(user_id, password, role):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(AUTH_USER_SQL, (user_id, role))
+        user = cursor.fetchone()
+    
+    # No connection is held while the hash is checked
+    result = check_credentials(user, password)
+    if result and result.get('rehash'):
+        with get_db_connection() as conn:
+            # Only if nobody changed the password in the meantime
+            conn.cursor().execute(UPDATE_PASSWORD_HASH_SQL, (result['rehash'], user['id'], user['password']))
+            conn.commit()
+    return result
@@ -0,0 +1,198 @@
+import io
+import os
+import time
+import zipfile
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+import qrcode
+from PIL import Image, ImageDraw
+from workers import pool_map
+from tenants import current_tenant_key
+from auth import is_token_revoked
+
+BADGE_COLOR = "#4338ca"
+BADGE_FORMATS = ('png', 'webp', 'svg')
+BADGE_MIME_TYPES = {'png': 'image/png', 'webp': 'image/webp', 'svg': 'image/svg+xml'}
+
+# A cached badge is reused for one validity window; keep it at most half the
+# QR token lifetime so a cached token always has hours of validity left.
+BADGE_WINDOW_SECONDS = int(os.environ.get('BADGE_WINDOW_SECONDS', str(4 * 3600)))
+BADGE_CACHE_MAX_BYTES = int(os.environ.get('BADGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+def _qr_matrix(user_id, token):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(f"ATTENDANCE:{user_id}:{token}")
+    qr.make(fit=True)
+    return qr
+
+def _render_raster(user_id, name, token):
+    img = _qr_matrix(user_id, token).make_image(fill_color=BADGE_COLOR, back_color="white").convert('RGB')
+    width, height = img.size
+    draw = ImageDraw.Draw(img)
+
+    # Add header bar
+    draw.rectangle([(0, 0), (width, 60)], fill=BADGE_COLOR)
+    draw.text((width//2, 20), "SCHOOL ATTENDANCE", fill="white", anchor="mt", font_size=20)
+
+    # Add footer with name
+    draw.rectangle([(0, height-60), (width, height)], fill=BADGE_COLOR)
+    draw.text((width//2, height-30), name, fill="white", anchor="mt", font_size=18)
+    return img
+
+def _render_svg(user_id, name, token):
+    qr = _qr_matrix(user_id, token)
+    matrix = qr.get_matrix()
+    box = qr.box_size
+    size = len(matrix) * box
+    # One path for all dark modules keeps the document small
+    modules = ''.join(
+        f'M{x * box},{y * box}h{box}v{box}h-{box}z'
+        for y, row in enumerate(matrix) for x, dark in enumerate(row) if dark
+    )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" viewBox="0 0 {size} {size}">'
+        f'<rect width="{size}" height="{size}" fill="white"/>'
+        f'<path d="{modules}" fill="{BADGE_COLOR}"/>'
+        f'<rect width="{size}" height="60" fill="{BADGE_COLOR}"/>'
+        f'<text x="{size // 2}" y="20" fill="white" font-size="20" text-anchor="middle" '
+        f'dominant-baseline="hanging" font-family="sans-serif">SCHOOL ATTENDANCE</text>'
+        f'<rect y="{size - 60}" width="{size}" height="60" fill="{BADGE_COLOR}"/>'
+        f'<text x="{size // 2}" y="{size - 30}" fill="white" font-size="18" text-anchor="middle" '
+        f'dominant-baseline="hanging" font-family="sans-serif">{escape(name)}</text>'
+        '</svg>'
+    ).encode('utf-8')
+
+def render_badge(user_id, name, token, fmt='png'):
+    """Render one attendance badge as PNG, WebP or SVG bytes (in memory only)"""
+    if fmt == 'svg':
+        return _render_svg(user_id, name, token)
+
+    buffer = io.BytesIO()
+    if fmt == 'webp':
+        _render_raster(user_id, name, token).save(buffer, format="WEBP", lossless=True)
+    else:
+        _render_raster(user_id, name, token).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def _render_badge_args(args):
+    return render_badge(*args)
+
+class BadgeCache:
+    """Thread-safe LRU cache of rendered badges, bounded by total bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return entry
+
+    def put(self, key, entry):
+        """Store entry = (token, issued_at, data) and evict least recently used"""
+        size = len(entry[0]) + len(entry[2])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0]) + len(old[2])
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted[0]) + len(evicted[2])
+                self._counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes, **self._counters}
+
+badge_cache = BadgeCache(BADGE_CACHE_MAX_BYTES)
+
+def _cache_key(user, fmt, now):
+    # Name is part of the key so a renamed teacher never gets a stale badge,
+    # activated_at so a reactivated one never gets a token revoked on
+    # deactivation; ids are only unique within a school
+    return (current_tenant_key(), user['id'], user['user_id'], user['name'], user['activated_at'],
+            fmt, int(now // BADGE_WINDOW_SECONDS))
+
+def _cached_badge(key):
+    entry = badge_cache.get(key)
+    # Belt and braces: never hand out a badge whose token no longer scans
+    if entry is not None and is_token_revoked(entry[0]):
+        return None
+    return entry
+
+def get_badge(user, make_token, fmt='png'):
+    """Cached badge for user in the current validity window: (token, issued_at, data)"""
+    now = time.time()
+    key = _cache_key(user, fmt, now)
+    entry = _cached_badge(key)
+    if entry is None:
+        token = make_token(user['id'])
+        entry = (token, now, render_badge(user['id'], user['name'], token, fmt))
+        badge_cache.put(key, entry)
+    return entry
+
+def get_badges(users, make_token, fmt='png'):
+    """Badges for many users; cache misses are rendered in parallel on a process pool"""
+    now = time.time()
+    entries = {}
+    misses = []
+    for user in users:
+        key = _cache_key(user, fmt, now)
+        entry = _cached_badge(key)
+        if entry is not None:
+            entries[user['id']] = entry
+        else:
+            misses.append((user, key, make_token(user['id'])))
+
+    jobs = [(user['id'], user['name'], token, fmt) for user, _, token in misses]
+    rendered = pool_map(_render_badge_args, jobs)
+
+    for (user, key, token), data in zip(misses, rendered):
+        entry = (token, now, data)
+        badge_cache.put(key, entry)
+        entries[user['id']] = entry
+
+    return [(user, entries[user['id']][2]) for user in users]
+
+def _badge_filename(user, fmt):
+    safe_name = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in user['name'])
+    return f"{user['user_id']}_{safe_name}.{fmt}"
+
+def package_zip(badges, fmt):
+    buffer = io.BytesIO()
+    # Images are already compressed; storing avoids burning CPU on deflate
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for user, data in badges:
+            archive.writestr(_badge_filename(user, fmt), data)
+    return buffer.getvalue()
+
+def package_pdf(badges):
+    """Multi-page PDF, one badge per page (badges must be raster: PNG or WebP)"""
+    pages = [Image.open(io.BytesIO(data)).convert('RGB') for _, data in badges]
+    buffer = io.BytesIO()
+    pages[0].save(buffer, format='PDF', save_all=True, append_images=pages[1:], resolution=150)
+    return buffer.getvalue()
@@ -0,0 +1,537 @@
+"""Benchmark and load-test suite for the attendance API.
+
+Seed a synthetic school into a local PostgreSQL stand-in (DATABASE_URL),
+or a SQLite file (DATABASE_URL=sqlite:///bench.db) when no database
+server is at hand, then drive the real HTTP endpoints and time the
+CPU-heavy helpers:
+
+    python benchmark.py seed --teachers 80 --students 3000 --years 2 --reset
+    python benchmark.py run --concurrency 32 --requests 500
+    python benchmark.py run --url http://127.0.0.1:8000 --compare benchmark-old.json
+
+Without --url, `run` serves app.py in-process on a threaded WSGI server.
+QR scan tokens are signed locally, so an external server must share
+SECRET_KEY, and its per-IP login limit (LOGIN_IP_PER_MINUTE) must
+allow the login scenario's rate. Results (p50/p95/p99 latency and throughput per endpoint,
+micro-benchmarks in microseconds) are written as JSON; --compare prints
+the change against an earlier run and --max-regression fails the run
+when any p95 or micro median got worse by more than that percentage.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import timeit
+import argparse
+import platform
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlite_backend import SQLiteConnection
+
+BENCH_PREFIX = 'BENCH-'
+BENCH_PASSWORD = 'bench'
+ENDPOINTS = ['login', 'scan', 'roll_call', 'roster', 'history', 'stats', 'term_attendance']
+MICRO_BENCHMARKS = ['generate_qr_code_png', 'generate_qr_code_svg', 'calculate_status', 'derive_statuses',
+                    'hash_password', 'check_password']
+
+# ======================
+# SEEDING
+# ======================
+
+def seed(conn, teachers=80, students=3000, years=1, grades=12, sections=('A', 'B'),
+         student_history=False, reset=False, random_seed=42):
+    """Create BENCH- teachers, students and attendance history; returns row counts"""
+    from passwords import hash_password
+    from bitmaps import rebuild_student_bitmaps
+    cursor = conn.cursor()
+    if reset:
+        # Students are owned by the admin, so they don't cascade with the bench teachers
+        cursor.execute('DELETE FROM students WHERE student_id LIKE %s', (BENCH_PREFIX + '%',))
+        cursor.execute('DELETE FROM users WHERE user_id LIKE %s', (BENCH_PREFIX + '%',))
+
+    cursor.execute("SELECT id FROM users WHERE role = 'admin' ORDER BY id LIMIT 1")
+    admin = cursor.fetchone()
+    if not admin:
+        raise SystemExit('No admin account: start the app once (init_db) before seeding')
+
+    today = date.today()
+    start = today - timedelta(days=365 * years)
+    if isinstance(conn, SQLiteConnection):
+        _seed_sqlite(cursor, admin['id'], start, today, teachers, students, grades, sections,
+                     student_history, random_seed)
+        if student_history:
+            rebuild_student_bitmaps(conn)
+        conn.commit()
+        return bench_counts(conn)
+
+    cursor.execute('SELECT setseed(%s)', (random_seed / 1000.0,))
+    cursor.execute('''
+        INSERT INTO users (user_id, password, role, name, grade, email, phone, is_active, activated_at)
+        SELECT %(prefix)s || 'T' || lpad(n::text, 5, '0'), %(password)s, 'teacher',
+               'Bench Teacher ' || n, ((n - 1) %% %(grades)s + 1)::text,
+               'teacher' || n || '@bench.test', '+1 555 000 ' || lpad(n::text, 4, '0'),
+               TRUE, %(start)s::timestamp
+        FROM generate_series(1, %(teachers)s) AS n
+        ON CONFLICT (user_id) DO NOTHING
+    ''', {'prefix': BENCH_PREFIX, 'password': hash_password(BENCH_PASSWORD), 'grades': grades,
+          'start': start, 'teachers': teachers})
+    cursor.execute('''
+        INSERT INTO students (student_id, name, grade, section, parent_name, parent_contact, created_by)
+        SELECT %(prefix)s || 'S' || lpad(n::text, 6, '0'), 'Bench Student ' || n,
+               ((n - 1) %% %(grades)s + 1)::text,
+               (%(sections)s::text[])[((n - 1) / %(grades)s) %% %(section_count)s + 1],
+               'Parent ' || n, '+1 555 100 ' || lpad(n::text, 4, '0'), %(admin)s
+        FROM generate_series(1, %(students)s) AS n
+        ON CONFLICT (student_id) DO NOTHING
+    ''', {'prefix': BENCH_PREFIX, 'grades': grades, 'sections': list(sections),
+          'section_count': len(sections), 'students': students, 'admin': admin['id']})
+
+    # Weekday history up to yesterday; today is left for the scan benchmark
+    cursor.execute('''
+        INSERT INTO employee_attendance (user_id, date, check_in, check_out, status, remarks, recorded_by)
+        SELECT user_id, day,
+               CASE WHEN status IN ('Absent', 'Leave') THEN NULL
+                    WHEN status = 'Late' THEN time '09:06' + r * interval '40 minutes'
+                    ELSE time '08:20' + r * interval '40 minutes' END,
+               CASE WHEN status IN ('Absent', 'Leave') THEN NULL
+                    WHEN status = 'Early' THEN time '15:00' + r * interval '90 minutes'
+                    ELSE time '17:00' + r * interval '60 minutes' END,
+               status, 'Seeded by benchmark.py', user_id
+        FROM (
+            SELECT user_id, day, r,
+                   CASE WHEN r < 0.02 THEN 'Absent' WHEN r < 0.06 THEN 'Leave'
+                        WHEN r < 0.16 THEN 'Late' WHEN r < 0.20 THEN 'Early' ELSE 'Present' END AS status
+            FROM (
+                SELECT u.id AS user_id, d::date AS day, random() AS r
+                FROM users u
+                CROSS JOIN generate_series(%(start)s::date, %(end)s::date, interval '1 day') AS d
+                WHERE u.user_id LIKE %(pattern)s AND EXTRACT(ISODOW FROM d) < 6
+            ) days
+        ) rows
+        ON CONFLICT (user_id, date) DO NOTHING
+    ''', {'start': start, 'end': today - timedelta(days=1), 'pattern': BENCH_PREFIX + 'T%'})
+
+    if student_history:
+        cursor.execute('''
+            INSERT INTO student_attendance (student_id, date, is_present, recorded_by)
+            SELECT s.id, d::date, random() > 0.07, t.id
+            FROM students s
+            JOIN LATERAL (
+                SELECT id FROM users
+                WHERE user_id LIKE %(teachers)s AND grade = s.grade
+                ORDER BY id LIMIT 1
+            ) t ON TRUE
+            CROSS JOIN generate_series(%(start)s::date, %(end)s::date, interval '1 day') AS d
+            WHERE s.student_id LIKE %(students)s AND EXTRACT(ISODOW FROM d) < 6
+            ON CONFLICT (student_id, date) DO NOTHING
+        ''', {'start': start, 'end': today - timedelta(days=1),
+              'teachers': BENCH_PREFIX + 'T%', 'students': BENCH_PREFIX + 'S%'})
+        # Seeded rows bypass the roll-call upsert that maintains the bitmaps
+        rebuild_student_bitmaps(conn)
+
+    conn.commit()
+    return bench_counts(conn)
+
+def _clock(hour, minute, extra_minutes):
+    return (datetime(2000, 1, 1, hour, minute) + timedelta(minutes=extra_minutes)).time().isoformat('seconds')
+
+def _weekdays(start, end):
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+def _seed_sqlite(cursor, admin_id, start, today, teachers, students, grades, sections, student_history, random_seed):
+    """seed()'s rows for a SQLite database, drawn in Python with the same distributions"""
+    from passwords import hash_password
+    rng = random.Random(random_seed)
+    password = hash_password(BENCH_PASSWORD)
+    cursor.executemany('''
+        INSERT INTO users (user_id, password, role, name, grade, email, phone, is_active, activated_at)
+        VALUES (%s, %s, 'teacher', %s, %s, %s, %s, TRUE, %s)
+        ON CONFLICT (user_id) DO NOTHING
+    ''', [(f'{BENCH_PREFIX}T{n:05d}', password, f'Bench Teacher {n}', str((n - 1) % grades + 1),
+           f'teacher{n}@bench.test', f'+1 555 000 {n:04d}', datetime.combine(start, datetime.min.time()))
+          for n in range(1, teachers + 1)])
+    cursor.executemany('''
+        INSERT INTO students (student_id, name, grade, section, parent_name, parent_contact, created_by)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (student_id) DO NOTHING
+    ''', [(f'{BENCH_PREFIX}S{n:06d}', f'Bench Student {n}', str((n - 1) % grades + 1),
+           sections[((n - 1) // grades) % len(sections)], f'Parent {n}', f'+1 555 100 {n:04d}', admin_id)
+          for n in range(1, students + 1)])
+
+    cursor.execute("SELECT id, grade FROM users WHERE user_id LIKE %s ORDER BY id", (BENCH_PREFIX + 'T%',))
+    bench_teachers = cursor.fetchall()
+    days = list(_weekdays(start, today - timedelta(days=1)))
+    history = []
+    for teacher in bench_teachers:
+        for day in days:
+            r = rng.random()
+            status = ('Absent' if r < 0.02 else 'Leave' if r < 0.06 else 'Late' if r < 0.16
+                      else 'Early' if r < 0.20 else 'Present')
+            if status in ('Absent', 'Leave'):
+                check_in = check_out = None
+            else:
+                check_in = _clock(9, 6, r * 40) if status == 'Late' else _clock(8, 20, r * 40)
+                check_out = _clock(15, 0, r * 90) if status == 'Early' else _clock(17, 0, r * 60)
+            history.append((teacher['id'], day, check_in, check_out, status, teacher['id']))
+    cursor.executemany('''
+        INSERT INTO employee_attendance (user_id, date, check_in, check_out, status, remarks, recorded_by)
+        VALUES (%s, %s, %s, %s, %s, 'Seeded by benchmark.py', %s)
+        ON CONFLICT (user_id, date) DO NOTHING
+    ''', history)
+
+    if student_history:
+        grade_teacher = {}
+        for teacher in bench_teachers:
+            grade_teacher.setdefault(teacher['grade'], teacher['id'])
+        cursor.execute('SELECT id, grade FROM students WHERE student_id LIKE %s', (BENCH_PREFIX + 'S%',))
+        roll_calls = [(student['id'], day, rng.random() > 0.07, grade_teacher[student['grade']])
+                      for student in cursor.fetchall() if student['grade'] in grade_teacher
+                      for day in days]
+        cursor.executemany('''
+            INSERT INTO student_attendance (student_id, date, is_present, recorded_by)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (student_id, date) DO NOTHING
+        ''', roll_calls)
+
+def bench_counts(conn):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT
+            (SELECT COUNT(*) FROM users WHERE user_id LIKE %(pattern)s) AS teachers,
+            (SELECT COUNT(*) FROM students WHERE student_id LIKE %(pattern)s) AS students,
+            (SELECT COUNT(*) FROM employee_attendance) AS employee_attendance,
+            (SELECT COUNT(*) FROM student_attendance) AS student_attendance
+    ''', {'pattern': BENCH_PREFIX + '%'})
+    return dict(cursor.fetchone())
+
+# ======================
+# LOAD TEST
+# ======================
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def summarize(latencies, errors, wall_seconds):
+    ordered = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall_seconds, 1) if wall_seconds else None,
+        'mean_ms': ms(sum(ordered) / len(ordered)) if ordered else None,
+        'p50_ms': ms(_percentile(ordered, 50)),
+        'p95_ms': ms(_percentile(ordered, 95)),
+        'p99_ms': ms(_percentile(ordered, 99)),
+        'max_ms': ms(ordered[-1]) if ordered else None
+    }
+
+class Client:
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, token=None):
+        """(status, parsed JSON body or None)"""
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        req.add_header('Content-Type', 'application/json')
+        if token:
+            req.add_header('Authorization', 'Bearer ' + token)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                payload = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            payload = e.read()
+            status = e.code
+        try:
+            return status, json.loads(payload) if payload else None
+        except ValueError:
+            return status, None
+
+def prepare(client, admin_password, sample_teachers=20):
+    """Log in the admin and a sample of bench teachers, and load their rosters"""
+    from database import get_db_connection
+    from auth import generate_token
+
+    status, body = client.request('POST', '/api/login', {'user_id': 'ADMIN001', 'password': admin_password, 'role': 'admin'})
+    if status != 200:
+        raise SystemExit(f'Admin login failed ({status}): {body}')
+    admin_token = body['token']
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, user_id, grade FROM users
+            WHERE user_id LIKE %s AND role = 'teacher' AND is_active
+            ORDER BY id
+        ''', (BENCH_PREFIX + 'T%',))
+        teachers = [dict(row) for row in cursor.fetchall()]
+        cursor.execute('SELECT DISTINCT grade, section FROM students WHERE student_id LIKE %s', (BENCH_PREFIX + 'S%',))
+        sections = {}
+        for row in cursor.fetchall():
+            sections.setdefault(row['grade'], []).append(row['section'])
+    if not teachers:
+        raise SystemExit('No bench data: run `python benchmark.py seed` first')
+
+    sessions = []
+    for teacher in teachers[:sample_teachers]:
+        status, body = client.request('POST', '/api/login', {'user_id': teacher['user_id'], 'password': BENCH_PASSWORD, 'role': 'teacher'})
+        if status != 200:
+            continue
+        section = sorted(sections.get(teacher['grade'], ['A']))[0]
+        _, roster = client.request('GET', f"/api/students?grade={teacher['grade']}&section={section}", token=body['token'])
+        sessions.append({**teacher, 'token': body['token'], 'section': section,
+                         'student_ids': [s['id'] for s in (roster or {}).get('students', [])]})
+
+    # QR tokens are minted here (same SECRET_KEY as the server) instead of decoded from badge images
+    qr_codes = [f"ATTENDANCE:{t['id']}:{generate_token(t['id'], 'qr_scan')}" for t in teachers]
+    return {'admin_token': admin_token, 'teachers': teachers, 'sessions': sessions, 'qr_codes': qr_codes}
+
+def make_request(name, context, rng):
+    """One request for the named endpoint: (method, path, body, token)"""
+    session = rng.choice(context['sessions'])
+    if name == 'login':
+        teacher = rng.choice(context['teachers'])
+        return 'POST', '/api/login', {'user_id': teacher['user_id'], 'password': BENCH_PASSWORD, 'role': 'teacher'}, None
+    if name == 'scan':
+        return 'POST', '/api/attendance/scan', {'qr_data': rng.choice(context['qr_codes'])}, None
+    if name == 'roll_call':
+        attendance = [{'student_id': sid, 'present': rng.random() > 0.07} for sid in session['student_ids']]
+        return 'POST', '/api/attendance/students', {'attendance': attendance}, session['token']
+    if name == 'roster':
+        return 'GET', f"/api/students?grade={session['grade']}&section={session['section']}", None, session['token']
+    if name == 'history':
+        if rng.random() < 0.5:
+            return 'GET', '/api/attendance/employees?limit=100', None, context['admin_token']
+        day = date.today() - timedelta(days=rng.randint(1, 300))
+        return 'GET', f'/api/attendance/employees?limit=100&date={day.isoformat()}', None, session['token']
+    if name == 'stats':
+        start = date.today().replace(month=1, day=1).isoformat()
+        token = context['admin_token'] if rng.random() < 0.5 else session['token']
+        return 'GET', f'/api/attendance/employees/stats?from={start}', None, token
+    if name == 'term_attendance':
+        day = (date.today() - timedelta(days=rng.randint(0, 300))).isoformat()
+        if rng.random() < 0.5 and session['student_ids']:
+            return 'GET', f"/api/students/{rng.choice(session['student_ids'])}/attendance?date={day}", None, session['token']
+        return 'GET', f"/api/students/attendance?grade={session['grade']}&section={session['section']}&date={day}", None, session['token']
+    raise ValueError(f'Unknown endpoint: {name}')
+
+def load_endpoint(client, name, context, requests, concurrency, random_seed=42):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    plans = [make_request(name, context, random.Random(random_seed + i)) for i in range(requests)]
+
+    def fire(plan):
+        method, path, body, token = plan
+        started = time.perf_counter()
+        try:
+            status, _ = client.request(method, path, body, token)
+            ok = 200 <= status < 400
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(fire, plans))
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+def start_local_server():
+    """Serve app.py on a free local port in a background thread; returns its URL"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    # Every simulated client logs in from 127.0.0.1
+    os.environ.setdefault('LOGIN_IP_PER_MINUTE', '1000000')
+    os.environ.setdefault('LOGIN_IP_BURST', '1000000')
+    from app import app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+# ======================
+# MICRO-BENCHMARKS
+# ======================
+
+def _time_call(fn, repeat=5):
+    """Per-call time in microseconds: median and best of `repeat` autoranged runs"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    runs = sorted(t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number))
+    return {'median_us': round(runs[len(runs) // 2], 3), 'best_us': round(runs[0], 3), 'loops': number}
+
+def run_micro(names=MICRO_BENCHMARKS):
+    from werkzeug.security import check_password_hash
+    import numpy as np
+    from models import calculate_status, generate_qr_code
+    from passwords import hash_password
+    from shifts import CompiledSchedule
+
+    token = 'x' * 150
+    stored_hash = hash_password(BENCH_PASSWORD)
+    # A school year of scans for 500 teachers under a full-time and a part-time policy
+    schedule = CompiledSchedule(
+        [{'id': 1, 'check_in_by': '08:35', 'check_out_from': '15:30', 'workdays': 0b0011111},
+         {'id': 2, 'check_in_by': '12:05', 'check_out_from': '16:00', 'workdays': 0b0001011}],
+        [{'policy_id': 1, 'grade': None, 'user_id': None}, {'policy_id': 2, 'grade': '3', 'user_id': None}],
+        [{'date': date.today() - timedelta(days=30), 'is_working_day': False, 'shift_policy_id': None}])
+    rng = np.random.default_rng(42)
+    rows = (rng.integers(1, 3, 100000), rng.integers(0, 300, 100000),
+            rng.integers(420, 620, 100000), rng.integers(-1, 1100, 100000))
+    cases = {
+        'generate_qr_code_png': lambda: generate_qr_code(42, 'Bench Teacher 42', token, 'png'),
+        'generate_qr_code_svg': lambda: generate_qr_code(42, 'Bench Teacher 42', token, 'svg'),
+        'calculate_status': lambda: (calculate_status('08:59', '17:01'), calculate_status('09:20'), calculate_status(None)),
+        'derive_statuses': lambda: schedule.derive_statuses(date.today() - timedelta(days=300), *rows),
+        'hash_password': lambda: hash_password(BENCH_PASSWORD),
+        'check_password': lambda: check_password_hash(stored_hash, BENCH_PASSWORD)
+    }
+    return {name: _time_call(cases[name]) for name in names}
+
+# ======================
+# RESULTS
+# ======================
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+def compare(current, previous):
+    """[(metric, old, new, change %)] for endpoint p95 and micro medians; higher is worse"""
+    rows = []
+    for name, stats in current.get('endpoints', {}).items():
+        old = previous.get('endpoints', {}).get(name)
+        if old and old.get('p95_ms') and stats.get('p95_ms'):
+            rows.append((f'{name} p95_ms', old['p95_ms'], stats['p95_ms']))
+    for name, stats in current.get('micro', {}).items():
+        old = previous.get('micro', {}).get(name)
+        if old:
+            rows.append((f'{name} median_us', old['median_us'], stats['median_us']))
+    return [(metric, old, new, round((new - old) / old * 100, 1)) for metric, old, new in rows]
+
+def print_results(results):
+    for name, stats in results.get('endpoints', {}).items():
+        print(f"{name:<15} {stats['requests']:>6} req  {stats['errors']:>4} err  {stats['throughput_rps'] or 0:>8} rps  "
+              f"p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms  p99 {stats['p99_ms']} ms")
+    for name, stats in results.get('micro', {}).items():
+        print(f"{name:<22} median {stats['median_us']:>12} us  best {stats['best_us']:>12} us")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed, load-test and micro-benchmark the attendance API')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_cmd = commands.add_parser('seed', help='Create a synthetic school (BENCH- accounts)')
+    seed_cmd.add_argument('--teachers', type=int, default=80)
+    seed_cmd.add_argument('--students', type=int, default=3000)
+    seed_cmd.add_argument('--years', type=int, default=1, help='Years of attendance history')
+    seed_cmd.add_argument('--grades', type=int, default=12)
+    seed_cmd.add_argument('--sections', default='A,B')
+    seed_cmd.add_argument('--student-history', action='store_true', help='Also seed daily student roll-calls')
+    seed_cmd.add_argument('--reset', action='store_true', help='Delete existing BENCH- data first')
+    seed_cmd.add_argument('--seed', type=int, default=42)
+
+    run_cmd = commands.add_parser('run', help='Load-test endpoints and run micro-benchmarks')
+    run_cmd.add_argument('--url', help='Running server to test (default: serve app.py in-process)')
+    run_cmd.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    run_cmd.add_argument('--requests', type=int, default=300, help='Requests per endpoint')
+    run_cmd.add_argument('--login-requests', type=int, default=50, help='Login requests (each hashes a password)')
+    run_cmd.add_argument('--concurrency', type=int, default=16)
+    run_cmd.add_argument('--admin-password', default=os.environ.get('BENCH_ADMIN_PASSWORD', 'admin123'))
+    run_cmd.add_argument('--skip-load', action='store_true')
+    run_cmd.add_argument('--skip-micro', action='store_true')
+    run_cmd.add_argument('--output', help='Results file (default: benchmark-<timestamp>.json)')
+    run_cmd.add_argument('--compare', help='Earlier results file to compare against')
+    run_cmd.add_argument('--max-regression', type=float, help='Fail if any metric is this %% worse than --compare')
+
+    args = parser.parse_args(argv)
+    from database import get_db_connection, init_db
+
+    if args.command == 'seed':
+        # A fresh database gets its schema and admin account first (a no-op otherwise)
+        init_db()
+        started = time.perf_counter()
+        with get_db_connection() as conn:
+            counts = seed(conn, args.teachers, args.students, args.years, args.grades,
+                          tuple(s.strip() for s in args.sections.split(',') if s.strip()),
+                          args.student_history, args.reset, args.seed)
+        print(f"✅ Seeded in {time.perf_counter() - started:.1f}s: {json.dumps(counts)}")
+        return 0
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': {k: v for k, v in vars(args).items() if k != 'admin_password'}
+        }
+    }
+
+    if not args.skip_load:
+        server = None
+        url = args.url
+        if not url:
+            url, server = start_local_server()
+        client = Client(url)
+        with get_db_connection() as conn:
+            results['meta']['data'] = bench_counts(conn)
+        context = prepare(client, args.admin_password)
+        results['meta']['url'] = url
+        results['endpoints'] = {}
+        for name in [e.strip() for e in args.endpoints.split(',') if e.strip()]:
+            count = args.login_requests if name == 'login' else args.requests
+            results['endpoints'][name] = load_endpoint(client, name, context, count, args.concurrency)
+        if server is not None:
+            server.shutdown()
+
+    if not args.skip_micro:
+        results['micro'] = run_micro()
+
+    output = args.output or f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print_results(results)
+    print(f"📄 Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            changes = compare(results, json.load(f))
+        for metric, old, new, change in changes:
+            print(f"{metric:<32} {old:>12} -> {new:>12}  {change:+.1f}%")
+        if args.max_regression is not None:
+            worse = [c for c in changes if c[3] > args.max_regression]
+            if worse:
+                print(f"❌ {len(worse)} metric(s) regressed by more than {args.max_regression:g}%")
+                return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
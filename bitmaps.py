@@ -0,0 +1,257 @@
+"""Per-student attendance bitmaps: a term of roll-calls in two bit strings.
+
+student_attendance_bitmaps holds one row per student and term (migration
+11): bit i of ``recorded`` is set once a roll-call covered the term's day
+i, and bit i of ``present`` when the student was there. The roll-call
+upsert (models.STUDENT_ROLL_CALL_SQL) sets both bits in the statement that
+writes the attendance row, so a student's whole term is one 46-byte read
+instead of a scan of ~180 rows. Percentages and streaks are computed with
+NumPy over a students x days matrix, so a section costs the same few
+array operations as one student. The bitmaps outlive archived attendance
+partitions, like the rollups.
+
+Terms start on the 1st of each TERM_START_MONTHS month and run until the
+next one. Recompute the bitmaps from attendance history (after changing
+terms, or after bulk loading rows) with:
+
+    python bitmaps.py rebuild
+"""
+import os
+import sys
+import argparse
+from datetime import date, timedelta
+import numpy as np
+from database import SQLITE, get_db_connection
+from migrations import STUDENT_BITMAP_DAYS
+
+TERM_START_MONTHS = sorted({int(m) for m in os.environ.get('TERM_START_MONTHS', '8,1').split(',') if m.strip()})
+
+EMPTY_BITMAP = '0' * STUDENT_BITMAP_DAYS
+
+def term_bounds(day):
+    """(first day, day after the last) of the term containing day"""
+    starts = [date(year, month, 1) for year in (day.year - 1, day.year, day.year + 1) for month in TERM_START_MONTHS]
+    start = max(s for s in starts if s <= day)
+    return start, min(s for s in starts if s > start)
+
+def term_start(day):
+    return term_bounds(day)[0]
+
+# Day i of the term as a bit string with only bit i set
+_DAY_MASK_SQL = f"B'1'::bit({STUDENT_BITMAP_DAYS}) >> (%(date)s::date - %(term_start)s::date)"
+
+# Roll-call rows (written: student_id, is_present) into their bitmaps; a
+# re-marked day clears its old present bit. For STUDENT_ROLL_CALL_SQL.
+BITMAP_UPSERT_SQL = f'''
+    INSERT INTO student_attendance_bitmaps AS b (student_id, term_start, recorded, present)
+    SELECT student_id, %(term_start)s::date, {_DAY_MASK_SQL},
+           CASE WHEN is_present THEN {_DAY_MASK_SQL} ELSE B'0'::bit({STUDENT_BITMAP_DAYS}) END
+    FROM written
+    ORDER BY student_id
+    ON CONFLICT (student_id, term_start) DO UPDATE SET
+        recorded = b.recorded | EXCLUDED.recorded,
+        present = (b.present & ~EXCLUDED.recorded) | EXCLUDED.present
+'''
+
+# SQLite splices the day's character into the '0'/'1' text
+SQLITE_BITMAP_UPSERT_SQL = '''
+    INSERT INTO student_attendance_bitmaps AS b (student_id, term_start, recorded, present)
+    VALUES (%(student_id)s, %(term_start)s, %(recorded)s, %(present)s)
+    ON CONFLICT (student_id, term_start) DO UPDATE SET
+        recorded = substr(b.recorded, 1, %(bit)s) || '1' || substr(b.recorded, %(bit)s + 2),
+        present = substr(b.present, 1, %(bit)s) || substr(excluded.present, %(bit)s + 1, 1)
+                  || substr(b.present, %(bit)s + 2)
+'''
+
+def _day_bitmap(bit):
+    return EMPTY_BITMAP[:bit] + '1' + EMPTY_BITMAP[bit + 1:]
+
+def sqlite_bitmap_params(rows, term_start_day):
+    """SQLITE_BITMAP_UPSERT_SQL parameters for [(student_id, day, present)] rows"""
+    params = []
+    for student_id, day, present in rows:
+        bit = (date.fromisoformat(day) - term_start_day).days if isinstance(day, str) else (day - term_start_day).days
+        mask = _day_bitmap(bit)
+        params.append({'student_id': student_id, 'term_start': term_start_day, 'bit': bit,
+                       'recorded': mask, 'present': mask if present else EMPTY_BITMAP})
+    return params
+
+def bitmap_matrix(bitmaps):
+    """students x days boolean matrix from '0'/'1' bit strings (None: no bitmap yet)"""
+    text = ''.join(bitmap or EMPTY_BITMAP for bitmap in bitmaps)
+    return (np.frombuffer(text.encode('ascii'), dtype=np.uint8) == ord('1')).reshape(len(bitmaps), STUDENT_BITMAP_DAYS)
+
+def attendance_metrics(recorded, present):
+    """Per-row day counts, percentage and absence streaks of recorded/present matrices.
+
+    A streak counts consecutive absences across roll-call days; days
+    without a roll-call (weekends, holidays) neither extend nor break it.
+    """
+    present = present & recorded
+    absent = recorded & ~present
+    absences = np.cumsum(absent, axis=1)
+    # Absences counted up to each row's latest present day, carried forward
+    at_last_present = np.maximum.accumulate(np.where(present, absences, 0), axis=1)
+    streaks = absences - at_last_present
+    recorded_days = recorded.sum(axis=1)
+    present_days = present.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = np.round(present_days * 100.0 / recorded_days, 1)
+    return {
+        'recorded_days': recorded_days,
+        'present_days': present_days,
+        'absent_days': absent.sum(axis=1),
+        'attendance_pct': pct,
+        'longest_absent_streak': streaks.max(axis=1),
+        'current_absent_streak': streaks[:, -1]
+    }
+
+def _metrics_row(metrics, index):
+    row = {name: int(values[index]) for name, values in metrics.items() if name != 'attendance_pct'}
+    row['attendance_pct'] = float(metrics['attendance_pct'][index]) if row['recorded_days'] else None
+    return row
+
+def _term(day):
+    start, end = term_bounds(day)
+    return {'start': start.isoformat(), 'end': (end - timedelta(days=1)).isoformat()}, start
+
+def student_attendance_summary(student_id, day=None):
+    """One student's term (the one containing day, default today): totals, streaks and calendar.
+
+    None if there is no such student. The calendar lists the roll-call
+    days as {'date', 'present'}.
+    """
+    term, start = _term(day or date.today())
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.id, s.student_id, s.name, s.grade, s.section, b.recorded, b.present
+            FROM students s
+            LEFT JOIN student_attendance_bitmaps b ON b.student_id = s.id AND b.term_start = %s
+            WHERE s.id = %s
+        ''', (start, student_id))
+        row = cursor.fetchone()
+    if row is None:
+        return None
+
+    recorded, present = bitmap_matrix([row['recorded']]), bitmap_matrix([row['present']])
+    days = np.flatnonzero(recorded[0])
+    calendar = [{'date': (start + timedelta(days=int(i))).isoformat(), 'present': bool(present[0, i])} for i in days]
+    student = {key: row[key] for key in ('id', 'student_id', 'name', 'grade', 'section')}
+    return {'student': student, 'term': term, **_metrics_row(attendance_metrics(recorded, present), 0),
+            'calendar': calendar}
+
+def section_attendance_summary(grade, section, day=None):
+    """Term totals and streaks for every active student of a grade/section.
+
+    Returns {'term', 'roll_call_days', 'attendance_pct', 'students': [...]},
+    students in roster order.
+    """
+    term, start = _term(day or date.today())
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.id, s.student_id, s.name, b.recorded, b.present
+            FROM students s
+            LEFT JOIN student_attendance_bitmaps b ON b.student_id = s.id AND b.term_start = %s
+            WHERE s.is_active = TRUE AND s.grade = %s AND s.section = %s
+            ORDER BY s.name
+        ''', (start, grade, section))
+        rows = cursor.fetchall()
+
+    recorded = bitmap_matrix([row['recorded'] for row in rows])
+    present = bitmap_matrix([row['present'] for row in rows])
+    metrics = attendance_metrics(recorded, present)
+    students = [{'id': row['id'], 'student_id': row['student_id'], 'name': row['name'], **_metrics_row(metrics, i)}
+                for i, row in enumerate(rows)]
+    recorded_total = int(metrics['recorded_days'].sum())
+    return {
+        'term': term,
+        'roll_call_days': int(recorded.any(axis=0).sum()),
+        'attendance_pct': round(int(metrics['present_days'].sum()) * 100.0 / recorded_total, 1) if recorded_total else None,
+        'students': students
+    }
+
+# ======================
+# REBUILD
+# ======================
+
+_REBUILD_DAY_MASK_SQL = f"B'1'::bit({STUDENT_BITMAP_DAYS}) >> (date - %(start)s::date)"
+
+REBUILD_TERM_SQL = f'''
+    INSERT INTO student_attendance_bitmaps (student_id, term_start, recorded, present)
+    SELECT student_id, %(start)s::date, bit_or({_REBUILD_DAY_MASK_SQL}),
+           COALESCE(bit_or({_REBUILD_DAY_MASK_SQL}) FILTER (WHERE is_present), B'0'::bit({STUDENT_BITMAP_DAYS}))
+    FROM student_attendance
+    WHERE date >= %(start)s AND date < %(end)s
+    GROUP BY student_id
+    ON CONFLICT (student_id, term_start) DO UPDATE SET recorded = EXCLUDED.recorded, present = EXCLUDED.present
+'''
+
+def _rebuild_sqlite_term(cursor, start, end):
+    cursor.execute('''
+        SELECT student_id, date, is_present FROM student_attendance
+        WHERE date >= %s AND date < %s
+    ''', (start, end))
+    bitmaps = {}
+    for row in cursor:
+        recorded, present = bitmaps.setdefault(row['student_id'], (bytearray(EMPTY_BITMAP, 'ascii'),
+                                                                    bytearray(EMPTY_BITMAP, 'ascii')))
+        bit = (row['date'] - start).days
+        recorded[bit] = ord('1')
+        if row['is_present']:
+            present[bit] = ord('1')
+    cursor.executemany('''
+        INSERT INTO student_attendance_bitmaps (student_id, term_start, recorded, present)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (student_id, term_start) DO UPDATE SET recorded = excluded.recorded, present = excluded.present
+    ''', [(student_id, start, recorded.decode(), present.decode()) for student_id, (recorded, present) in bitmaps.items()])
+
+def rebuild_student_bitmaps(conn):
+    """Recompute every term's bitmaps from the attendance rows still in the database.
+
+    Students without rows in a term keep that term's bitmap (archived
+    partitions). Returns the number of terms rebuilt; the caller commits.
+    """
+    cursor = conn.cursor()
+    cursor.execute('SELECT MIN(date) AS first, MAX(date) AS last FROM student_attendance')
+    bounds = cursor.fetchone()
+    if bounds['first'] is None:
+        return 0
+    first, last = bounds['first'], bounds['last']
+    if SQLITE:
+        # MIN/MAX results carry no column type
+        first, last = date.fromisoformat(first), date.fromisoformat(last)
+
+    terms = 0
+    start, end = term_bounds(first)
+    while start <= last:
+        if SQLITE:
+            _rebuild_sqlite_term(cursor, start, end)
+        else:
+            cursor.execute(REBUILD_TERM_SQL, {'start': start, 'end': end})
+        terms += 1
+        start, end = term_bounds(end)
+    return terms
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Student attendance bitmap maintenance')
+    parser.add_argument('--tenant', help='Only this school (default: every school)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('rebuild', help='Recompute the bitmaps from attendance history')
+    args = parser.parse_args(argv)
+
+    from tenants import TenantError, tenant_context, tenant_keys
+    try:
+        for tenant in [args.tenant] if args.tenant else tenant_keys():
+            with tenant_context(tenant), get_db_connection() as conn:
+                terms = rebuild_student_bitmaps(conn)
+                conn.commit()
+                print(f"✅ {f'{tenant}: ' if tenant else ''}Rebuilt {terms} term(s) of student bitmaps")
+    except TenantError as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,113 +1,626 @@
 import os
+import math
+import select
+import sqlite3
+import time
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
 from werkzeug.security import generate_password_hash
+from sqlite_backend import SQLitePool, is_sqlite_url, sqlite_path
+from migrations import SQLITE_STUDENT_BITMAPS_MIGRATION, STUDENT_BITMAPS_MIGRATION, migrate
+from partitions import ensure_partitions
+from instrumentation import INSTRUMENTATION_ENABLED, record_query, record_checkout
+from tenants import MULTI_TENANT, TENANTS, get_tenant, search_path_options, tenant_context, tenant_keys
 
-# Get database URL from environment (Neon connection string)
+# Get database URL from environment (Neon connection string, or sqlite:///path.db)
 DATABASE_URL = os.environ.get('DATABASE_URL')
+DB_BACKEND = 'sqlite' if is_sqlite_url(DATABASE_URL) else 'postgresql'
+SQLITE = DB_BACKEND == 'sqlite'
 
-def get_db_connection():
-    """Connect to Neon PostgreSQL database"""
-    if not DATABASE_URL:
-        raise Exception("DATABASE_URL environment variable not set!")
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+# Connection pool settings (one pool per gunicorn worker process)
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '30'))
+DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800'))
+DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', '300'))
+DB_POOL_CHECK_AFTER = float(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+# Multi-school mode keeps one pool per school in every worker; cap each one
+TENANT_DB_POOL_MAX_SIZE = int(os.environ.get('TENANT_DB_POOL_MAX_SIZE', str(DB_POOL_MAX_SIZE)))
+
+# Read replicas (comma-separated URLs; per school, "replica_urls" in TENANT_MAP)
+# serve read-only queries whose results may be up to DB_REPLICA_MAX_LAG_SECONDS old
+DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', '5'))
+DB_REPLICA_CHECK_SECONDS = float(os.environ.get('DB_REPLICA_CHECK_SECONDS', '1'))
+DB_REPLICA_RETRY_SECONDS = float(os.environ.get('DB_REPLICA_RETRY_SECONDS', '15'))
+DB_REPLICA_CONNECT_TIMEOUT = int(os.environ.get('DB_REPLICA_CONNECT_TIMEOUT', '3'))
+REPLICAS_CONFIGURED = bool(DATABASE_REPLICA_URLS) or any(t.replica_urls for t in TENANTS.values())
+
+if SQLITE and (MULTI_TENANT or REPLICAS_CONFIGURED):
+    raise RuntimeError("A SQLite DATABASE_URL serves a single school without replicas: "
+                       "unset TENANT_MAP and DATABASE_REPLICA_URLS")
+
+# A duplicate key, whichever database raised it
+IntegrityError = (psycopg2.IntegrityError, sqlite3.IntegrityError)
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the checkout timeout"""
+
+class PooledConnection(extensions.connection):
+    """psycopg2 connection that remembers when it was opened and last returned"""
+    created_at = 0.0
+    last_used = 0.0
+
+class InstrumentedCursor(RealDictCursor):
+    """RealDictCursor that records each statement's timing and row count"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_query(sql, time.perf_counter() - started, self.rowcount)
+
+CURSOR_FACTORY = InstrumentedCursor if INSTRUMENTATION_ENABLED else RealDictCursor
+
+class ConnectionPool:
+    """Thread-safe PostgreSQL connection pool with checkout health checks.
+
+    Idle connections are handed out LIFO so the warmest socket is reused
+    first. A connection is pinged before checkout when it has sat idle for
+    longer than ``check_after`` seconds, and replaced once it is older than
+    ``max_lifetime``. Spare connections idle longer than ``max_idle`` are
+    closed, never shrinking the pool below ``min_size``. With ``schema``
+    every connection opens with search_path set to it; ``connect_timeout``
+    bounds how long opening one may take.
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, timeout=30.0,
+                 max_lifetime=1800.0, max_idle=300.0, check_after=30.0, schema=None, connect_timeout=None):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Invalid pool size: need 0 <= min_size <= max_size and max_size >= 1")
+        self.dsn = dsn
+        self.schema = schema
+        self.connect_timeout = connect_timeout
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._counters = {'created': 0, 'recycled': 0, 'failed_checks': 0, 'timeouts': 0}
+
+    def _connect(self):
+        options = {'options': search_path_options(self.schema)} if self.schema else {}
+        if self.connect_timeout:
+            options['connect_timeout'] = self.connect_timeout
+        conn = psycopg2.connect(self.dsn, connection_factory=PooledConnection, cursor_factory=CURSOR_FACTORY, **options)
+        conn.created_at = conn.last_used = time.monotonic()
+        with self._cond:
+            self._counters['created'] += 1
+        return conn
+
+    def _is_usable(self, conn):
+        if conn.closed:
+            return False
+        # An idle connection has nothing to read unless the server hung up
+        # (shutdown, terminated backend): cheaper than a ping, so always done
+        if select.select([conn], [], [], 0)[0]:
+            return False
+        now = time.monotonic()
+        if now - conn.created_at > self.max_lifetime:
+            with self._cond:
+                self._counters['recycled'] += 1
+            return False
+        if now - conn.last_used > self.check_after:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                with self._cond:
+                    self._counters['failed_checks'] += 1
+                return False
+        return True
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        """Check out a healthy connection, blocking up to ``timeout`` seconds"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    conn = None
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(f"No database connection available within {self.timeout:g}s")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+
+        # Health check and connect happen outside the lock; the slot is already reserved
+        if conn is not None:
+            if self._is_usable(conn):
+                return conn
+            self._close_quietly(conn)
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn):
+        """Return a connection, rolling back any transaction left open"""
+        if not conn.closed and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._close_quietly(conn)
+
+        now = time.monotonic()
+        expired = []
+        if not conn.closed and conn.autocommit:
+            conn.autocommit = False
+
+        with self._cond:
+            self._in_use -= 1
+            if conn.closed or self._closed:
+                self._size -= 1
+                expired.append(conn)
+            else:
+                conn.last_used = now
+                self._idle.append(conn)
+            # Oldest idle connections sit at the front of the list
+            while (self._idle and self._size > self.min_size
+                   and now - self._idle[0].last_used > self.max_idle):
+                expired.append(self._idle.pop(0))
+                self._size -= 1
+            self._cond.notify()
+        for old in expired:
+            self._close_quietly(old)
+
+    def close(self):
+        """Close idle connections; checked-out ones close when returned"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                **self._counters
+            }
+
+# ======================
+# READ REPLICAS
+# ======================
+
+# Seconds a replica's data is behind the primary: 0 once it has replayed all
+# WAL it received (or isn't a standby any more), else the age of the last
+# transaction it replayed. That overstates the lag of a replica catching up
+# after a quiet spell, which only sends reads to the primary a little longer.
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        -- Right after a restart the receive position starts behind the replayed one
+        WHEN pg_last_wal_receive_lsn() <= pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag
+"""
+
+class ReplicaSet:
+    """The read replicas of one database and how far each lags behind.
+
+    Lag is measured at most every ``check_after`` seconds. Between checks it
+    can only have grown by the time passed, so a replica serves a read only
+    while last lag + time since the check stays within ``max_lag``: results
+    are never staler than that. A replica that can't be reached is skipped
+    for ``retry_after`` seconds. choose() returns None when no replica
+    qualifies, and the read goes to the primary.
+    """
+
+    def __init__(self, pools, max_lag, check_after, retry_after):
+        self.pools = pools
+        self.max_lag = max_lag
+        self.check_after = check_after
+        self.retry_after = retry_after
+        # None: down, or not checked yet
+        self._lag = [None] * len(pools)
+        self._checked_at = [-math.inf] * len(pools)
+        self._check_locks = [threading.Lock() for _ in pools]
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._counters = {'replica_reads': 0, 'primary_fallbacks': 0, 'failed_checks': 0}
+
+    def check(self, index):
+        """Measure replica index's lag now; None if it can't be reached"""
+        pool = self.pools[index]
+        lag = None
+        try:
+            conn = pool.getconn()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(REPLICA_LAG_SQL)
+                    lag = float(cursor.fetchone()['lag'])
+                conn.rollback()
+            finally:
+                pool.putconn(conn)
+        except (psycopg2.Error, PoolTimeout):
+            self.record('failed_checks')
+        self._lag[index] = lag
+        self._checked_at[index] = time.monotonic()
+        return lag
+
+    def check_if_stale(self, index):
+        """Re-check index once its last check is due, unless another thread is already at it"""
+        due = self.check_after if self._lag[index] is not None else self.retry_after
+        if time.monotonic() - self._checked_at[index] < due:
+            return
+        lock = self._check_locks[index]
+        if lock.acquire(blocking=False):
+            try:
+                self.check(index)
+            finally:
+                lock.release()
+
+    def check_all_if_stale(self):
+        for index in range(len(self.pools)):
+            self.check_if_stale(index)
+
+    def mark_down(self, index):
+        self._lag[index] = None
+        self._checked_at[index] = time.monotonic()
+
+    def is_fresh(self, index):
+        lag = self._lag[index]
+        return lag is not None and lag + time.monotonic() - self._checked_at[index] <= self.max_lag
+
+    def choose(self, check=True):
+        """Index of a fresh enough replica (round robin), or None for the primary.
+
+        With check, replicas due a lag check are checked first, in this thread.
+        """
+        count = len(self.pools)
+        start = next(self._next)
+        for offset in range(count):
+            index = (start + offset) % count
+            if check:
+                self.check_if_stale(index)
+            if self.is_fresh(index):
+                return index
+        return None
+
+    def record(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def stats(self):
+        # Keyed by position in the URL list, so /metrics can export them
+        replicas = {}
+        for index, pool in enumerate(self.pools):
+            lag = self._lag[index]
+            replicas[str(index)] = {'up': int(lag is not None), 'fresh': int(self.is_fresh(index)),
+                                    'lag_seconds': lag, **pool.stats()}
+        with self._lock:
+            return {'max_lag_seconds': self.max_lag, 'replicas': replicas, **self._counters}
+
+# ======================
+# POOLS
+# ======================
+
+# Pools and replica sets by tenant key (None for a single-school deployment)
+_pools = {}
+_replica_sets = {}
+_pool_lock = threading.Lock()
+_inherited_pools = []
+
+# Set for a request that must see its own writes: read-only queries go to the primary
+_read_primary = contextvars.ContextVar('read_primary', default=False)
+
+def _reset_pool_after_fork():
+    # Sockets inherited from the parent belong to the parent's sessions: keep
+    # them referenced (closing would terminate the parent's session) and let
+    # this process build its own pools on first use.
+    global _pools, _replica_sets, _pool_lock
+    _inherited_pools.extend(_pools.values())
+    for replicas in _replica_sets.values():
+        if replicas is not None:
+            _inherited_pools.extend(replicas.pools)
+    _pools = {}
+    _replica_sets = {}
+    _pool_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+def get_pool(tenant=None):
+    """Return this process's pool for tenant (default: the current school), creating it on first use"""
+    config = get_tenant(tenant)
+    key = config.key if config else None
+    pool = _pools.get(key)
+    if pool is None:
+        dsn = config.database_url if config else DATABASE_URL
+        if not dsn:
+            raise Exception("DATABASE_URL environment variable not set!")
+        with _pool_lock:
+            pool = _pools.get(key)
+            if pool is None and SQLITE:
+                pool = _pools[key] = SQLitePool(sqlite_path(dsn), max_idle=DB_POOL_MAX_SIZE)
+            elif pool is None:
+                max_size = TENANT_DB_POOL_MAX_SIZE if config else DB_POOL_MAX_SIZE
+                pool = _pools[key] = ConnectionPool(
+                    dsn,
+                    min_size=min(DB_POOL_MIN_SIZE, max_size),
+                    max_size=max_size,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    check_after=DB_POOL_CHECK_AFTER,
+                    schema=config.schema if config else None
+                )
+    return pool
+
+def get_replica_set(tenant=None):
+    """This process's ReplicaSet for tenant (default: the current school); None without replicas"""
+    config = get_tenant(tenant)
+    key = config.key if config else None
+    try:
+        return _replica_sets[key]
+    except KeyError:
+        pass
+    urls = config.replica_urls if config else DATABASE_REPLICA_URLS
+    with _pool_lock:
+        if key not in _replica_sets:
+            pools = [
+                ConnectionPool(
+                    url,
+                    min_size=0,
+                    max_size=TENANT_DB_POOL_MAX_SIZE if config else DB_POOL_MAX_SIZE,
+                    # A busy replica spills reads over to the primary rather than queueing them
+                    timeout=0,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    # Ping sooner than on the primary: a replica is dropped at the first dead socket
+                    check_after=DB_REPLICA_CHECK_SECONDS,
+                    schema=config.schema if config else None,
+                    connect_timeout=DB_REPLICA_CONNECT_TIMEOUT
+                )
+                for url in urls
+            ]
+            _replica_sets[key] = ReplicaSet(
+                pools, DB_REPLICA_MAX_LAG_SECONDS, DB_REPLICA_CHECK_SECONDS, DB_REPLICA_RETRY_SECONDS
+            ) if pools else None
+        return _replica_sets[key]
+
+def replica_sets():
+    """{tenant: ReplicaSet} for the schools with replicas used so far in this process"""
+    return {key: replicas for key, replicas in list(_replica_sets.items()) if replicas is not None}
+
+def close_pool():
+    """Close the current process's pools (new ones are created on next use)"""
+    global _pools, _replica_sets
+    with _pool_lock:
+        pools, _pools = _pools, {}
+        replicas, _replica_sets = _replica_sets, {}
+    for pool in pools.values():
+        pool.close()
+    for replica_set in replicas.values():
+        if replica_set is not None:
+            for pool in replica_set.pools:
+                pool.close()
+
+def pool_stats():
+    """Connection pool statistics for this worker process ({tenant: stats} for several schools)"""
+    if MULTI_TENANT:
+        return {key: pool.stats() for key, pool in list(_pools.items())}
+    pool = _pools.get(None)
+    return pool.stats() if pool is not None else None
+
+def replica_stats():
+    """Read replica statistics for this worker process ({tenant: stats} for several schools)"""
+    if MULTI_TENANT:
+        return {key: replicas.stats() for key, replicas in replica_sets().items()}
+    replicas = _replica_sets.get(None)
+    return replicas.stats() if replicas is not None else None
+
+def reads_from_primary():
+    """True when this request's read-only queries must go to the primary"""
+    return _read_primary.get()
+
+def _checkout(tenant, readonly):
+    """(pool, connection, (replicas, index) or None): a fresh replica's for readonly work, else the primary's"""
+    replicas = get_replica_set(tenant) if readonly and not _read_primary.get() else None
+    if replicas is not None:
+        index = replicas.choose()
+        if index is not None:
+            pool = replicas.pools[index]
+            try:
+                conn = pool.getconn()
+            except psycopg2.OperationalError:
+                replicas.mark_down(index)
+            except PoolTimeout:
+                pass
+            else:
+                replicas.record('replica_reads')
+                return pool, conn, (replicas, index)
+        replicas.record('primary_fallbacks')
+    pool = get_pool(tenant)
+    return pool, pool.getconn(), None
+
+@contextmanager
+def get_db_connection(tenant=None, readonly=False):
+    """Borrow a pooled database connection for the duration of a with-block.
+
+    Uncommitted work is rolled back when the block exits, so callers commit
+    explicitly exactly as with a plain psycopg2 connection. The connection
+    belongs to tenant's school, by default the current one. With readonly
+    it may be a read replica's (see ReplicaSet), unless the request has to
+    read its own writes; the block must then only read.
+    """
+    started = time.perf_counter()
+    pool, conn, replica = _checkout(tenant, readonly)
+    if INSTRUMENTATION_ENABLED:
+        record_checkout(time.perf_counter() - started)
+    try:
+        yield conn
+    finally:
+        # A lost connection most likely means a lost replica: stop routing reads to it
+        if replica is not None and conn.closed:
+            replica[0].mark_down(replica[1])
+        pool.putconn(conn)
+
+# ======================
+# READ-YOUR-WRITES
+# ======================
+
+# A client that just wrote reads from the primary until this cookie's
+# timestamp, by when every replica serving reads has caught up with the write
+READ_PRIMARY_COOKIE = 'read_primary_until'
+_WRITE_METHODS = frozenset(('POST', 'PUT', 'PATCH', 'DELETE'))
+
+def _must_read_primary(method, cookie):
+    if method in _WRITE_METHODS:
+        return True
+    try:
+        return float(cookie or 0) > time.time()
+    except ValueError:
+        return False
+
+def _remember_write(request, response):
+    if request.method in _WRITE_METHODS and response.status_code < 400:
+        until = time.time() + DB_REPLICA_MAX_LAG_SECONDS
+        response.set_cookie(READ_PRIMARY_COOKIE, f'{until:.3f}', max_age=math.ceil(DB_REPLICA_MAX_LAG_SECONDS),
+                            httponly=True, samesite='Lax')
+    return response
+
+def read_your_writes_flask(app):
+    """Send a Flask client's reads to the primary right after it writes (no-op without replicas)"""
+    if not REPLICAS_CONFIGURED:
+        return
+    from flask import request
+
+    @app.before_request
+    def _choose_read_source():
+        # Always set: server threads are reused across requests
+        _read_primary.set(_must_read_primary(request.method, request.cookies.get(READ_PRIMARY_COOKIE)))
+
+    @app.after_request
+    def _remember_client_write(response):
+        return _remember_write(request, response)
+
+def read_your_writes_quart(app):
+    """Async counterpart of read_your_writes_flask"""
+    if not REPLICAS_CONFIGURED:
+        return
+    from quart import request
+
+    @app.before_request
+    async def _choose_read_source():
+        _read_primary.set(_must_read_primary(request.method, request.cookies.get(READ_PRIMARY_COOKIE)))
+
+    @app.after_request
+    async def _remember_client_write(response):
+        return _remember_write(request, response)
 
 def init_db():
-    """Initialize PostgreSQL database schema"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # USERS TABLE
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            user_id TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL CHECK (role IN ('admin', 'teacher')),
-            name TEXT NOT NULL,
-            grade TEXT,
-            email TEXT,
-            phone TEXT,
-            address TEXT,
-            is_active BOOLEAN DEFAULT FALSE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            activated_at TIMESTAMP
-        )
-    ''')
-    
-    # STUDENTS TABLE
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS students (
-            id SERIAL PRIMARY KEY,
-            student_id TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            grade TEXT NOT NULL,
-            section TEXT NOT NULL,
-            parent_name TEXT,
-            parent_contact TEXT NOT NULL,
-            is_active BOOLEAN DEFAULT TRUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            created_by INTEGER NOT NULL,
-            FOREIGN KEY (created_by) REFERENCES users(id) ON DELETE CASCADE
-        )
-    ''')
-    
-    # EMPLOYEE ATTENDANCE TABLE
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS employee_attendance (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            date DATE NOT NULL,
-            check_in TIME,
-            check_out TIME,
-            status TEXT CHECK (status IN ('Present', 'Absent', 'Late', 'Early', 'Leave')),
-            remarks TEXT,
-            recorded_by INTEGER,
-            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY (recorded_by) REFERENCES users(id) ON DELETE SET NULL,
-            UNIQUE (user_id, date)
-        )
-    ''')
+    """Apply pending schema migrations and create the default admin, for every school"""
+    for tenant in tenant_keys():
+        with tenant_context(tenant):
+            _init_tenant_db()
+    # Don't carry open sockets into forked gunicorn workers (--preload)
+    close_pool()
+    print(f"✅ Database initialized successfully with {'SQLite' if SQLITE else 'Neon PostgreSQL'}")
+    print("🔒 Zero sample data - Admin must add all teachers/students\n")
+
+def _init_tenant_db():
+    config = get_tenant()
+    with get_db_connection() as conn:
+        versions = migrate(conn, schema=config.schema if config else None)
+        cursor = conn.cursor()
     
-    # STUDENT ATTENDANCE TABLE
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS student_attendance (
-            id SERIAL PRIMARY KEY,
-            student_id INTEGER NOT NULL,
-            date DATE NOT NULL,
-            is_present BOOLEAN NOT NULL,
-            recorded_by INTEGER NOT NULL,
-            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE,
-            FOREIGN KEY (recorded_by) REFERENCES users(id) ON DELETE CASCADE,
-            UNIQUE (student_id, date)
-        )
-    ''')
+        # Create default admin account if not exists
+        cursor.execute("SELECT * FROM users WHERE user_id = 'ADMIN001'")
+        if not cursor.fetchone():
+            hashed_pw = generate_password_hash('admin123', method='pbkdf2:sha256')
+            cursor.execute('''
+                INSERT INTO users (user_id, password, role, name, email, phone, is_active, activated_at) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ''', (
+                'ADMIN001', 
+                hashed_pw, 
+                'admin', 
+                'System Administrator', 
+                'admin@school.edu', 
+                '+1 555 123 4567',
+                True
+            ))
+            print("\n" + "="*70)
+            print(f"✅ DEFAULT ADMIN CREATED{f' for {config.key}' if config else ''}")
+            print("User ID: ADMIN001 | Password: admin123")
+            print("⚠️  CHANGE PASSWORD IMMEDIATELY AFTER FIRST LOGIN!")
+            print("="*70 + "\n")
     
-    # Create default admin account if not exists
-    cursor.execute("SELECT * FROM users WHERE user_id = 'ADMIN001'")
-    if not cursor.fetchone():
-        hashed_pw = generate_password_hash('admin123', method='pbkdf2:sha256')
-        cursor.execute('''
-            INSERT INTO users (user_id, password, role, name, email, phone, is_active, activated_at) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-        ''', (
-            'ADMIN001', 
-            hashed_pw, 
-            'admin', 
-            'System Administrator', 
-            'admin@school.edu', 
-            '+1 555 123 4567',
-            True
-        ))
-        print("\n" + "="*70)
-        print("✅ DEFAULT ADMIN CREATED")
-        print("User ID: ADMIN001 | Password: admin123")
-        print("⚠️  CHANGE PASSWORD IMMEDIATELY AFTER FIRST LOGIN!")
-        print("="*70 + "\n")
+        # Bitmaps for the roll-calls recorded before they existed
+        if (SQLITE_STUDENT_BITMAPS_MIGRATION if SQLITE else STUDENT_BITMAPS_MIGRATION) in versions:
+            from bitmaps import rebuild_student_bitmaps
+            rebuild_student_bitmaps(conn)
     
-    conn.commit()
-    conn.close()
-    print("✅ Database initialized successfully with Neon PostgreSQL")
-    print("🔒 Zero sample data - Admin must add all teachers/students\n")
\ No newline at end of file
+        conn.commit()
+        # Upcoming attendance partitions (and any rows parked in DEFAULT)
+        if not SQLITE:
+            ensure_partitions(conn)
\ No newline at end of file
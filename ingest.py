@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import glob
+import fcntl
+import atexit
+import threading
+from datetime import datetime
+from models import record_employee_scans, record_roll_calls
+from tenants import current_tenant_key, tenant_context
+
+# Write-behind ingestion is off unless a log directory is configured
+INGEST_WAL_DIR = os.environ.get('INGEST_WAL_DIR')
+INGEST_FLUSH_INTERVAL = float(os.environ.get('INGEST_FLUSH_INTERVAL', '0.5'))
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', '1000'))
+INGEST_FSYNC = os.environ.get('INGEST_FSYNC', 'true').lower() == 'true'
+# A fully flushed log is truncated once it grows past this size
+INGEST_SEGMENT_BYTES = int(os.environ.get('INGEST_SEGMENT_BYTES', str(16 * 1024 * 1024)))
+# How often to look for logs left behind by workers that died
+INGEST_ADOPT_INTERVAL = float(os.environ.get('INGEST_ADOPT_INTERVAL', '30'))
+INGEST_MAX_RETRY_DELAY = 30.0
+
+def _read_checkpoint(path):
+    try:
+        with open(path + '.ckpt') as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+def _write_checkpoint(path, offset):
+    tmp = path + '.ckpt.tmp'
+    with open(tmp, 'w') as f:
+        f.write(str(offset))
+    os.replace(tmp, path + '.ckpt')
+
+def _read_events(path, offset, limit):
+    """Up to limit complete events after offset: ([event], new offset)"""
+    events = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            # A torn final line (crash mid-append) was never acknowledged
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                print(f"⚠️  Skipping unreadable ingest record in {path}")
+            if len(events) >= limit:
+                break
+    return events, offset
+
+def apply_events(events):
+    """Write a batch of logged events to the database, each to its school's.
+
+    Safe to repeat: scans are deduplicated through attendance_scans and a
+    roll-call replays as the same upsert, which is what makes replay
+    after a crash at-least-once without double counting.
+    """
+    by_tenant = {}
+    for event in events:
+        by_tenant.setdefault(event.get('tenant'), []).append(event)
+    for tenant, tenant_events in by_tenant.items():
+        with tenant_context(tenant):
+            _apply_tenant_events(tenant_events)
+
+def _apply_tenant_events(events):
+    scans = [(e['user_id'], datetime.fromisoformat(e['scanned_at'])) for e in events if e['kind'] == 'scan']
+    roll_calls = [e['params'] for e in events if e['kind'] == 'roll_call']
+    if scans:
+        record_employee_scans(scans)
+    for params, result in zip(roll_calls, record_roll_calls(roll_calls) if roll_calls else []):
+        if result['rejected']:
+            print(f"⚠️  Queued roll-call by teacher {params['teacher_id']} had rejected entries: {result['rejected']}")
+
+class IngestLog:
+    """Durable append-only log of attendance events with a background flusher.
+
+    Each process appends to its own file, held under an exclusive flock
+    while the process lives. The flusher applies events in batches and
+    records the applied byte offset in a checkpoint file; everything
+    after the checkpoint is replayed on restart. Logs whose owner died
+    (the lock is free) are adopted, replayed and removed by a live
+    process.
+    """
+
+    def __init__(self, directory, flush_interval=0.5, batch_size=1000, fsync=True,
+                 segment_bytes=16 * 1024 * 1024, adopt_interval=30.0):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.segment_bytes = segment_bytes
+        self.adopt_interval = adopt_interval
+        name = f'ingest-{os.getpid()}-{time.time_ns()}.wal'
+        self.path = os.path.join(directory, name)
+        # Lock under a temporary name so no other process can adopt it unlocked
+        tmp_path = os.path.join(directory, '.' + name)
+        self._fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(tmp_path, self.path)
+        self._size = 0
+        self._offset = 0
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._counters = {'appended': 0, 'flushed': 0, 'batches': 0, 'failures': 0, 'adopted': 0}
+        self._last_error = None
+        self._thread = threading.Thread(target=self._run, name='ingest-flusher', daemon=True)
+        self._thread.start()
+
+    def append(self, event):
+        """Durably log one event; returns once it is on disk"""
+        data = (json.dumps(event, separators=(',', ':')) + '\n').encode()
+        with self._write_lock:
+            os.write(self._fd, data)
+            if self.fsync:
+                os.fsync(self._fd)
+            self._size += len(data)
+            self._counters['appended'] += 1
+            backlog = self._counters['appended'] - self._counters['flushed']
+        if backlog >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Apply everything logged so far; returns the number of events applied"""
+        applied = 0
+        while True:
+            events, offset = _read_events(self.path, self._offset, self.batch_size)
+            if not events:
+                if offset != self._offset:
+                    self._offset = offset
+                    _write_checkpoint(self.path, offset)
+                break
+            apply_events(events)
+            self._offset = offset
+            _write_checkpoint(self.path, offset)
+            self._counters['flushed'] += len(events)
+            self._counters['batches'] += 1
+            applied += len(events)
+        self._truncate_if_drained()
+        return applied
+
+    def _truncate_if_drained(self):
+        with self._write_lock:
+            if self._size < self.segment_bytes or self._offset != self._size:
+                return
+            # Checkpoint first: a crash in between only replays applied events again
+            _write_checkpoint(self.path, 0)
+            os.ftruncate(self._fd, 0)
+            self._size = self._offset = 0
+
+    def adopt_orphans(self):
+        """Replay and remove logs whose owning process is gone"""
+        for path in glob.glob(os.path.join(self.directory, 'ingest-*.wal')):
+            if path == self.path:
+                continue
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            try:
+                offset = _read_checkpoint(path)
+                while True:
+                    events, offset = _read_events(path, offset, self.batch_size)
+                    if not events:
+                        break
+                    apply_events(events)
+                    _write_checkpoint(path, offset)
+                    self._counters['adopted'] += len(events)
+                os.remove(path)
+                for leftover in (path + '.ckpt', path + '.ckpt.tmp'):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+            finally:
+                os.close(fd)
+
+    def _run(self):
+        delay = self.flush_interval
+        next_adopt = 0.0
+        while not self._stopped.is_set():
+            try:
+                if time.monotonic() >= next_adopt:
+                    self.adopt_orphans()
+                    next_adopt = time.monotonic() + self.adopt_interval
+                self.flush()
+                delay = self.flush_interval
+                self._last_error = None
+            except Exception as e:
+                # Events stay in the log; back off and retry
+                self._counters['failures'] += 1
+                self._last_error = str(e)
+                delay = min(max(delay, self.flush_interval) * 2, INGEST_MAX_RETRY_DELAY)
+                print(f"⚠️  Ingest flush failed, retrying in {delay:g}s: {e}")
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def close(self):
+        """Stop the flusher after one last flush attempt"""
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout=10)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"⚠️  Ingest log left for replay ({e}): {self.path}")
+        else:
+            # Fully applied: nothing to replay, so leave nothing behind
+            os.remove(self.path)
+            for leftover in (self.path + '.ckpt', self.path + '.ckpt.tmp'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        os.close(self._fd)
+
+    def stats(self):
+        with self._write_lock:
+            return {
+                'pending': self._counters['appended'] - self._counters['flushed'],
+                'log_bytes': self._size,
+                'last_error': self._last_error,
+                **self._counters
+            }
+
+_log = None
+_log_lock = threading.Lock()
+
+def _reset_log_after_fork():
+    # The parent's file, lock and flusher thread stay with the parent
+    global _log, _log_lock
+    _log = None
+    _log_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_log_after_fork)
+
+def ingest_enabled():
+    return bool(INGEST_WAL_DIR)
+
+def get_ingest_log():
+    """This process's ingest log, created (and its flusher started) on first use"""
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = IngestLog(
+                    INGEST_WAL_DIR,
+                    flush_interval=INGEST_FLUSH_INTERVAL,
+                    batch_size=INGEST_BATCH_SIZE,
+                    fsync=INGEST_FSYNC,
+                    segment_bytes=INGEST_SEGMENT_BYTES,
+                    adopt_interval=INGEST_ADOPT_INTERVAL
+                )
+                atexit.register(_log.close)
+    return _log
+
+def ingest_stats():
+    return _log.stats() if _log is not None else None
+
+def enqueue_scan(user_id, scanned_at=None):
+    """Log a badge scan for write-behind; applied like an offline kiosk scan"""
+    scanned_at = scanned_at or datetime.now()
+    get_ingest_log().append({'kind': 'scan', 'user_id': user_id, 'scanned_at': scanned_at.isoformat(),
+                             'tenant': current_tenant_key()})
+
+def enqueue_roll_call(params):
+    """Log a roll-call (student_roll_call_params output) for write-behind"""
+    get_ingest_log().append({'kind': 'roll_call', 'params': params, 'tenant': current_tenant_key()})
@@ -0,0 +1,291 @@
+"""Request and query instrumentation: timing spans, Prometheus metrics, slow-query log.
+
+Every request gets a RequestTimer in a context variable. Database,
+auth and JSON code add their elapsed time to it as named spans
+(db_connect, db, auth, serialize), which are returned to the client in a
+Server-Timing header and summed into per-endpoint metrics. Each query is
+recorded under its normalized statement (literals replaced by ?).
+
+Metrics live in the worker process that served the request, so with
+several gunicorn workers each scrape of /metrics sees one worker; the
+`worker` label tells them apart.
+"""
+import os
+import re
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION', 'true').lower() == 'true'
+# Queries slower than this are printed with their normalized statement (0 = off)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '0'))
+# Distinct statements tracked before new ones are grouped as 'other'
+MAX_STATEMENTS = int(os.environ.get('INSTRUMENTATION_MAX_STATEMENTS', '500'))
+STATEMENT_LABEL_LENGTH = 200
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current_timer = contextvars.ContextVar('request_timer', default=None)
+
+class RequestTimer:
+    """Accumulated span durations (seconds) for one request"""
+    __slots__ = ('endpoint', 'started', 'spans', 'queries')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.queries = 0
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self, total):
+        parts = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.spans.items()]
+        if self.queries:
+            parts.append(f'queries;desc="{self.queries}"')
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+def current_timer():
+    return _current_timer.get()
+
+@contextmanager
+def span(name):
+    """Add the block's wall time to the current request's `name` span"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started)
+
+def add_span(name, seconds):
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(name, seconds)
+
+# ======================
+# METRICS
+# ======================
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Registry:
+    """Minimal thread-safe counters and histograms in Prometheus text format"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def counter(self, name, help_text, label_names):
+        self._meta[name] = ('counter', help_text, tuple(label_names))
+        self._counters[name] = {}
+
+    def histogram(self, name, help_text, label_names):
+        self._meta[name] = ('histogram', help_text, tuple(label_names))
+        self._histograms[name] = {}
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            series = self._counters[name]
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            series = self._histograms[name]
+            state = series.get(labels)
+            if state is None:
+                state = series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self, worker):
+        lines = []
+        extra = f'worker="{_escape(worker)}"'
+        inf_le = 'le="+Inf",' + extra
+        with self._lock:
+            for name, (kind, help_text, label_names) in self._meta.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                if kind == 'counter':
+                    for labels, value in self._counters[name].items():
+                        lines.append(f'{name}{_labels(label_names, labels, extra)} {value:g}')
+                    continue
+                for labels, (counts, total, count) in self._histograms[name].items():
+                    cumulative = 0
+                    for bound, bucket_count in zip(self.buckets, counts):
+                        cumulative += bucket_count
+                        le = f'le="{bound:g}",' + extra
+                        lines.append(f'{name}_bucket{_labels(label_names, labels, le)} {cumulative}')
+                    lines.append(f'{name}_bucket{_labels(label_names, labels, inf_le)} {count}')
+                    lines.append(f'{name}_sum{_labels(label_names, labels, extra)} {total:.6f}')
+                    lines.append(f'{name}_count{_labels(label_names, labels, extra)} {count}')
+        return lines
+
+metrics = Registry()
+metrics.counter('http_requests_total', 'Requests served', ['method', 'endpoint', 'status'])
+metrics.histogram('http_request_duration_seconds', 'Request wall time', ['endpoint'])
+metrics.counter('http_request_span_seconds_total', 'Time spent per request span', ['endpoint', 'span'])
+metrics.histogram('db_query_duration_seconds', 'Query execution time', ['statement'])
+metrics.counter('db_query_rows_total', 'Rows returned or affected', ['statement'])
+metrics.histogram('db_checkout_duration_seconds', 'Time to check out a pooled connection', [])
+
+# ======================
+# QUERIES
+# ======================
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\?(?:\s*,\s*\?)+')
+# Query text -> label; dynamic (mogrified) queries make this churn, so it is cleared when full
+_statement_labels = {}
+_STATEMENT_CACHE_SIZE = 4096
+_known_labels = set()
+_statement_lock = threading.Lock()
+
+def normalize_statement(query):
+    """Statement label for a query: literals as ?, whitespace collapsed, truncated"""
+    cacheable = isinstance(query, (str, bytes))
+    if cacheable:
+        label = _statement_labels.get(query)
+        if label is not None:
+            return label
+    if isinstance(query, bytes):
+        text = query.decode('utf-8', 'replace')
+    else:
+        text = str(query)
+    text = _LISTS.sub('?', _LITERALS.sub('?', text))
+    label = ' '.join(text.split())[:STATEMENT_LABEL_LENGTH]
+    with _statement_lock:
+        if label not in _known_labels:
+            if len(_known_labels) >= MAX_STATEMENTS:
+                label = 'other'
+            else:
+                _known_labels.add(label)
+        if cacheable:
+            if len(_statement_labels) >= _STATEMENT_CACHE_SIZE:
+                _statement_labels.clear()
+            _statement_labels[query] = label
+    return label
+
+def record_query(query, seconds, rows):
+    """Called by the instrumented cursors after every execute"""
+    statement = normalize_statement(query)
+    metrics.observe('db_query_duration_seconds', (statement,), seconds)
+    if rows and rows > 0:
+        metrics.inc('db_query_rows_total', (statement,), rows)
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add('db', seconds)
+        timer.queries += 1
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        endpoint = timer.endpoint if timer is not None else '-'
+        print(f"🐢 Slow query {seconds * 1000:.1f} ms ({rows} rows, {endpoint}): {statement}")
+
+def record_checkout(seconds):
+    metrics.observe('db_checkout_duration_seconds', (), seconds)
+    add_span('db_connect', seconds)
+
+# ======================
+# REQUESTS
+# ======================
+
+def start_request(endpoint):
+    """Begin timing a request; returns a token for finish_request"""
+    return _current_timer.set(RequestTimer(endpoint))
+
+def finish_request(token, method, status):
+    """Record the request's metrics; returns (timer, total seconds)"""
+    timer = _current_timer.get()
+    _current_timer.reset(token)
+    total = time.perf_counter() - timer.started
+    metrics.inc('http_requests_total', (method, timer.endpoint, str(status)))
+    metrics.observe('http_request_duration_seconds', (timer.endpoint,), total)
+    for name, seconds in timer.spans.items():
+        metrics.inc('http_request_span_seconds_total', (timer.endpoint, name), seconds)
+    return timer, total
+
+def timed_json_provider(base):
+    """Subclass of a Flask/Quart JSON provider that times dumps() as 'serialize'"""
+    class TimedJSONProvider(base):
+        def dumps(self, obj, **kwargs):
+            with span('serialize'):
+                return super().dumps(obj, **kwargs)
+    return TimedJSONProvider
+
+def render_metrics(stats=None):
+    """Prometheus exposition text; stats is {component: {name: number}} exported as gauges"""
+    worker = str(os.getpid())
+    lines = metrics.render(worker)
+    if stats:
+        lines.append('# HELP attendance_component_stat Pool and cache statistics')
+        lines.append('# TYPE attendance_component_stat gauge')
+        for component, values in stats.items():
+            for name, value in _flatten(values or {}):
+                lines.append(f'attendance_component_stat{{component="{_escape(component)}",'
+                             f'stat="{_escape(name)}",worker="{worker}"}} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+def _flatten(values, prefix=''):
+    for name, value in values.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{prefix}{name}_')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield prefix + name, value
+
+def instrument_flask(app):
+    """Request spans, Server-Timing headers and JSON timing for a Flask app"""
+    from flask import g, request
+
+    # Wraps whichever provider the app already uses (see serialization.py)
+    app.json = timed_json_provider(type(app.json))(app)
+
+    @app.before_request
+    def _start_timer():
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.instrumentation_token = start_request(rule)
+
+    @app.after_request
+    def _finish_timer(response):
+        token = g.pop('instrumentation_token', None)
+        if token is not None:
+            timer, total = finish_request(token, request.method, response.status_code)
+            response.headers['Server-Timing'] = timer.server_timing(total)
+        return response
+
+def instrument_quart(app):
+    """Async counterpart of instrument_flask (hooks must be coroutines to share the request context)"""
+    from quart import g, request
+
+    # Wraps whichever provider the app already uses (see serialization.py)
+    app.json = timed_json_provider(type(app.json))(app)
+
+    @app.before_request
+    async def _start_timer():
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.instrumentation_token = start_request(rule)
+
+    @app.after_request
+    async def _finish_timer(response):
+        token = g.pop('instrumentation_token', None)
+        if token is not None:
+            timer, total = finish_request(token, request.method, response.status_code)
+            response.headers['Server-Timing'] = timer.server_timing(total)
+        return response
@@ -0,0 +1,375 @@
+"""Live attendance feed: PostgreSQL LISTEN/NOTIFY fanned out as server-sent events.
+
+Triggers on the attendance tables (migrations 9 and 10) NOTIFY the
+'attendance_events' channel (one per school schema, see notify_channel)
+with the changed teacher rows and the day's totals of every section a
+roll-call touched. Each worker process keeps one dedicated listening
+connection per school in a background thread and hands the events to its
+connected dashboards, so a dashboard receives small deltas instead of
+re-fetching history and stats.
+
+Event ids carry a per-process prefix. A client that reconnects with a
+Last-Event-ID from this process replays what it missed from a short
+buffer; otherwise (another worker, buffer overrun, listener reconnect)
+it is sent a 'resync' event and should reload its data once.
+"""
+import os
+import json
+import time
+import uuid
+import select
+import threading
+from collections import deque
+import psycopg2
+from psycopg2 import extensions
+from database import DATABASE_URL, SQLITE
+from tenants import TenantLocal, get_tenant
+
+LIVE_CHANNEL = 'attendance_events'
+# Streams held open per worker process (each holds a thread in sync mode)
+LIVE_MAX_SUBSCRIBERS = int(os.environ.get('LIVE_MAX_SUBSCRIBERS', '100'))
+LIVE_HEARTBEAT_SECONDS = float(os.environ.get('LIVE_HEARTBEAT_SECONDS', '15'))
+# Streams are closed after this long (or when the token expires) and the
+# client reconnects, which re-checks its token
+LIVE_STREAM_MAX_SECONDS = float(os.environ.get('LIVE_STREAM_MAX_SECONDS', '900'))
+# Events queued for one slow client before it is told to resync instead
+LIVE_SUBSCRIBER_QUEUE = int(os.environ.get('LIVE_SUBSCRIBER_QUEUE', '500'))
+LIVE_REPLAY_EVENTS = int(os.environ.get('LIVE_REPLAY_EVENTS', '1000'))
+LIVE_RETRY_MS = 3000
+LIVE_MAX_RECONNECT_DELAY = 30.0
+
+def notify_channel(schema):
+    """Channel the attendance triggers in schema NOTIFY (migration 10)"""
+    return LIVE_CHANNEL if schema in (None, 'public') else f'{LIVE_CHANNEL}_{schema}'
+
+class LiveFeedFull(Exception):
+    """LIVE_MAX_SUBSCRIBERS streams are already open in this process"""
+
+class LiveFeedUnavailable(Exception):
+    """The database can't NOTIFY (SQLite), so there is no feed to subscribe to"""
+
+def stats_delta(row):
+    """Change to the dashboard status counts caused by one employee event"""
+    delta = {}
+    if row['old_status']:
+        delta[row['old_status']] = -1
+    elif row['counted_missing']:
+        delta['Absent'] = -1
+    if row['status']:
+        delta[row['status']] = delta.get(row['status'], 0) + 1
+    return {status: change for status, change in delta.items() if change}
+
+def notification_events(payload):
+    """[(event name, data)] for one NOTIFY payload"""
+    message = json.loads(payload)
+    if message['kind'] == 'employee':
+        events = []
+        for row in message['rows']:
+            delta = stats_delta(row)
+            del row['old_status'], row['counted_missing']
+            events.append(('attendance', {'record': row, 'stats_delta': delta}))
+        return events
+    if message['kind'] == 'student':
+        return [('roll_call', section) for section in message['sections']]
+    return []
+
+def format_event(name, data, event_id=None):
+    """One server-sent event frame"""
+    lines = []
+    if event_id:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {name}')
+    lines.append('data: ' + json.dumps(data, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+HEARTBEAT_FRAME = ': ping\n\n'
+
+class Subscription:
+    """One connected dashboard: the events it may see, queued for its stream.
+
+    The stream sets `wake`, which the listener thread calls whenever
+    events are queued: a threading.Event for a WSGI stream, an
+    asyncio.Event set through call_soon_threadsafe for an ASGI one.
+    """
+
+    def __init__(self, role, user_id, grade):
+        self.role = role
+        self.user_id = user_id
+        self.grade = grade
+        self.feed = None
+        self.wake = lambda: None
+        self.events = deque()
+        self.overflowed = False
+        self.closed = False
+        self.drained_at = time.monotonic()
+
+    def visible(self, name, data):
+        if self.role == 'admin' or name == 'resync':
+            return True
+        if name == 'attendance':
+            return data['record']['user_id'] == self.user_id
+        if name == 'roll_call':
+            return data['grade'] == self.grade
+        return False
+
+    def push(self, frame):
+        if len(self.events) >= LIVE_SUBSCRIBER_QUEUE:
+            self.overflowed = True
+        else:
+            self.events.append(frame)
+        self.wake()
+
+    def drain(self):
+        """Frames queued since the last call; a lone resync after an overflow"""
+        self.drained_at = time.monotonic()
+        if self.overflowed:
+            self.overflowed = False
+            self.events.clear()
+            return [format_event('resync', {'reason': 'overflow'})]
+        frames = []
+        while self.events:
+            frames.append(self.events.popleft())
+        return frames
+
+class LiveFeed:
+    """This process's LISTEN connection and the dashboards it feeds.
+
+    The listener thread is started by the first subscriber and reconnects
+    with backoff if the connection drops; events sent while it was down
+    are lost, so every subscriber is told to resync.
+    """
+
+    def __init__(self, dsn, channel=LIVE_CHANNEL, max_subscribers=100, replay_events=1000):
+        self.dsn = dsn
+        self.channel = channel
+        self.max_subscribers = max_subscribers
+        self.prefix = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._replay = deque(maxlen=replay_events)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._conn = None
+        self._stopped = threading.Event()
+        self._counters = {'notifications': 0, 'events': 0, 'reconnects': 0, 'overflows': 0, 'rejected': 0, 'pruned': 0}
+        self._last_error = None
+
+    def subscribe(self, role, user_id, grade, last_event_id=None):
+        """Register a dashboard; raises LiveFeedFull at max_subscribers"""
+        subscription = Subscription(role, user_id, grade)
+        subscription.feed = self
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self._counters['rejected'] += 1
+                raise LiveFeedFull(f"{self.max_subscribers} live streams already open")
+            if last_event_id:
+                self._replay_since(subscription, last_event_id)
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='live-feed-listener', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def _replay_since(self, subscription, last_event_id):
+        prefix, _, seq = last_event_id.partition('-')
+        try:
+            seq = int(seq)
+        except ValueError:
+            seq = -1
+        oldest = self._replay[0][0] if self._replay else self._seq + 1
+        if prefix != self.prefix or seq < oldest - 1 or seq > self._seq:
+            subscription.push(format_event('resync', {'reason': 'unknown_event_id'}))
+            return
+        for event_seq, name, data, frame in self._replay:
+            if event_seq > seq and subscription.visible(name, data):
+                subscription.push(frame)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def prune(self, idle_after):
+        """Drop subscriptions whose stream stopped draining (never started, or its client vanished)"""
+        cutoff = time.monotonic() - idle_after
+        with self._lock:
+            stale = [s for s in self._subscribers if s.drained_at < cutoff]
+            for subscription in stale:
+                subscription.closed = True
+                self._subscribers.discard(subscription)
+            self._counters['pruned'] += len(stale)
+
+    def publish(self, name, data):
+        with self._lock:
+            self._seq += 1
+            frame = format_event(name, data, f'{self.prefix}-{self._seq}')
+            self._replay.append((self._seq, name, data, frame))
+            self._counters['events'] += 1
+            for subscription in self._subscribers:
+                if subscription.visible(name, data):
+                    if subscription.overflowed:
+                        continue
+                    subscription.push(frame)
+                    if subscription.overflowed:
+                        self._counters['overflows'] += 1
+
+    def _broadcast_resync(self, reason):
+        frame = format_event('resync', {'reason': reason})
+        with self._lock:
+            # Replayed ids from before the gap would hide it
+            self._replay.clear()
+            for subscription in self._subscribers:
+                subscription.push(frame)
+
+    def _listen(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.channel}')
+        self._conn = conn
+        return conn
+
+    def _run(self):
+        delay = 1.0
+        connected_before = False
+        while not self._stopped.is_set():
+            try:
+                conn = self._listen()
+                if connected_before:
+                    self._counters['reconnects'] += 1
+                    self._broadcast_resync('listener_reconnected')
+                connected_before = True
+                delay = 1.0
+                self._last_error = None
+                while not self._stopped.is_set():
+                    # Live streams drain at least once per heartbeat
+                    self.prune(LIVE_HEARTBEAT_SECONDS * 3)
+                    if select.select([conn], [], [], LIVE_HEARTBEAT_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._counters['notifications'] += 1
+                        try:
+                            events = notification_events(notify.payload)
+                        except (ValueError, KeyError) as e:
+                            print(f"⚠️  Unreadable live feed notification: {e}")
+                            continue
+                        for name, data in events:
+                            self.publish(name, data)
+            except Exception as e:
+                self._last_error = str(e)
+                if self._stopped.is_set():
+                    break
+                print(f"⚠️  Live feed listener failed, reconnecting in {delay:g}s: {e}")
+                self._stopped.wait(delay)
+                delay = min(delay * 2, LIVE_MAX_RECONNECT_DELAY)
+            finally:
+                if self._conn is not None:
+                    try:
+                        self._conn.close()
+                    except Exception:
+                        pass
+                    self._conn = None
+
+    def close(self):
+        self._stopped.set()
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'max_subscribers': self.max_subscribers,
+                'listening': self._conn is not None,
+                'last_error': self._last_error,
+                **self._counters
+            }
+
+def _new_feed(tenant):
+    config = get_tenant(tenant)
+    return LiveFeed(config.database_url if config else DATABASE_URL,
+                    channel=notify_channel(config.schema if config else None),
+                    max_subscribers=LIVE_MAX_SUBSCRIBERS, replay_events=LIVE_REPLAY_EVENTS)
+
+# One feed (and listener) per school
+_feeds = TenantLocal(_new_feed)
+
+def _reset_feed_after_fork():
+    # The listener threads and their connections stay with the parent
+    global _feeds
+    _feeds = TenantLocal(_new_feed)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_feed_after_fork)
+
+def get_live_feed():
+    """The current school's feed in this process"""
+    if SQLITE:
+        raise LiveFeedUnavailable('Live updates need a PostgreSQL database')
+    return _feeds.instance()
+
+def live_feed_stats():
+    return _feeds.stats()
+
+def stream_deadline(token_payload):
+    """time.monotonic() at which a stream for this token should end"""
+    remaining = LIVE_STREAM_MAX_SECONDS
+    if token_payload.get('exp'):
+        remaining = min(remaining, token_payload['exp'] - time.time())
+    return time.monotonic() + max(remaining, 0)
+
+def sse_stream(subscription, deadline):
+    """Frames for a threaded (WSGI) response; the subscription is dropped when the client goes away"""
+    feed = subscription.feed
+    wakeup = threading.Event()
+    subscription.wake = wakeup.set
+    try:
+        yield f'retry: {LIVE_RETRY_MS}\n\n'
+        while True:
+            frames = subscription.drain()
+            if frames:
+                yield ''.join(frames)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or subscription.closed:
+                return
+            if not wakeup.wait(min(LIVE_HEARTBEAT_SECONDS, remaining)):
+                yield HEARTBEAT_FRAME
+            wakeup.clear()
+    finally:
+        feed.unsubscribe(subscription)
+
+async def sse_stream_async(subscription, deadline):
+    """Async counterpart of sse_stream for the ASGI app"""
+    import asyncio
+    feed = subscription.feed
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+
+    def wake():
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            # Loop already closed; the finally below drops the subscription
+            pass
+
+    subscription.wake = wake
+    try:
+        yield f'retry: {LIVE_RETRY_MS}\n\n'.encode()
+        while True:
+            frames = subscription.drain()
+            if frames:
+                yield ''.join(frames).encode()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or subscription.closed:
+                return
+            try:
+                await asyncio.wait_for(wakeup.wait(), min(LIVE_HEARTBEAT_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                yield HEARTBEAT_FRAME.encode()
+            wakeup.clear()
+    finally:
+        feed.unsubscribe(subscription)
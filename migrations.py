@@ -0,0 +1,955 @@
+import re
+import sys
+import json
+from sqlite_backend import SQLiteConnection
+
+def _employee_event_sql(old_status, counted_missing):
+    """Live feed row for new_rows n / users u: the record as the history
+    endpoint returns it, its previous status, and whether the teacher was
+    being counted as absent for having no record that day"""
+    return f'''json_build_object(
+                        'id', n.id, 'user_id', n.user_id, 'date', n.date,
+                        'check_in', to_char(n.check_in, 'HH24:MI'), 'check_out', to_char(n.check_out, 'HH24:MI'),
+                        'status', n.status, 'remarks', n.remarks, 'recorded_by', n.recorded_by,
+                        'recorded_at', n.recorded_at, 'name', u.name, 'teacher_grade', u.grade,
+                        'old_status', {old_status}, 'counted_missing', {counted_missing})'''
+
+# An inserted row ends a day the stats counted as absent (no record yet)
+_COUNTED_MISSING_SQL = '''u.is_active AND (u.activated_at IS NULL OR u.activated_at::date <= n.date)
+                        AND COALESCE(c.is_working_day, EXTRACT(ISODOW FROM n.date) < 6)'''
+
+def _notify_employee_function(channel, counted_missing=_COUNTED_MISSING_SQL):
+    """notify_employee_attendance(): changed teacher rows, 16 per NOTIFY on channel (an SQL expression)"""
+    return f'''
+        CREATE OR REPLACE FUNCTION notify_employee_attendance() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM pg_notify({channel}, json_build_object('kind', 'employee', 'rows', json_agg(event))::text)
+                FROM (
+                    SELECT (row_number() OVER () - 1) / 16 AS chunk, {_employee_event_sql('NULL', counted_missing)} AS event
+                    FROM new_rows n
+                    JOIN users u ON u.id = n.user_id AND u.role = 'teacher'
+                    LEFT JOIN school_calendar c ON c.date = n.date
+                ) changed
+                GROUP BY chunk;
+            ELSE
+                -- Re-scans that change nothing visible are skipped
+                PERFORM pg_notify({channel}, json_build_object('kind', 'employee', 'rows', json_agg(event))::text)
+                FROM (
+                    SELECT (row_number() OVER () - 1) / 16 AS chunk, {_employee_event_sql('o.status', 'FALSE')} AS event
+                    FROM new_rows n
+                    JOIN old_rows o ON o.id = n.id
+                    JOIN users u ON u.id = n.user_id AND u.role = 'teacher'
+                    WHERE (n.check_in, n.check_out, n.status, n.remarks)
+                          IS DISTINCT FROM (o.check_in, o.check_out, o.status, o.remarks)
+                ) changed
+                GROUP BY chunk;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        '''
+
+def _notify_student_function(channel):
+    """notify_student_attendance(): the day's totals of each touched section, 40 per NOTIFY"""
+    return f'''
+        CREATE OR REPLACE FUNCTION notify_student_attendance() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify({channel}, json_build_object('kind', 'student', 'sections', json_agg(section))::text)
+            FROM (
+                SELECT (row_number() OVER () - 1) / 40 AS chunk, json_build_object(
+                    'date', t.date, 'grade', t.grade, 'section', t.section,
+                    'present', COUNT(*) FILTER (WHERE sa.is_present),
+                    'absent', COUNT(*) FILTER (WHERE NOT sa.is_present)
+                ) AS section
+                FROM (
+                    SELECT DISTINCT n.date, s.grade, s.section
+                    FROM new_rows n JOIN students s ON s.id = n.student_id
+                ) t
+                JOIN students s ON s.is_active = TRUE AND s.grade = t.grade AND s.section = t.section
+                JOIN student_attendance sa ON sa.student_id = s.id AND sa.date = t.date
+                GROUP BY t.date, t.grade, t.section
+            ) changed
+            GROUP BY chunk;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        '''
+
+# Days a student attendance bitmap covers: a term is at most a year (bitmaps.py)
+STUDENT_BITMAP_DAYS = 368
+
+# Weekdays as bits of a shift policy's workdays, Monday = bit 0 (ISODOW - 1)
+MONDAY_TO_FRIDAY = 0b0011111
+
+# Working weekdays of a teacher (users u): those of their own shift policy,
+# else their grade's, else the school's, else Monday to Friday (shifts.py)
+TEACHER_WORKDAYS_SQL = f'''COALESCE((SELECT workdays FROM shift_policies WHERE id = COALESCE(
+                 (SELECT policy_id FROM shift_assignments WHERE user_id = u.id),
+                 (SELECT policy_id FROM shift_assignments WHERE grade = u.grade),
+                 (SELECT policy_id FROM shift_assignments WHERE grade IS NULL AND user_id IS NULL))), {MONDAY_TO_FRIDAY})'''
+
+_COUNTED_MISSING_SHIFTS_SQL = f'''u.is_active AND (u.activated_at IS NULL OR u.activated_at::date <= n.date)
+                        AND COALESCE(c.is_working_day, ({TEACHER_WORKDAYS_SQL} >> (EXTRACT(ISODOW FROM n.date)::int - 1)) & 1 = 1)'''
+
+# Each school's schema notifies its own channel (live.notify_channel)
+_SCHEMA_CHANNEL_SQL = "CASE WHEN TG_TABLE_SCHEMA = 'public' THEN 'attendance_events' ELSE 'attendance_events_' || TG_TABLE_SCHEMA END"
+
+# Versioned schema migrations, applied in order by migrate().
+# Each entry is (version, description, [SQL statements]). Never edit a
+# migration that has shipped - append a new one instead.
+MIGRATIONS = [
+    (1, 'Base schema: users, students, attendance tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            user_id TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL CHECK (role IN ('admin', 'teacher')),
+            name TEXT NOT NULL,
+            grade TEXT,
+            email TEXT,
+            phone TEXT,
+            address TEXT,
+            is_active BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            activated_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS students (
+            id SERIAL PRIMARY KEY,
+            student_id TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            grade TEXT NOT NULL,
+            section TEXT NOT NULL,
+            parent_name TEXT,
+            parent_contact TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER NOT NULL,
+            FOREIGN KEY (created_by) REFERENCES users(id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS employee_attendance (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            check_in TIME,
+            check_out TIME,
+            status TEXT CHECK (status IN ('Present', 'Absent', 'Late', 'Early', 'Leave')),
+            remarks TEXT,
+            recorded_by INTEGER,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (recorded_by) REFERENCES users(id) ON DELETE SET NULL,
+            UNIQUE (user_id, date)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS student_attendance (
+            id SERIAL PRIMARY KEY,
+            student_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            is_present BOOLEAN NOT NULL,
+            recorded_by INTEGER NOT NULL,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE,
+            FOREIGN KEY (recorded_by) REFERENCES users(id) ON DELETE CASCADE,
+            UNIQUE (student_id, date)
+        )
+        '''
+    ]),
+    (2, 'Indexes for attendance history, rosters and stats', [
+        # get_employee_attendance: newest-first history, optionally for one date
+        '''
+        CREATE INDEX IF NOT EXISTS idx_employee_attendance_date_check_in
+        ON employee_attendance (date DESC, check_in DESC)
+        ''',
+        # get_attendance_stats for one teacher: index-only GROUP BY status
+        '''
+        CREATE INDEX IF NOT EXISTS idx_employee_attendance_user_status
+        ON employee_attendance (user_id, status)
+        ''',
+        # Teacher lookups by grade (history grade filter, roster permission checks)
+        '''
+        CREATE INDEX IF NOT EXISTS idx_users_teacher_grade
+        ON users (grade) INCLUDE (name)
+        WHERE role = 'teacher'
+        ''',
+        # get_students_by_grade_section: active roster, already sorted by name
+        '''
+        CREATE INDEX IF NOT EXISTS idx_students_active_roster
+        ON students (grade, section, name) INCLUDE (id, student_id, parent_contact)
+        WHERE is_active = TRUE
+        '''
+    ]),
+    (3, 'Keyset pagination index for attendance history', [
+        # (date, check_in, id) is the keyset of get_employee_attendance pages
+        'DROP INDEX IF EXISTS idx_employee_attendance_date_check_in',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_employee_attendance_keyset
+        ON employee_attendance (date DESC, check_in DESC, id DESC)
+        '''
+    ]),
+    (4, 'Daily/monthly attendance rollups and the working-day calendar', [
+        # Teacher attendance per day, grade and status (admin dashboards)
+        '''
+        CREATE TABLE IF NOT EXISTS employee_attendance_daily (
+            date DATE NOT NULL,
+            grade TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (date, grade, status)
+        )
+        ''',
+        # Attendance per teacher, month and status (teacher dashboards, reports)
+        '''
+        CREATE TABLE IF NOT EXISTS employee_attendance_monthly (
+            month DATE NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, status)
+        )
+        ''',
+        # Overrides to the Monday-Friday default: holidays, make-up Saturdays
+        '''
+        CREATE TABLE IF NOT EXISTS school_calendar (
+            date DATE PRIMARY KEY,
+            is_working_day BOOLEAN NOT NULL,
+            description TEXT
+        )
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION employee_attendance_rollup() RETURNS trigger AS $$
+        DECLARE
+            teacher RECORD;
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status IS NOT NULL THEN
+                SELECT COALESCE(grade, '') AS grade, role INTO teacher FROM users WHERE id = OLD.user_id;
+                IF FOUND AND teacher.role = 'teacher' THEN
+                    UPDATE employee_attendance_daily SET count = count - 1
+                    WHERE date = OLD.date AND grade = teacher.grade AND status = OLD.status;
+                    UPDATE employee_attendance_monthly SET count = count - 1
+                    WHERE user_id = OLD.user_id AND month = date_trunc('month', OLD.date)::date AND status = OLD.status;
+                END IF;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status IS NOT NULL THEN
+                SELECT COALESCE(grade, '') AS grade, role INTO teacher FROM users WHERE id = NEW.user_id;
+                IF FOUND AND teacher.role = 'teacher' THEN
+                    INSERT INTO employee_attendance_daily (date, grade, status, count)
+                    VALUES (NEW.date, teacher.grade, NEW.status, 1)
+                    ON CONFLICT (date, grade, status) DO UPDATE SET count = employee_attendance_daily.count + 1;
+                    INSERT INTO employee_attendance_monthly (month, user_id, status, count)
+                    VALUES (date_trunc('month', NEW.date)::date, NEW.user_id, NEW.status, 1)
+                    ON CONFLICT (user_id, month, status) DO UPDATE SET count = employee_attendance_monthly.count + 1;
+                END IF;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+        'DROP TRIGGER IF EXISTS employee_attendance_rollup_write ON employee_attendance',
+        'DROP TRIGGER IF EXISTS employee_attendance_rollup_update ON employee_attendance',
+        '''
+        CREATE TRIGGER employee_attendance_rollup_write
+        AFTER INSERT OR DELETE ON employee_attendance
+        FOR EACH ROW EXECUTE FUNCTION employee_attendance_rollup()
+        ''',
+        # Scans that only touch check_in/check_out leave the rollups alone
+        '''
+        CREATE TRIGGER employee_attendance_rollup_update
+        AFTER UPDATE ON employee_attendance
+        FOR EACH ROW
+        WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.date IS DISTINCT FROM NEW.date
+              OR OLD.user_id IS DISTINCT FROM NEW.user_id)
+        EXECUTE FUNCTION employee_attendance_rollup()
+        ''',
+        # Backfill from existing history
+        'DELETE FROM employee_attendance_daily',
+        'DELETE FROM employee_attendance_monthly',
+        '''
+        INSERT INTO employee_attendance_daily (date, grade, status, count)
+        SELECT ea.date, COALESCE(u.grade, ''), ea.status, COUNT(*)
+        FROM employee_attendance ea
+        JOIN users u ON ea.user_id = u.id
+        WHERE u.role = 'teacher' AND ea.status IS NOT NULL
+        GROUP BY ea.date, COALESCE(u.grade, ''), ea.status
+        ''',
+        '''
+        INSERT INTO employee_attendance_monthly (month, user_id, status, count)
+        SELECT date_trunc('month', ea.date)::date, ea.user_id, ea.status, COUNT(*)
+        FROM employee_attendance ea
+        JOIN users u ON ea.user_id = u.id
+        WHERE u.role = 'teacher' AND ea.status IS NOT NULL
+        GROUP BY date_trunc('month', ea.date), ea.user_id, ea.status
+        '''
+    ]),
+    (5, 'Token revocations for deactivated accounts', [
+        # Tokens issued to user_id at or before revoked_at are rejected
+        '''
+        CREATE TABLE IF NOT EXISTS token_revocations (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            revoked_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        ''',
+        # Bumped on every revocation so workers reload the set only when it changed
+        '''
+        CREATE TABLE IF NOT EXISTS auth_revision (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            version BIGINT NOT NULL DEFAULT 0
+        )
+        ''',
+        'INSERT INTO auth_revision (id, version) VALUES (TRUE, 0) ON CONFLICT DO NOTHING',
+        '''
+        CREATE OR REPLACE FUNCTION revoke_user_tokens() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO token_revocations (user_id, revoked_at) VALUES (NEW.id, now())
+            ON CONFLICT (user_id) DO UPDATE SET revoked_at = EXCLUDED.revoked_at;
+            UPDATE auth_revision SET version = version + 1;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+        'DROP TRIGGER IF EXISTS users_revoke_tokens ON users',
+        '''
+        CREATE TRIGGER users_revoke_tokens
+        AFTER UPDATE OF is_active ON users
+        FOR EACH ROW
+        WHEN (OLD.is_active AND NOT NEW.is_active)
+        EXECUTE FUNCTION revoke_user_tokens()
+        '''
+    ]),
+    (6, 'Scan log for idempotent kiosk batch sync', [
+        '''
+        CREATE TABLE IF NOT EXISTS attendance_scans (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            scanned_at TIMESTAMP NOT NULL,
+            kiosk_id TEXT,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, scanned_at)
+        )
+        '''
+    ]),
+    (7, 'Roster versions for cache invalidation', [
+        'CREATE SEQUENCE IF NOT EXISTS roster_version_seq',
+        # Last change to each grade/section roster; workers poll for rows newer than they've seen
+        '''
+        CREATE TABLE IF NOT EXISTS roster_versions (
+            grade TEXT NOT NULL,
+            section TEXT NOT NULL,
+            version BIGINT NOT NULL,
+            PRIMARY KEY (grade, section)
+        )
+        ''',
+        # Statement-level, so a bulk import bumps each section once
+        '''
+        CREATE OR REPLACE FUNCTION bump_roster_versions() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO roster_versions (grade, section, version)
+                SELECT grade, section, nextval('roster_version_seq')
+                FROM (SELECT DISTINCT grade, section FROM new_rows) changed
+                ON CONFLICT (grade, section) DO UPDATE SET version = EXCLUDED.version;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                INSERT INTO roster_versions (grade, section, version)
+                SELECT grade, section, nextval('roster_version_seq')
+                FROM (SELECT DISTINCT grade, section FROM old_rows) changed
+                ON CONFLICT (grade, section) DO UPDATE SET version = EXCLUDED.version;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+        'DROP TRIGGER IF EXISTS students_roster_insert ON students',
+        'DROP TRIGGER IF EXISTS students_roster_update ON students',
+        'DROP TRIGGER IF EXISTS students_roster_delete ON students',
+        '''
+        CREATE TRIGGER students_roster_insert
+        AFTER INSERT ON students REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_roster_versions()
+        ''',
+        '''
+        CREATE TRIGGER students_roster_update
+        AFTER UPDATE ON students REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_roster_versions()
+        ''',
+        '''
+        CREATE TRIGGER students_roster_delete
+        AFTER DELETE ON students REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_roster_versions()
+        '''
+    ]),
+    (8, 'Range-partition attendance tables by date', [
+        # Rows are copied into a DEFAULT partition; partitions.ensure_partitions
+        # (run by init_db) then splits them into month or academic-year ranges.
+        # The unique keys include the partition key, so id is no longer a
+        # primary key; it still comes from the original sequence.
+        '''
+        CREATE TABLE employee_attendance_new (
+            id INTEGER NOT NULL DEFAULT nextval('employee_attendance_id_seq'),
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            date DATE NOT NULL,
+            check_in TIME,
+            check_out TIME,
+            status TEXT CHECK (status IN ('Present', 'Absent', 'Late', 'Early', 'Leave')),
+            remarks TEXT,
+            recorded_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) PARTITION BY RANGE (date)
+        ''',
+        'CREATE TABLE employee_attendance_default PARTITION OF employee_attendance_new DEFAULT',
+        '''
+        INSERT INTO employee_attendance_new
+            (id, user_id, date, check_in, check_out, status, remarks, recorded_by, recorded_at)
+        SELECT id, user_id, date, check_in, check_out, status, remarks, recorded_by, recorded_at
+        FROM employee_attendance
+        ''',
+        'ALTER SEQUENCE employee_attendance_id_seq OWNED BY employee_attendance_new.id',
+        'DROP TABLE employee_attendance',
+        'ALTER TABLE employee_attendance_new RENAME TO employee_attendance',
+        'ALTER TABLE employee_attendance RENAME CONSTRAINT employee_attendance_new_status_check TO employee_attendance_status_check',
+        'ALTER TABLE employee_attendance RENAME CONSTRAINT employee_attendance_new_user_id_fkey TO employee_attendance_user_id_fkey',
+        'ALTER TABLE employee_attendance RENAME CONSTRAINT employee_attendance_new_recorded_by_fkey TO employee_attendance_recorded_by_fkey',
+        'ALTER TABLE employee_attendance ADD CONSTRAINT employee_attendance_user_id_date_key UNIQUE (user_id, date)',
+        '''
+        CREATE INDEX idx_employee_attendance_keyset
+        ON employee_attendance (date DESC, check_in DESC, id DESC)
+        ''',
+        'CREATE INDEX idx_employee_attendance_user_status ON employee_attendance (user_id, status)',
+        # Rollups were carried over as-is; the triggers resume from here
+        '''
+        CREATE TRIGGER employee_attendance_rollup_write
+        AFTER INSERT OR DELETE ON employee_attendance
+        FOR EACH ROW EXECUTE FUNCTION employee_attendance_rollup()
+        ''',
+        '''
+        CREATE TRIGGER employee_attendance_rollup_update
+        AFTER UPDATE ON employee_attendance
+        FOR EACH ROW
+        WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.date IS DISTINCT FROM NEW.date
+              OR OLD.user_id IS DISTINCT FROM NEW.user_id)
+        EXECUTE FUNCTION employee_attendance_rollup()
+        ''',
+        '''
+        CREATE TABLE student_attendance_new (
+            id INTEGER NOT NULL DEFAULT nextval('student_attendance_id_seq'),
+            student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+            date DATE NOT NULL,
+            is_present BOOLEAN NOT NULL,
+            recorded_by INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) PARTITION BY RANGE (date)
+        ''',
+        'CREATE TABLE student_attendance_default PARTITION OF student_attendance_new DEFAULT',
+        '''
+        INSERT INTO student_attendance_new (id, student_id, date, is_present, recorded_by, recorded_at)
+        SELECT id, student_id, date, is_present, recorded_by, recorded_at
+        FROM student_attendance
+        ''',
+        'ALTER SEQUENCE student_attendance_id_seq OWNED BY student_attendance_new.id',
+        'DROP TABLE student_attendance',
+        'ALTER TABLE student_attendance_new RENAME TO student_attendance',
+        'ALTER TABLE student_attendance RENAME CONSTRAINT student_attendance_new_student_id_fkey TO student_attendance_student_id_fkey',
+        'ALTER TABLE student_attendance RENAME CONSTRAINT student_attendance_new_recorded_by_fkey TO student_attendance_recorded_by_fkey',
+        'ALTER TABLE student_attendance ADD CONSTRAINT student_attendance_student_id_date_key UNIQUE (student_id, date)'
+    ]),
+    (9, 'NOTIFY attendance changes for the live dashboard feed', [
+        # Statement-level with transition tables: one notification per 16 rows
+        # (payloads are capped at 8000 bytes) instead of one per row
+        _notify_employee_function("'attendance_events'"),
+        # A roll-call is summarized as each touched section's totals for the day
+        _notify_student_function("'attendance_events'"),
+        '''
+        CREATE TRIGGER employee_attendance_notify_insert
+        AFTER INSERT ON employee_attendance REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_employee_attendance()
+        ''',
+        '''
+        CREATE TRIGGER employee_attendance_notify_update
+        AFTER UPDATE ON employee_attendance REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_employee_attendance()
+        ''',
+        '''
+        CREATE TRIGGER student_attendance_notify_insert
+        AFTER INSERT ON student_attendance REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_student_attendance()
+        ''',
+        '''
+        CREATE TRIGGER student_attendance_notify_update
+        AFTER UPDATE ON student_attendance REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_student_attendance()
+        '''
+    ]),
+    (10, 'NOTIFY on a per-schema channel so schools sharing a database stay apart', [
+        _notify_employee_function(_SCHEMA_CHANNEL_SQL),
+        _notify_student_function(_SCHEMA_CHANNEL_SQL)
+    ]),
+    (11, 'Per-student attendance bitmaps by term', [
+        # Bit i is the term's day i: recorded by a roll-call, and present.
+        # Written by the roll-call upsert; init_db fills it from history
+        # (bitmaps.rebuild_student_bitmaps) when this migration is applied.
+        f'''
+        CREATE TABLE IF NOT EXISTS student_attendance_bitmaps (
+            student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+            term_start DATE NOT NULL,
+            recorded BIT({STUDENT_BITMAP_DAYS}) NOT NULL,
+            present BIT({STUDENT_BITMAP_DAYS}) NOT NULL,
+            PRIMARY KEY (student_id, term_start)
+        )
+        '''
+    ]),
+    (12, 'Shift policies per teacher, grade or school, and half-days in the calendar', [
+        # A check-in after check_in_by is Late, a check-out before check_out_from Early
+        f'''
+        CREATE TABLE IF NOT EXISTS shift_policies (
+            id SERIAL PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            check_in_by TIME NOT NULL,
+            check_out_from TIME NOT NULL,
+            workdays SMALLINT NOT NULL DEFAULT {MONDAY_TO_FRIDAY} CHECK (workdays BETWEEN 0 AND 127),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # One row per teacher, per grade, and one (neither set) for the whole school
+        '''
+        CREATE TABLE IF NOT EXISTS shift_assignments (
+            id SERIAL PRIMARY KEY,
+            policy_id INTEGER NOT NULL REFERENCES shift_policies(id) ON DELETE CASCADE,
+            grade TEXT,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            CHECK (grade IS NULL OR user_id IS NULL)
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_shift_assignments_user ON shift_assignments (user_id) WHERE user_id IS NOT NULL',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_shift_assignments_grade ON shift_assignments (grade) WHERE grade IS NOT NULL',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_shift_assignments_school ON shift_assignments ((grade IS NULL))
+        WHERE grade IS NULL AND user_id IS NULL
+        ''',
+        # Everyone follows this policy on the date (a half-day)
+        '''
+        ALTER TABLE school_calendar
+        ADD COLUMN IF NOT EXISTS shift_policy_id INTEGER REFERENCES shift_policies(id) ON DELETE SET NULL
+        ''',
+        # Part-time teachers aren't counted absent on their days off
+        _notify_employee_function(_SCHEMA_CHANNEL_SQL, _COUNTED_MISSING_SHIFTS_SQL)
+    ])
+]
+
+# Migrations that create student_attendance_bitmaps, which init_db then backfills
+STUDENT_BITMAPS_MIGRATION = 11
+SQLITE_STUDENT_BITMAPS_MIGRATION = 2
+
+# The same schema for an embedded SQLite database (sqlite_backend), which
+# starts from scratch rather than from an existing install. Everything but
+# partitioning and the live feed: row triggers replace the statement-level
+# ones, roster versions count up from the table's own maximum, and
+# revocation times are seconds since the epoch.
+_SQLITE_ROLLUP_ADD = """
+            INSERT INTO employee_attendance_daily (date, grade, status, count)
+            SELECT NEW.date, COALESCE(grade, ''), NEW.status, 1 FROM users
+            WHERE id = NEW.user_id AND role = 'teacher' AND NEW.status IS NOT NULL
+            ON CONFLICT (date, grade, status) DO UPDATE SET count = count + 1;
+            INSERT INTO employee_attendance_monthly (month, user_id, status, count)
+            SELECT date(NEW.date, 'start of month'), NEW.user_id, NEW.status, 1 FROM users
+            WHERE id = NEW.user_id AND role = 'teacher' AND NEW.status IS NOT NULL
+            ON CONFLICT (user_id, month, status) DO UPDATE SET count = count + 1;"""
+_SQLITE_ROLLUP_REMOVE = """
+            UPDATE employee_attendance_daily SET count = count - 1
+            WHERE date = OLD.date AND status = OLD.status
+              AND grade = (SELECT COALESCE(grade, '') FROM users WHERE id = OLD.user_id AND role = 'teacher');
+            UPDATE employee_attendance_monthly SET count = count - 1
+            WHERE user_id = OLD.user_id AND month = date(OLD.date, 'start of month') AND status = OLD.status
+              AND EXISTS (SELECT 1 FROM users WHERE id = OLD.user_id AND role = 'teacher');"""
+
+def _sqlite_bump_roster(row):
+    return f"""
+            INSERT INTO roster_versions (grade, section, version)
+            SELECT {row}.grade, {row}.section, COALESCE(MAX(version), 0) + 1 FROM roster_versions WHERE TRUE
+            ON CONFLICT (grade, section) DO UPDATE SET version = excluded.version;"""
+
+SQLITE_MIGRATIONS = [
+    (1, 'Base schema (PostgreSQL migrations 1-10 without partitions and NOTIFY)', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL CHECK (role IN ('admin', 'teacher')),
+            name TEXT NOT NULL,
+            grade TEXT,
+            email TEXT,
+            phone TEXT,
+            address TEXT,
+            is_active BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            activated_at TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER PRIMARY KEY,
+            student_id TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            grade TEXT NOT NULL,
+            section TEXT NOT NULL,
+            parent_name TEXT,
+            parent_contact TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS employee_attendance (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            date DATE NOT NULL,
+            check_in TIME,
+            check_out TIME,
+            status TEXT CHECK (status IN ('Present', 'Absent', 'Late', 'Early', 'Leave')),
+            remarks TEXT,
+            recorded_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (user_id, date)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS student_attendance (
+            id INTEGER PRIMARY KEY,
+            student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+            date DATE NOT NULL,
+            is_present BOOLEAN NOT NULL,
+            recorded_by INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (student_id, date)
+        )
+        ''',
+        # DESC sorts NULLs last in SQLite; the history keyset wants them first
+        # (models.ATTENDANCE_ORDER_SQL)
+        '''
+        CREATE INDEX IF NOT EXISTS idx_employee_attendance_keyset
+        ON employee_attendance (date DESC, check_in IS NULL DESC, check_in DESC, id DESC)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_employee_attendance_user_status
+        ON employee_attendance (user_id, status)
+        ''',
+        # SQLite has no INCLUDE: the covered columns go at the end of the key
+        '''
+        CREATE INDEX IF NOT EXISTS idx_users_teacher_grade
+        ON users (grade, name)
+        WHERE role = 'teacher'
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_students_active_roster
+        ON students (grade, section, name, id, student_id, parent_contact)
+        WHERE is_active = TRUE
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS employee_attendance_daily (
+            date DATE NOT NULL,
+            grade TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (date, grade, status)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS employee_attendance_monthly (
+            month DATE NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, status)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS school_calendar (
+            date DATE PRIMARY KEY,
+            is_working_day BOOLEAN NOT NULL,
+            description TEXT
+        )
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS employee_attendance_rollup_insert
+        AFTER INSERT ON employee_attendance
+        BEGIN{_SQLITE_ROLLUP_ADD}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS employee_attendance_rollup_delete
+        AFTER DELETE ON employee_attendance
+        BEGIN{_SQLITE_ROLLUP_REMOVE}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS employee_attendance_rollup_update
+        AFTER UPDATE ON employee_attendance
+        WHEN OLD.status IS NOT NEW.status OR OLD.date IS NOT NEW.date OR OLD.user_id IS NOT NEW.user_id
+        BEGIN{_SQLITE_ROLLUP_REMOVE}{_SQLITE_ROLLUP_ADD}
+        END
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS token_revocations (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            revoked_at REAL NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS auth_revision (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        'INSERT INTO auth_revision (id, version) VALUES (TRUE, 0) ON CONFLICT DO NOTHING',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_revoke_tokens
+        AFTER UPDATE OF is_active ON users
+        WHEN OLD.is_active AND NOT NEW.is_active
+        BEGIN
+            INSERT INTO token_revocations (user_id, revoked_at)
+            VALUES (NEW.id, (julianday('now') - 2440587.5) * 86400.0)
+            ON CONFLICT (user_id) DO UPDATE SET revoked_at = excluded.revoked_at;
+            UPDATE auth_revision SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS attendance_scans (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            scanned_at TIMESTAMP NOT NULL,
+            kiosk_id TEXT,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, scanned_at)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS roster_versions (
+            grade TEXT NOT NULL,
+            section TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (grade, section)
+        )
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS students_roster_insert
+        AFTER INSERT ON students
+        BEGIN{_sqlite_bump_roster('NEW')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS students_roster_update
+        AFTER UPDATE ON students
+        BEGIN{_sqlite_bump_roster('OLD')}{_sqlite_bump_roster('NEW')}
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS students_roster_delete
+        AFTER DELETE ON students
+        BEGIN{_sqlite_bump_roster('OLD')}
+        END
+        '''
+    ]),
+    (2, 'Per-student attendance bitmaps by term', [
+        # The bits as '0'/'1' text: SQLite has no bit strings
+        '''
+        CREATE TABLE IF NOT EXISTS student_attendance_bitmaps (
+            student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+            term_start DATE NOT NULL,
+            recorded TEXT NOT NULL,
+            present TEXT NOT NULL,
+            PRIMARY KEY (student_id, term_start)
+        )
+        '''
+    ]),
+    (3, 'Shift policies per teacher, grade or school, and half-days in the calendar', [
+        f'''
+        CREATE TABLE IF NOT EXISTS shift_policies (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            check_in_by TIME NOT NULL,
+            check_out_from TIME NOT NULL,
+            workdays SMALLINT NOT NULL DEFAULT {MONDAY_TO_FRIDAY} CHECK (workdays BETWEEN 0 AND 127),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS shift_assignments (
+            id INTEGER PRIMARY KEY,
+            policy_id INTEGER NOT NULL REFERENCES shift_policies(id) ON DELETE CASCADE,
+            grade TEXT,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            CHECK (grade IS NULL OR user_id IS NULL)
+        )
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_shift_assignments_user ON shift_assignments (user_id) WHERE user_id IS NOT NULL',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_shift_assignments_grade ON shift_assignments (grade) WHERE grade IS NOT NULL',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_shift_assignments_school ON shift_assignments ((grade IS NULL))
+        WHERE grade IS NULL AND user_id IS NULL
+        ''',
+        'ALTER TABLE school_calendar ADD COLUMN shift_policy_id INTEGER REFERENCES shift_policies(id) ON DELETE SET NULL'
+    ])
+]
+
+# Arbitrary constant identifying the migration advisory lock
+MIGRATION_LOCK_ID = 724310
+
+def migrate(conn, schema=None):
+    """Apply pending migrations in one transaction; returns the versions applied.
+
+    An advisory lock serializes gunicorn workers that start at the same
+    time, so each migration runs exactly once. With schema (a school's, on
+    a connection whose search_path is set to it) the schema is created
+    first and everything, schema_migrations included, lands in it. A
+    SQLite database takes its write lock instead and gets SQLITE_MIGRATIONS.
+    """
+    sqlite = isinstance(conn, SQLiteConnection)
+    cursor = conn.cursor()
+    if sqlite:
+        conn.begin_immediate()
+    else:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_ID,))
+    if schema:
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {schema}')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('SELECT version FROM schema_migrations')
+    applied = {row['version'] for row in cursor.fetchall()}
+
+    newly_applied = []
+    for version, description, statements in SQLITE_MIGRATIONS if sqlite else MIGRATIONS:
+        if version in applied:
+            continue
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute(
+            'INSERT INTO schema_migrations (version, description) VALUES (%s, %s)',
+            (version, description)
+        )
+        newly_applied.append(version)
+
+    conn.commit()
+    return newly_applied
+
+# Representative hot-path queries and the index each one should use
+INDEX_CHECKS = [
+    ('employee history (all)', 'idx_employee_attendance_keyset', '''
+        SELECT ea.*, u.name, u.grade AS teacher_grade
+        FROM employee_attendance ea
+        JOIN users u ON ea.user_id = u.id
+        WHERE u.role = 'teacher'
+        ORDER BY ea.date DESC, ea.check_in DESC, ea.id DESC LIMIT 101
+    ''', ()),
+    ('employee history (one date)', 'idx_employee_attendance_keyset', '''
+        SELECT ea.*, u.name, u.grade AS teacher_grade
+        FROM employee_attendance ea
+        JOIN users u ON ea.user_id = u.id
+        WHERE u.role = 'teacher' AND ea.date = %s
+        ORDER BY ea.date DESC, ea.check_in DESC, ea.id DESC LIMIT 101
+    ''', ('2024-01-01',)),
+    ('employee history (next page)', 'idx_employee_attendance_keyset', '''
+        SELECT ea.*, u.name, u.grade AS teacher_grade
+        FROM employee_attendance ea
+        JOIN users u ON ea.user_id = u.id
+        WHERE u.role = 'teacher' AND ea.date <= %s
+          AND (ea.date < %s OR (ea.check_in < %s OR (ea.check_in = %s AND ea.id < %s)))
+        ORDER BY ea.date DESC, ea.check_in DESC, ea.id DESC LIMIT 101
+    ''', ('2024-01-01', '2024-01-01', '09:00', '09:00', 1000)),
+    ('roster by grade/section', 'idx_students_active_roster', '''
+        SELECT id, student_id, name, grade, section, parent_contact
+        FROM students
+        WHERE is_active = TRUE AND grade = %s AND section = %s
+        ORDER BY name
+    ''', ('1', 'A')),
+    ('teacher attendance stats', 'idx_employee_attendance_user_status', '''
+        SELECT status, COUNT(*) AS count
+        FROM employee_attendance ea
+        JOIN users u ON ea.user_id = u.id
+        WHERE u.role = 'teacher' AND ea.user_id = %s
+        GROUP BY status
+    ''', (1,))
+]
+
+def _plan_indexes(plan):
+    found = set()
+    if 'Index Name' in plan:
+        found.add(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        found |= _plan_indexes(child)
+    return found
+
+_SQLITE_PLAN_INDEX_RE = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+
+def _check_sqlite_indexes(conn):
+    # SQLite's planner has no seqscan switch; it favours a matching index anyway
+    cursor = conn.cursor()
+    results = []
+    for name, index, query, params in INDEX_CHECKS:
+        # History in SQLite's order (models.ATTENDANCE_ORDER_SQL)
+        query = query.replace('ea.check_in DESC,', 'ea.check_in IS NULL DESC, ea.check_in DESC,')
+        cursor.execute('EXPLAIN QUERY PLAN ' + query, params)
+        used = {m.group(1) for row in cursor.fetchall() for m in _SQLITE_PLAN_INDEX_RE.finditer(row['detail'])}
+        results.append({'query': name, 'index': index, 'used': index in used, 'plan_indexes': sorted(used)})
+    return results
+
+def check_indexes(conn, force_index_paths=True):
+    """EXPLAIN each hot query and report whether its index appears in the plan.
+
+    On small or freshly seeded tables the planner rightly prefers
+    sequential scans, so by default seqscans are disabled for the check
+    transaction: that verifies each index *matches* its access path. Pass
+    force_index_paths=False to see what the planner picks on real data.
+    """
+    if isinstance(conn, SQLiteConnection):
+        return _check_sqlite_indexes(conn)
+    cursor = conn.cursor()
+    results = []
+    try:
+        if force_index_paths:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        # Plans of partitioned tables name each partition's own index
+        cursor.execute('''
+            SELECT c.relname AS child, p.relname AS parent
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid AND c.relkind = 'i'
+            JOIN pg_class p ON p.oid = i.inhparent
+        ''')
+        parent_index = {row['child']: row['parent'] for row in cursor.fetchall()}
+        for name, index, query, params in INDEX_CHECKS:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + query, params)
+            plan = cursor.fetchone()['QUERY PLAN'][0]['Plan']
+            used = {parent_index.get(i, i) for i in _plan_indexes(plan)}
+            results.append({'query': name, 'index': index, 'used': index in used, 'plan_indexes': sorted(used)})
+    finally:
+        conn.rollback()
+    return results
+
+if __name__ == '__main__':
+    from database import get_db_connection
+    from tenants import get_tenant, tenant_context, tenant_keys
+
+    # Every school in turn (just the one database without TENANT_MAP)
+    all_used = True
+    for tenant in tenant_keys():
+        with tenant_context(tenant), get_db_connection() as conn:
+            label = f"{tenant}: " if tenant else ''
+            if '--check' in sys.argv:
+                results = check_indexes(conn, force_index_paths='--planner' not in sys.argv)
+                print(label + json.dumps(results, indent=2))
+                all_used = all_used and all(r['used'] for r in results)
+                continue
+
+            config = get_tenant()
+            versions = migrate(conn, schema=config.schema if config else None)
+            print(f"✅ {label}Applied migrations: {versions}" if versions else f"✅ {label}Schema is up to date")
+    sys.exit(0 if all_used else 1)
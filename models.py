@@ -1,11 +1,17 @@
-import psycopg2
-from datetime import datetime
-from werkzeug.security import generate_password_hash
-from database import get_db_connection
-import qrcode
-from PIL import Image, ImageDraw
-import io
+from datetime import datetime, timedelta
+from database import SQLITE, IntegrityError, get_db_connection
+from passwords import hash_password_offloaded
+from badges import render_badge, BADGE_MIME_TYPES
+from tenants import TenantLocal
+from bitmaps import BITMAP_UPSERT_SQL, SQLITE_BITMAP_UPSERT_SQL, sqlite_bitmap_params, term_start
+from migrations import TEACHER_WORKDAYS_SQL
+from shifts import DEFAULT_SHIFT, parse_minutes, scan_thresholds, shift_status
+import os
+import json
+import time
 import base64
+import hashlib
+import threading
 
 def get_current_date():
     return datetime.now().strftime('%Y-%m-%d')
@@ -13,88 +19,253 @@ def get_current_date():
 def get_current_time():
     return datetime.now().strftime('%H:%M')
 
-def calculate_status(check_in_time, check_out_time=None):
-    LATE_THRESHOLD = datetime.strptime("09:05", "%H:%M").time()
-    EARLY_THRESHOLD = datetime.strptime("16:55", "%H:%M").time()
-    
-    try:
-        check_in = datetime.strptime(check_in_time, '%H:%M').time()
-    except:
+def calculate_status(check_in_time, check_out_time=None, shift=DEFAULT_SHIFT):
+    """Status of a day's 'HH:MM' check-in/out under a shifts.Shift; Absent without a check-in.
+
+    Malformed times raise ValueError.
+    """
+    if not check_in_time:
         return 'Absent'
-    
-    if check_in > LATE_THRESHOLD:
-        status = 'Late'
+    check_out = parse_minutes(check_out_time) if check_out_time else None
+    return shift_status(shift, parse_minutes(check_in_time), check_out)
+
+# Same rules as calculate_status, evaluated inside the upsert against the
+# locked row; NULL thresholds (a day off) make every scan Present
+_CHECKIN_STATUS_SQL = "CASE WHEN %(now)s::time > %(late)s::time THEN 'Late' ELSE 'Present' END"
+_CHECKOUT_STATUS_SQL = '''CASE
+    WHEN ea.check_in > %(late)s::time THEN 'Late'
+    WHEN %(now)s::time < %(early)s::time THEN 'Early'
+    ELSE 'Present'
+END'''
+# SQLite keeps times as 'HH:MM:SS' text, which compares in time order
+_SQLITE_CHECKIN_STATUS_SQL = "CASE WHEN time(%(now)s) > time(%(late)s) THEN 'Late' ELSE 'Present' END"
+_SQLITE_CHECKOUT_STATUS_SQL = '''CASE
+    WHEN ea.check_in > time(%(late)s) THEN 'Late'
+    WHEN time(%(now)s) < time(%(early)s) THEN 'Early'
+    ELSE 'Present'
+END'''
+
+_ATTENDANCE_RETURNING_SQL = '''
+    ea.id, ea.user_id, to_char(ea.date, 'YYYY-MM-DD') AS date,
+    to_char(ea.check_in, 'HH24:MI') AS check_in, to_char(ea.check_out, 'HH24:MI') AS check_out,
+    ea.status, ea.remarks, ea.recorded_by, ea.recorded_at,
+    (SELECT name FROM users WHERE id = ea.user_id) AS name
+'''
+
+# SQLite's RETURNING can't see other tables, so a scan reads its row back
+_SQLITE_ATTENDANCE_ROW_SQL = '''
+    SELECT ea.id, ea.user_id, strftime('%%Y-%%m-%%d', ea.date) AS date,
+           substr(ea.check_in, 1, 5) AS check_in, substr(ea.check_out, 1, 5) AS check_out,
+           ea.status, ea.remarks, ea.recorded_by, ea.recorded_at, u.name
+    FROM employee_attendance ea
+    JOIN users u ON u.id = ea.user_id
+    WHERE ea.user_id = %(user_id)s AND ea.date = %(date)s
+'''
+
+def _scan_params(user_id, scanned_at=None, grade=None, schedule=None):
+    scanned_at = scanned_at or datetime.now()
+    late, early = scan_thresholds(user_id, grade if grade is not None else get_teacher_grade(user_id),
+                                  scanned_at.date(), schedule)
+    return {
+        'user_id': user_id,
+        'date': scanned_at.strftime('%Y-%m-%d'),
+        'now': scanned_at.strftime('%H:%M'),
+        'late': late,
+        'early': early
+    }
+
+def employee_scan_query(user_id, action='auto', scanned_at=None, grade=None, schedule=None):
+    """(query, params) applying a check-in/check-out scan in one atomic statement.
+
+    'auto' checks in, or checks out if the teacher is checked in but not
+    yet out that day. ON CONFLICT locks the day's row, so concurrent scans
+    of the same badge are applied one after the other and can't both insert.
+    scanned_at (a naive local datetime) replaces the current time for
+    scans recorded offline. The late/early thresholds are the teacher's
+    shift that day (shifts.py); grade is looked up when not given, and
+    schedule (a CompiledSchedule) is used as is rather than refreshed.
+    """
+    params = _scan_params(user_id, scanned_at, grade, schedule)
+    
+    if action == 'checkout':
+        query = f'''
+            WITH updated AS (
+                UPDATE employee_attendance ea
+                SET check_out = %(now)s, status = {_CHECKOUT_STATUS_SQL}
+                WHERE ea.user_id = %(user_id)s AND ea.date = %(date)s AND ea.check_in IS NOT NULL
+                RETURNING {_ATTENDANCE_RETURNING_SQL}
+            )
+            SELECT * FROM updated
+            UNION ALL
+            SELECT {_ATTENDANCE_RETURNING_SQL}
+            FROM employee_attendance ea
+            WHERE ea.user_id = %(user_id)s AND ea.date = %(date)s AND NOT EXISTS (SELECT 1 FROM updated)
+        '''
     else:
-        status = 'Present'
-    
-    if check_out_time and status == 'Present':
-        try:
-            check_out = datetime.strptime(check_out_time, '%H:%M').time()
-            if check_out < EARLY_THRESHOLD:
-                status = 'Early'
-        except:
-            pass
-    
-    return status
+        # 'checkin' only fills an empty check-in; 'auto' also checks out an open day
+        params['auto'] = action == 'auto'
+        is_checkout = 'ea.check_in IS NOT NULL AND ea.check_out IS NULL AND %(auto)s'
+        query = f'''
+            INSERT INTO employee_attendance AS ea (user_id, date, check_in, status, recorded_by)
+            VALUES (%(user_id)s, %(date)s, %(now)s, {_CHECKIN_STATUS_SQL}, %(user_id)s)
+            ON CONFLICT (user_id, date) DO UPDATE SET
+                check_in = COALESCE(ea.check_in, EXCLUDED.check_in),
+                check_out = CASE WHEN {is_checkout} THEN EXCLUDED.check_in ELSE ea.check_out END,
+                status = CASE
+                    WHEN ea.check_in IS NULL THEN EXCLUDED.status
+                    WHEN {is_checkout} THEN {_CHECKOUT_STATUS_SQL}
+                    ELSE ea.status
+                END,
+                remarks = CASE WHEN ea.check_in IS NULL THEN 'Recorded via system' ELSE ea.remarks END
+            RETURNING {_ATTENDANCE_RETURNING_SQL}
+        '''
+    return query, params
+
+def sqlite_employee_scan(cursor, user_id, action='auto', scanned_at=None):
+    """employee_scan_query's scan on a SQLite connection; returns the day's row.
+
+    The caller commits. The upsert takes the database's write lock, which
+    serializes concurrent scans the way the row lock does in PostgreSQL.
+    """
+    params = _scan_params(user_id, scanned_at)
+    if action == 'checkout':
+        cursor.execute(f'''
+            UPDATE employee_attendance AS ea
+            SET check_out = time(%(now)s), status = {_SQLITE_CHECKOUT_STATUS_SQL}
+            WHERE ea.user_id = %(user_id)s AND ea.date = %(date)s AND ea.check_in IS NOT NULL
+        ''', params)
+    else:
+        params['auto'] = action == 'auto'
+        is_checkout = 'ea.check_in IS NOT NULL AND ea.check_out IS NULL AND %(auto)s'
+        cursor.execute(f'''
+            INSERT INTO employee_attendance AS ea (user_id, date, check_in, status, recorded_by)
+            VALUES (%(user_id)s, %(date)s, time(%(now)s), {_SQLITE_CHECKIN_STATUS_SQL}, %(user_id)s)
+            ON CONFLICT (user_id, date) DO UPDATE SET
+                check_in = COALESCE(ea.check_in, excluded.check_in),
+                check_out = CASE WHEN {is_checkout} THEN excluded.check_in ELSE ea.check_out END,
+                status = CASE
+                    WHEN ea.check_in IS NULL THEN excluded.status
+                    WHEN {is_checkout} THEN {_SQLITE_CHECKOUT_STATUS_SQL}
+                    ELSE ea.status
+                END,
+                remarks = CASE WHEN ea.check_in IS NULL THEN 'Recorded via system' ELSE ea.remarks END
+        ''', params)
+    cursor.execute(_SQLITE_ATTENDANCE_ROW_SQL, params)
+    return cursor.fetchone()
 
 def record_employee_attendance(user_id, action='auto'):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    today = get_current_date()
-    current_time = get_current_time()
-    
-    cursor.execute('''
-        SELECT id, check_in, check_out 
-        FROM employee_attendance 
-        WHERE user_id = %s AND date = %s
-    ''', (user_id, today))
-    
-    record = cursor.fetchone()
-    
-    if action == 'auto':
-        action = 'checkout' if (record and record['check_in'] and not record['check_out']) else 'checkin'
-    
-    if action == 'checkin':
-        if record:
-            if not record['check_in']:
-                status = calculate_status(current_time)
-                cursor.execute('''
-                    UPDATE employee_attendance 
-                    SET check_in = %s, status = %s, remarks = %s
-                    WHERE id = %s
-                ''', (current_time, status, 'Recorded via system', record['id']))
-        else:
-            status = calculate_status(current_time)
-            cursor.execute('''
-                INSERT INTO employee_attendance (user_id, date, check_in, status, recorded_by)
-                VALUES (%s, %s, %s, %s, %s)
-            ''', (user_id, today, current_time, status, user_id))
-    
-    elif action == 'checkout' and record and record['check_in']:
-        status = calculate_status(record['check_in'], current_time)
+    if SQLITE:
+        with get_db_connection() as conn:
+            result = sqlite_employee_scan(conn.cursor(), user_id, action)
+            conn.commit()
+            return result
+    
+    query, params = employee_scan_query(user_id, action)
+    with get_db_connection() as conn:
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        result = cursor.fetchone()
+        return dict(result) if result else None
+
+SCAN_BATCH_MAX_SIZE = 500
+
+def record_employee_scans(scans, kiosk_id=None):
+    """Apply a batch of offline scans [(user_id, scanned_at)] in one transaction.
+
+    Every scan is logged in attendance_scans first; scans already logged
+    (a kiosk re-sending a batch) are skipped, so a sync can be retried
+    safely. New scans are applied oldest first with the same rules as a
+    live scan, sent to the server as a single multi-statement round-trip.
+    Returns {'applied', 'duplicates', 'attendance': final rows of the days touched}.
+    """
+    if SQLITE:
+        return _record_employee_scans_sqlite(scans, kiosk_id)
+    
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
         cursor.execute('''
-            UPDATE employee_attendance 
-            SET check_out = %s, status = %s
-            WHERE id = %s
-        ''', (current_time, status, record['id']))
-    
-    conn.commit()
-    
-    cursor.execute('''
-        SELECT ea.*, u.name 
-        FROM employee_attendance ea
-        JOIN users u ON ea.user_id = u.id
-        WHERE ea.user_id = %s AND ea.date = %s
-    ''', (user_id, today))
+            INSERT INTO attendance_scans (user_id, scanned_at, kiosk_id)
+            SELECT user_id, scanned_at, %s
+            FROM unnest(%s::int[], %s::timestamp[]) AS t(user_id, scanned_at)
+            ON CONFLICT (user_id, scanned_at) DO NOTHING
+            RETURNING user_id, scanned_at
+        ''', (kiosk_id, [user_id for user_id, _ in scans], [scanned_at for _, scanned_at in scans]))
+        new_scans = sorted((row['scanned_at'], row['user_id']) for row in cursor.fetchall())
+        
+        attendance = []
+        if new_scans:
+            statements = [cursor.mogrify(*employee_scan_query(user_id, 'auto', scanned_at)).decode()
+                          for scanned_at, user_id in new_scans]
+            days = sorted({(user_id, scanned_at.date()) for scanned_at, user_id in new_scans})
+            statements.append(cursor.mogrify(f'''
+                SELECT {_ATTENDANCE_RETURNING_SQL}
+                FROM employee_attendance ea
+                JOIN unnest(%s::int[], %s::date[]) AS d(user_id, date) USING (user_id, date)
+                ORDER BY ea.date, ea.user_id
+            ''', ([user_id for user_id, _ in days], [day for _, day in days])).decode())
+            # Only the final SELECT's rows come back
+            cursor.execute(';\n'.join(statements))
+            attendance = [dict(row) for row in cursor.fetchall()]
+        conn.commit()
     
-    result = cursor.fetchone()
-    conn.close()
-    return dict(result) if result else None
+    return {'applied': len(new_scans), 'duplicates': len(scans) - len(new_scans), 'attendance': attendance}
 
-def get_employee_attendance(user_id=None, date=None, grade=None, role='admin'):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _record_employee_scans_sqlite(scans, kiosk_id=None):
+    # In-process statements cost no round-trips: one scan at a time, under the write lock
+    with get_db_connection() as conn:
+        conn.begin_immediate()
+        cursor = conn.cursor()
+        new_scans = []
+        for user_id, scanned_at in scans:
+            cursor.execute('''
+                INSERT INTO attendance_scans (user_id, scanned_at, kiosk_id) VALUES (%s, %s, %s)
+                ON CONFLICT (user_id, scanned_at) DO NOTHING
+            ''', (user_id, scanned_at, kiosk_id))
+            if cursor.rowcount:
+                new_scans.append((scanned_at, user_id))
+        new_scans.sort()
+        
+        for scanned_at, user_id in new_scans:
+            sqlite_employee_scan(cursor, user_id, 'auto', scanned_at)
+        attendance = []
+        for day, user_id in sorted({(scanned_at.date(), user_id) for scanned_at, user_id in new_scans}):
+            cursor.execute(_SQLITE_ATTENDANCE_ROW_SQL, {'user_id': user_id, 'date': day})
+            attendance.append(cursor.fetchone())
+        conn.commit()
     
+    return {'applied': len(new_scans), 'duplicates': len(scans) - len(new_scans), 'attendance': attendance}
+
+ATTENDANCE_PAGE_SIZE = 100
+ATTENDANCE_MAX_PAGE_SIZE = 500
+
+def encode_attendance_cursor(record):
+    """Opaque keyset cursor for the (date, check_in, id) position of a row"""
+    key = [record['date'].isoformat(), record['check_in'].isoformat() if record['check_in'] else None, record['id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_attendance_cursor(cursor_value):
+    try:
+        date_value, check_in, row_id = json.loads(base64.urlsafe_b64decode(cursor_value.encode()))
+        return (
+            datetime.strptime(date_value, '%Y-%m-%d').date(),
+            datetime.strptime(check_in, '%H:%M:%S').time() if check_in else None,
+            int(row_id)
+        )
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def serialize_attendance(row):
+    record = dict(row)
+    record['date'] = record['date'].isoformat()
+    for field in ('check_in', 'check_out'):
+        if record[field] is not None:
+            record[field] = record[field].strftime('%H:%M')
+    if record.get('recorded_at') is not None:
+        record['recorded_at'] = record['recorded_at'].isoformat()
+    return record
+
+def employee_attendance_query(user_id=None, date=None, grade=None, role='admin', date_from=None, date_to=None):
     query = '''
         SELECT ea.*, u.name, u.grade as teacher_grade 
         FROM employee_attendance ea
@@ -107,6 +278,14 @@ def get_employee_attendance(user_id=None, date=None, grade=None, role='admin'):
         query += ' AND ea.date = %s'
         params.append(date)
     
+    if date_from:
+        query += ' AND ea.date >= %s'
+        params.append(date_from)
+    
+    if date_to:
+        query += ' AND ea.date <= %s'
+        params.append(date_to)
+    
     if grade and grade != 'All':
         query += ' AND u.grade = %s'
         params.append(grade)
@@ -115,143 +294,511 @@ def get_employee_attendance(user_id=None, date=None, grade=None, role='admin'):
         query += ' AND ea.user_id = %s'
         params.append(user_id)
     
-    query += ' ORDER BY ea.date DESC, ea.check_in DESC LIMIT 100'
-    
-    cursor.execute(query, params)
-    records = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return records
-
-def get_attendance_stats(user_id=None, role='admin'):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    return query, params
+
+# check_in DESC puts NULLs first in PostgreSQL but last in SQLite, whose
+# keyset index (migrations.SQLITE_MIGRATIONS) sorts them up front explicitly
+ATTENDANCE_ORDER_SQL = (' ORDER BY ea.date DESC, ea.check_in IS NULL DESC, ea.check_in DESC, ea.id DESC' if SQLITE
+                        else ' ORDER BY ea.date DESC, ea.check_in DESC, ea.id DESC')
+
+def employee_attendance_page_query(cursor=None, limit=ATTENDANCE_PAGE_SIZE, **filters):
+    """(query, params, limit) for one keyset page of attendance history"""
+    query, params = employee_attendance_query(**filters)
+    limit = max(1, min(int(limit), ATTENDANCE_MAX_PAGE_SIZE))
+    
+    if cursor:
+        # Keyset continuation in (date DESC, check_in DESC NULLS FIRST, id DESC) order
+        after_date, after_check_in, after_id = decode_attendance_cursor(cursor)
+        if after_check_in is None:
+            same_day = '(ea.check_in IS NOT NULL OR ea.id < %s)'
+            same_day_params = [after_id]
+        else:
+            same_day = '(ea.check_in < %s OR (ea.check_in = %s AND ea.id < %s))'
+            same_day_params = [after_check_in, after_check_in, after_id]
+        query += f' AND ea.date <= %s AND (ea.date < %s OR {same_day})'
+        params += [after_date, after_date] + same_day_params
+    
+    # Fetch one extra row to learn whether another page exists
+    query += ATTENDANCE_ORDER_SQL + ' LIMIT %s'
+    params.append(limit + 1)
+    return query, params, limit
+
+def employee_attendance_page(rows, limit):
+    next_cursor = encode_attendance_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [serialize_attendance(row) for row in rows[:limit]], next_cursor
+
+def get_employee_attendance(cursor=None, limit=ATTENDANCE_PAGE_SIZE, **filters):
+    """One page of attendance history, newest first.
+
+    Returns (records, next_cursor); pass next_cursor back to get the
+    following page. next_cursor is None on the last page. Filters are
+    user_id, date, grade, role, date_from and date_to.
+    """
+    query, params, limit = employee_attendance_page_query(cursor, limit, **filters)
+    with get_db_connection(readonly=True) as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(query, params)
+        return employee_attendance_page(db_cursor.fetchall(), limit)
+
+def iter_employee_attendance(batch_size=2000, **filters):
+    """Yield serialized attendance rows from a server-side cursor, for exports.
+
+    Only batch_size rows are held in memory at a time. The pooled connection
+    is returned when the generator is exhausted or closed.
+    """
+    query, params = employee_attendance_query(**filters)
+    query += ATTENDANCE_ORDER_SQL
+    
+    with get_db_connection(readonly=True) as conn:
+        with conn.cursor(name='employee_attendance_export') as db_cursor:
+            db_cursor.itersize = batch_size
+            db_cursor.execute(query, params)
+            for row in db_cursor:
+                yield serialize_attendance(row)
+
+def _month_start(day):
+    return day.replace(day=1)
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def attendance_stats_query(user_id=None, role='admin', date_from=None, date_to=None, grade=None):
+    """(query, params, date_from, date_to) for status counts from the rollup tables.
+
+    The range defaults to this month to date.
+
+    Reads O(days in range) summary rows instead of scanning history. Absent
+    is explicit 'Absent' records plus working days (the weekdays of the
+    teacher's shift policy, Mon-Fri by default, unless school_calendar
+    overrides) on which an active teacher has no record at all.
+    """
+    today = datetime.now().date()
+    date_to = min(date_to or today, today)
+    date_from = date_from or _month_start(date_to)
     
-    query = '''
-        SELECT status, COUNT(*) as count
-        FROM employee_attendance ea
-        JOIN users u ON ea.user_id = u.id
-        WHERE u.role = 'teacher'
-    '''
-    params = []
+    params = {'from': date_from, 'to': date_to, 'user_id': user_id, 'grade': grade}
     
     if role == 'teacher' and user_id:
-        query += ' AND ea.user_id = %s'
-        params.append(user_id)
-    
-    query += ' GROUP BY status'
-    
-    cursor.execute(query, params)
-    results = cursor.fetchall()
-    
+        # Whole months come from the monthly rollup, the partial months at either end from the rows
+        full_from = date_from if date_from.day == 1 else _next_month(date_from)
+        full_to = _month_start(date_to) if date_to != _next_month(date_to) - timedelta(days=1) else _next_month(date_to)
+        if full_to < full_from:
+            full_to = full_from
+        params.update({'full_from': full_from, 'full_to': full_to})
+        counts_sql = '''
+            SELECT status, SUM(count) AS count FROM (
+                SELECT status, count FROM employee_attendance_monthly
+                WHERE user_id = %(user_id)s AND month >= %(full_from)s AND month < %(full_to)s
+                UNION ALL
+                SELECT status, 1 FROM employee_attendance
+                WHERE user_id = %(user_id)s AND date BETWEEN %(from)s AND %(to)s
+                  AND (date < %(full_from)s OR date >= %(full_to)s) AND status IS NOT NULL
+            ) rows
+            GROUP BY status
+        '''
+        teacher_filter = 'AND u.id = %(user_id)s'
+    else:
+        counts_sql = '''
+            SELECT status, SUM(count) AS count FROM employee_attendance_daily
+            WHERE date BETWEEN %(from)s AND %(to)s
+        ''' + (' AND grade = %(grade)s' if grade and grade != 'All' else '') + ' GROUP BY status'
+        teacher_filter = 'AND u.grade = %(grade)s' if grade and grade != 'All' else ''
+    
+    # Active teachers with their working weekdays; materialized so the
+    # policy lookup runs once per teacher rather than once per day
+    teachers_sql = f'''teachers AS MATERIALIZED (
+                SELECT u.id, u.activated_at, {TEACHER_WORKDAYS_SQL} AS workdays
+                FROM users u
+                WHERE u.role = 'teacher' AND u.is_active = TRUE {teacher_filter}
+            )'''
+    
+    if SQLITE:
+        query = f'''
+            WITH RECURSIVE days(day) AS (
+                SELECT date(%(from)s) WHERE %(from)s <= %(to)s
+                UNION ALL
+                SELECT date(day, '+1 day') FROM days WHERE day < %(to)s
+            ),
+            counts AS ({counts_sql}),
+            {teachers_sql},
+            missing AS (
+                SELECT COUNT(*) AS count
+                FROM days d
+                LEFT JOIN school_calendar c ON c.date = d.day
+                JOIN teachers u ON u.activated_at IS NULL OR date(u.activated_at) <= d.day
+                WHERE COALESCE(c.is_working_day, (u.workdays >> ((CAST(strftime('%%w', d.day) AS INTEGER) + 6) %% 7)) & 1 = 1)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM employee_attendance ea
+                      WHERE ea.user_id = u.id AND ea.date = d.day
+                  )
+            )
+            SELECT status, count FROM counts
+            UNION ALL
+            SELECT NULL, count FROM missing
+        '''
+        return query, params, date_from, date_to
+    
+    query = f'''
+        WITH counts AS ({counts_sql}),
+        {teachers_sql},
+        missing AS (
+            SELECT COUNT(*) AS count
+            FROM (
+                SELECT day::date AS day, 1 << (EXTRACT(ISODOW FROM day)::int - 1) AS weekday_bit
+                FROM generate_series(%(from)s::date, %(to)s::date, interval '1 day') AS day
+            ) d
+            LEFT JOIN school_calendar c ON c.date = d.day
+            JOIN teachers u ON u.activated_at IS NULL OR u.activated_at::date <= d.day
+            WHERE COALESCE(c.is_working_day, u.workdays & d.weekday_bit <> 0)
+              AND NOT EXISTS (
+                  -- The range bound prunes the anti-join to the range's partitions
+                  SELECT 1 FROM employee_attendance ea
+                  WHERE ea.user_id = u.id AND ea.date = d.day AND ea.date BETWEEN %(from)s AND %(to)s
+              )
+        )
+        SELECT status, count FROM counts
+        UNION ALL
+        SELECT NULL, count FROM missing
+    '''
+    return query, params, date_from, date_to
+
+def attendance_stats_from_rows(results):
     stats = {'Present': 0, 'Absent': 0, 'Late': 0, 'Early': 0, 'Leave': 0}
     for row in results:
-        if row['status'] in stats:
-            stats[row['status']] = row['count']
-    
-    if role == 'teacher' and user_id:
-        cursor.execute('SELECT COUNT(DISTINCT date) as days FROM employee_attendance WHERE user_id = %s', (user_id,))
-        total_days = cursor.fetchone()['days']
-        stats['Absent'] = max(0, 30 - sum(stats.values()))
-    else:
-        stats['Absent'] = max(0, 50 - sum(stats.values()))
-    
-    conn.close()
+        if row['status'] is None:
+            stats['Absent'] += int(row['count'])
+        elif row['status'] in stats:
+            stats[row['status']] += int(row['count'])
     return stats
 
-def record_student_attendance(attendance_data, teacher_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    today = get_current_date()
-    
-    cursor.execute('SELECT grade FROM users WHERE id = %s', (teacher_id,))
-    teacher_grade = cursor.fetchone()
-    if not teacher_grade:
-        conn.close()
-        return 0
-    
-    success_count = 0
+def get_attendance_stats(user_id=None, role='admin', date_from=None, date_to=None, grade=None):
+    """Returns (stats, date_from, date_to); see attendance_stats_query"""
+    query, params, date_from, date_to = attendance_stats_query(user_id, role, date_from, date_to, grade)
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        return attendance_stats_from_rows(cursor.fetchall()), date_from, date_to
+
+STUDENT_ROLL_CALL_SQL = f'''
+    WITH submitted AS (
+        SELECT DISTINCT ON (student_id) student_id, present
+        FROM unnest(%(ids)s::int[], %(present)s::boolean[]) WITH ORDINALITY AS t(student_id, present, ord)
+        ORDER BY student_id, ord DESC
+    ),
+    teacher AS (
+        SELECT grade FROM users WHERE id = %(teacher_id)s
+    ),
+    checked AS (
+        SELECT sub.student_id, sub.present,
+               CASE
+                   WHEN NOT EXISTS (SELECT 1 FROM teacher) THEN 'Teacher not found'
+                   WHEN s.id IS NULL THEN 'Student not found'
+                   WHEN s.grade IS DISTINCT FROM (SELECT grade FROM teacher) THEN 'Student is not in your assigned grade'
+               END AS reason
+        FROM submitted sub
+        LEFT JOIN students s ON s.id = sub.student_id
+    ),
+    written AS (
+        INSERT INTO student_attendance (student_id, date, is_present, recorded_by)
+        SELECT student_id, %(date)s::date, present, %(teacher_id)s
+        FROM checked
+        WHERE reason IS NULL
+        ORDER BY student_id
+        ON CONFLICT (student_id, date)
+        DO UPDATE SET is_present = EXCLUDED.is_present, recorded_at = CURRENT_TIMESTAMP
+        RETURNING student_id, is_present
+    ),
+    bitmaps AS ({BITMAP_UPSERT_SQL})
+    SELECT
+        (SELECT COUNT(*) FROM written) AS count,
+        COALESCE(
+            json_agg(json_build_object('student_id', student_id, 'reason', reason) ORDER BY student_id)
+                FILTER (WHERE reason IS NOT NULL),
+            '[]'
+        ) AS rejected
+    FROM checked
+'''
+
+def student_roll_call_params(attendance_data, teacher_id):
+    """(params, rejected) for STUDENT_ROLL_CALL_SQL; malformed entries are rejected up front"""
+    student_ids, present_flags, rejected = [], [], []
     for entry in attendance_data:
-        cursor.execute('SELECT grade FROM students WHERE id = %s', (entry['student_id'],))
-        student = cursor.fetchone()
-        if not student or student['grade'] != teacher_grade['grade']:
+        try:
+            student_id, present = int(entry['student_id']), bool(entry['present'])
+        except (KeyError, TypeError, ValueError):
+            student_id = entry.get('student_id') if isinstance(entry, dict) else None
+            rejected.append({'student_id': student_id, 'reason': 'Invalid entry (student_id and present required)'})
             continue
-        
+        student_ids.append(student_id)
+        present_flags.append(present)
+    today = get_current_date()
+    params = {'ids': student_ids, 'present': present_flags, 'teacher_id': teacher_id, 'date': today,
+              'term_start': term_start(datetime.strptime(today, '%Y-%m-%d').date()).isoformat()}
+    return params, rejected
+
+def sqlite_roll_call(cursor, params):
+    """STUDENT_ROLL_CALL_SQL's roll-call on a SQLite connection; the caller commits"""
+    # Last entry wins
+    submitted = dict(zip(params['ids'], params['present']))
+    cursor.execute('SELECT grade FROM users WHERE id = %s', (params['teacher_id'],))
+    teacher = cursor.fetchone()
+    cursor.execute('SELECT id, grade FROM students WHERE id IN (SELECT value FROM json_each(%s))',
+                   (json.dumps(list(submitted)),))
+    grades = {row['id']: row['grade'] for row in cursor.fetchall()}
+    
+    rows, rejected = [], []
+    for student_id in sorted(submitted):
+        if teacher is None:
+            reason = 'Teacher not found'
+        elif student_id not in grades:
+            reason = 'Student not found'
+        elif grades[student_id] != teacher['grade']:
+            reason = 'Student is not in your assigned grade'
+        else:
+            rows.append((student_id, params['date'], submitted[student_id], params['teacher_id']))
+            continue
+        rejected.append({'student_id': student_id, 'reason': reason})
+    cursor.executemany('''
+        INSERT INTO student_attendance (student_id, date, is_present, recorded_by)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (student_id, date)
+        DO UPDATE SET is_present = excluded.is_present, recorded_at = CURRENT_TIMESTAMP
+    ''', rows)
+    term = datetime.strptime(params['term_start'], '%Y-%m-%d').date()
+    cursor.executemany(SQLITE_BITMAP_UPSERT_SQL, sqlite_bitmap_params(
+        [(student_id, day, present) for student_id, day, present, _ in rows], term))
+    return {'count': len(rows), 'rejected': rejected}
+
+def record_student_attendance(attendance_data, teacher_id):
+    """Upsert a class roll-call in one statement.
+
+    Returns {'count': rows written, 'rejected': [{'student_id', 'reason'}]}.
+    If a student appears more than once, the last entry wins.
+    """
+    params, rejected = student_roll_call_params(attendance_data, teacher_id)
+    if SQLITE:
+        with get_db_connection() as conn:
+            conn.begin_immediate()
+            result = sqlite_roll_call(conn.cursor(), params)
+            conn.commit()
+        return {'count': result['count'], 'rejected': rejected + result['rejected']}
+    
+    with get_db_connection() as conn:
+        # A single statement is atomic on its own; skip the separate COMMIT round-trip
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute(STUDENT_ROLL_CALL_SQL, params)
+        result = cursor.fetchone()
+        return {'count': result['count'], 'rejected': rejected + result['rejected']}
+
+def record_roll_calls(params_list):
+    """Apply several roll-calls (student_roll_call_params output) in one transaction"""
+    results = []
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for params in params_list:
+            if 'term_start' not in params:
+                # Queued by a worker that predates the bitmaps
+                params = {**params, 'term_start': term_start(datetime.strptime(params['date'], '%Y-%m-%d').date()).isoformat()}
+            if SQLITE:
+                conn.begin_immediate()
+                results.append(sqlite_roll_call(cursor, params))
+                continue
+            cursor.execute(STUDENT_ROLL_CALL_SQL, params)
+            results.append(dict(cursor.fetchone()))
+        conn.commit()
+    return results
+
+TEACHER_GRADE_SQL = 'SELECT grade FROM users WHERE id = %s AND role = %s'
+
+ROSTER_SQL = '''
+    SELECT id, student_id, name, grade, section, parent_contact
+    FROM students
+    WHERE is_active = TRUE AND grade = %s AND section = %s
+    ORDER BY name
+'''
+
+# How stale a worker's view of roster_versions may get, and how long a
+# teacher's grade assignment is trusted without a lookup
+ROSTER_CACHE_REFRESH_SECONDS = float(os.environ.get('ROSTER_CACHE_REFRESH_SECONDS', '5'))
+TEACHER_GRADE_TTL = float(os.environ.get('TEACHER_GRADE_TTL', '60'))
+
+ROSTER_VERSIONS_SQL = 'SELECT grade, section, version FROM roster_versions WHERE version > %s'
+
+class RosterCache:
+    """Per-process cache of active rosters by (grade, section), with ETags.
+
+    A statement trigger on students bumps roster_versions. The table is
+    polled at most every ``refresh_after`` seconds and only the sections
+    that changed are dropped, so an edit in any worker reaches the others
+    within that delay while roster reads skip the database. Each school
+    (``tenant``) has its own cache.
+    """
+
+    def __init__(self, refresh_after, teacher_grade_ttl, tenant=None):
+        self.refresh_after = refresh_after
+        self.tenant = tenant
+        self.teacher_grade_ttl = teacher_grade_ttl
+        self.version = 0
+        self._entries = {}
+        # Bumped on invalidation so a load that raced a change isn't stored
+        self._generations = {}
+        self._teacher_grades = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._checked_at = 0.0
+        self._loaded = False
+        self._counters = {'hits': 0, 'misses': 0, 'invalidations': 0, 'refreshes': 0, 'refresh_errors': 0}
+
+    def refresh(self):
+        with get_db_connection(self.tenant) as conn:
+            cursor = conn.cursor()
+            cursor.execute(ROSTER_VERSIONS_SQL, (self.version,))
+            changed = cursor.fetchall()
+        for row in changed:
+            self.invalidate(row['grade'], row['section'])
+        if changed:
+            self.version = max(self.version, *(row['version'] for row in changed))
+        self._counters['refreshes'] += 1
+        self._loaded = True
+        self._checked_at = time.monotonic()
+
+    def refresh_if_stale(self):
+        if time.monotonic() - self._checked_at < self.refresh_after:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
         try:
-            cursor.execute('''
-                INSERT INTO student_attendance (student_id, date, is_present, recorded_by)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (student_id, date) 
-                DO UPDATE SET is_present = EXCLUDED.is_present, recorded_at = CURRENT_TIMESTAMP
-            ''', (entry['student_id'], today, entry['present'], teacher_id))
-            success_count += 1
+            self.refresh()
         except Exception as e:
-            print(f"Error: {e}")
-            continue
-    
-    conn.commit()
-    conn.close()
-    return success_count
+            self._counters['refresh_errors'] += 1
+            self._checked_at = time.monotonic()
+            print(f"⚠️  Roster cache refresh failed: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def loaded(self):
+        """Whether roster_versions has been read at least once"""
+        return self._loaded
+
+    def get(self, grade, section, refresh=True):
+        """Cached {'students', 'etag'} or None"""
+        if refresh:
+            self.refresh_if_stale()
+        with self._lock:
+            entry = self._entries.get((grade, section))
+            self._counters['hits' if entry is not None else 'misses'] += 1
+            return entry
+
+    def generation(self, grade, section):
+        """Read before loading a roster and pass to put()"""
+        with self._lock:
+            return self._generations.get((grade, section), 0)
+
+    def put(self, grade, section, students, generation):
+        body = json.dumps(students, sort_keys=True, default=str).encode()
+        entry = {'students': students, 'etag': hashlib.sha256(body).hexdigest()[:32]}
+        with self._lock:
+            if self._generations.get((grade, section), 0) == generation:
+                self._entries[(grade, section)] = entry
+        return entry
+
+    def invalidate(self, grade, section):
+        with self._lock:
+            self._generations[(grade, section)] = self._generations.get((grade, section), 0) + 1
+            if self._entries.pop((grade, section), None) is not None:
+                self._counters['invalidations'] += 1
+
+    def teacher_grade(self, teacher_id):
+        """(found, grade) from the teacher-grade cache"""
+        with self._lock:
+            cached = self._teacher_grades.get(teacher_id)
+        if cached is None or cached[1] < time.monotonic():
+            return False, None
+        return True, cached[0]
+
+    def put_teacher_grade(self, teacher_id, grade):
+        with self._lock:
+            self._teacher_grades[teacher_id] = (grade, time.monotonic() + self.teacher_grade_ttl)
+
+    def clear(self):
+        with self._lock:
+            for key in self._entries:
+                self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.clear()
+            self._teacher_grades.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'version': self.version, **self._counters}
+
+roster_cache = TenantLocal(lambda tenant: RosterCache(ROSTER_CACHE_REFRESH_SECONDS, TEACHER_GRADE_TTL, tenant))
+
+def get_teacher_grade(teacher_id):
+    """A teacher's assigned grade (None if unassigned), cached per process"""
+    found, teacher_grade = roster_cache.teacher_grade(teacher_id)
+    if not found:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(TEACHER_GRADE_SQL, (teacher_id, 'teacher'))
+            teacher = cursor.fetchone()
+        teacher_grade = teacher['grade'] if teacher else None
+        roster_cache.put_teacher_grade(teacher_id, teacher_grade)
+    return teacher_grade
+
+def get_roster(grade, section, teacher_id=None):
+    """(students, etag) for an active grade/section roster, cached per process.
+
+    Teachers only get rosters of their own grade; anything else is ([], None).
+    """
+    if teacher_id and get_teacher_grade(teacher_id) != grade:
+        return [], None
+    
+    entry = roster_cache.get(grade, section)
+    if entry is None:
+        generation = roster_cache.generation(grade, section)
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(ROSTER_SQL, (grade, section))
+            students = [dict(row) for row in cursor.fetchall()]
+        entry = roster_cache.put(grade, section, students, generation)
+    return entry['students'], entry['etag']
 
 def get_students_by_grade_section(grade, section, teacher_id=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    if teacher_id:
-        cursor.execute('SELECT grade FROM users WHERE id = %s AND role = %s', (teacher_id, 'teacher'))
-        teacher = cursor.fetchone()
-        if not teacher or teacher['grade'] != grade:
-            conn.close()
-            return []
-    
-    cursor.execute('''
-        SELECT id, student_id, name, grade, section, parent_contact
-        FROM students
-        WHERE is_active = TRUE AND grade = %s AND section = %s
-        ORDER BY name
-    ''', (grade, section))
-    
-    students = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return students
+    return get_roster(grade, section, teacher_id)[0]
 
-def generate_qr_code(user_id, name, token):
-    """Generate QR code as base64 string (NO FILESYSTEM - SAFE FOR RENDER)"""
-    qr_data = f"ATTENDANCE:{user_id}:{token}"
-    
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="#4338ca", back_color="white").convert('RGB')
-    width, height = img.size
-    draw = ImageDraw.Draw(img)
-    
-    # Add header bar
-    draw.rectangle([(0, 0), (width, 60)], fill="#4338ca")
-    draw.text((width//2, 20), "SCHOOL ATTENDANCE", fill="white", anchor="mt", font_size=20)
-    
-    # Add footer with name
-    draw.rectangle([(0, height-60), (width, height)], fill="#4338ca")
-    draw.text((width//2, height-30), name, fill="white", anchor="mt", font_size=18)
-    
-    # Save to in-memory buffer (NO FILESYSTEM)
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
-    
-    # Return base64 data URL
-    qr_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    return f"data:image/png;base64,{qr_base64}"
+def generate_qr_code(user_id, name, token, fmt='png'):
+    """Generate QR code as base64 data URL (NO FILESYSTEM - SAFE FOR RENDER)"""
+    return badge_data_url(render_badge(user_id, name, token, fmt), fmt)
 
-def get_employees(include_inactive=False):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
+def badge_data_url(data, fmt='png'):
+    return f"data:{BADGE_MIME_TYPES[fmt]};base64,{base64.b64encode(data).decode('utf-8')}"
+
+def get_badge_users(user_ids=None):
+    """Active accounts to print badges for: the given ids, or every active teacher"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if user_ids and SQLITE:
+            cursor.execute('''
+                SELECT id, user_id, name, activated_at FROM users
+                WHERE is_active = TRUE AND id IN (SELECT value FROM json_each(%s))
+                ORDER BY name
+            ''', (json.dumps(list(user_ids)),))
+        elif user_ids:
+            cursor.execute('''
+                SELECT id, user_id, name, activated_at FROM users
+                WHERE is_active = TRUE AND id = ANY(%s)
+                ORDER BY name
+            ''', (list(user_ids),))
+        else:
+            cursor.execute('''
+                SELECT id, user_id, name, activated_at FROM users
+                WHERE is_active = TRUE AND role = 'teacher'
+                ORDER BY name
+            ''')
+        return [dict(row) for row in cursor.fetchall()]
+
+def employees_query(include_inactive=False):
     query = 'SELECT id, user_id, name, role, grade, email, phone, is_active FROM users WHERE role = %s'
     params = ['teacher']
     
@@ -259,109 +806,110 @@ def get_employees(include_inactive=False):
         query += ' AND is_active = TRUE'
     
     query += ' ORDER BY name'
-    
-    cursor.execute(query, params)
-    employees = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return employees
+    return query, params
+
+def get_employees(include_inactive=False):
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(*employees_query(include_inactive))
+        employees = [dict(row) for row in cursor.fetchall()]
+        return employees
 
 def add_employee(data, created_by_admin_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    """Create an inactive teacher account; raises WorkerPoolBusy if the password can't be hashed now"""
+    # Hash before checking out a connection: the wait on the pool can take seconds
+    hashed_pw = hash_password_offloaded(data['password'])
     
-    try:
-        hashed_pw = generate_password_hash(data['password'], method='pbkdf2:sha256')
-        
-        cursor.execute('''
-            INSERT INTO users (user_id, password, role, name, grade, email, phone, address, is_active)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, FALSE)
-            RETURNING id
-        ''', (
-            data['user_id'],
-            hashed_pw,
-            'teacher',
-            data['name'],
-            data['grade'],
-            data['email'],
-            data['phone'],
-            data.get('address', '')
-        ))
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+    
+        try:
+            cursor.execute('''
+                INSERT INTO users (user_id, password, role, name, grade, email, phone, address, is_active)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, FALSE)
+                RETURNING id
+            ''', (
+                data['user_id'],
+                hashed_pw,
+                'teacher',
+                data['name'],
+                data['grade'],
+                data['email'],
+                data['phone'],
+                data.get('address', '')
+            ))
         
-        new_id = cursor.fetchone()['id']
-        conn.commit()
+            new_id = cursor.fetchone()['id']
+            conn.commit()
         
-        return {
-            'success': True, 
-            'message': 'Teacher account created. Account is inactive until activated by admin.',
-            'user_id': new_id,
-            'requires_activation': True
-        }
-    except psycopg2.IntegrityError as e:
-        conn.rollback()
-        if 'user_id' in str(e):
-            return {'success': False, 'error': 'User ID already exists'}
-        return {'success': False, 'error': 'Database integrity error'}
-    except Exception as e:
-        conn.rollback()
-        return {'success': False, 'error': str(e)}
-    finally:
-        conn.close()
+            return {
+                'success': True, 
+                'message': 'Teacher account created. Account is inactive until activated by admin.',
+                'user_id': new_id,
+                'requires_activation': True
+            }
+        except IntegrityError as e:
+            conn.rollback()
+            if 'user_id' in str(e):
+                return {'success': False, 'error': 'User ID already exists'}
+            return {'success': False, 'error': 'Database integrity error'}
+        except Exception as e:
+            conn.rollback()
+            return {'success': False, 'error': str(e)}
 
 def activate_employee(user_id, admin_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
     
-    try:
-        cursor.execute('''
-            UPDATE users 
-            SET is_active = TRUE, activated_at = CURRENT_TIMESTAMP 
-            WHERE id = %s AND role = 'teacher'
-        ''', (user_id,))
+        try:
+            cursor.execute('''
+                UPDATE users 
+                SET is_active = TRUE, activated_at = CURRENT_TIMESTAMP 
+                WHERE id = %s AND role = 'teacher'
+            ''', (user_id,))
         
-        if cursor.rowcount == 0:
-            return {'success': False, 'error': 'Teacher not found'}
+            if cursor.rowcount == 0:
+                return {'success': False, 'error': 'Teacher not found'}
         
-        conn.commit()
-        return {'success': True, 'message': 'Teacher account activated successfully'}
-    except Exception as e:
-        conn.rollback()
-        return {'success': False, 'error': str(e)}
-    finally:
-        conn.close()
+            conn.commit()
+            return {'success': True, 'message': 'Teacher account activated successfully'}
+        except Exception as e:
+            conn.rollback()
+            return {'success': False, 'error': str(e)}
 
 def add_student(data, created_by_user_id, user_role):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
     
-    try:
-        if user_role == 'teacher':
-            cursor.execute('SELECT grade FROM users WHERE id = %s', (created_by_user_id,))
-            teacher = cursor.fetchone()
-            if not teacher or teacher['grade'] != data['grade']:
-                return {'success': False, 'error': 'You can only add students to your assigned grade'}
+        try:
+            if user_role == 'teacher':
+                cursor.execute('SELECT grade FROM users WHERE id = %s', (created_by_user_id,))
+                teacher = cursor.fetchone()
+                if not teacher or teacher['grade'] != data['grade']:
+                    return {'success': False, 'error': 'You can only add students to your assigned grade'}
         
-        cursor.execute('''
-            INSERT INTO students (student_id, name, grade, section, parent_name, parent_contact, created_by)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ''', (
-            data['student_id'],
-            data['name'],
-            data['grade'],
-            data['section'],
-            data.get('parent_name', ''),
-            data['parent_contact'],
-            created_by_user_id
-        ))
+            cursor.execute('''
+                INSERT INTO students (student_id, name, grade, section, parent_name, parent_contact, created_by)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ''', (
+                data['student_id'],
+                data['name'],
+                data['grade'],
+                data['section'],
+                data.get('parent_name', ''),
+                data['parent_contact'],
+                created_by_user_id
+            ))
         
-        conn.commit()
-        return {'success': True, 'message': 'Student added successfully'}
-    except psycopg2.IntegrityError as e:
-        conn.rollback()
-        if 'student_id' in str(e):
-            return {'success': False, 'error': 'Student ID already exists'}
-        return {'success': False, 'error': 'Database integrity error'}
-    except Exception as e:
-        conn.rollback()
-        return {'success': False, 'error': str(e)}
-    finally:
-        conn.close()
\ No newline at end of file
+            conn.commit()
+            # Other workers pick the change up from roster_versions
+            roster_cache.invalidate(data['grade'], data['section'])
+            return {'success': True, 'message': 'Student added successfully'}
+        except IntegrityError as e:
+            conn.rollback()
+            if 'student_id' in str(e):
+                return {'success': False, 'error': 'Student ID already exists'}
+            return {'success': False, 'error': 'Database integrity error'}
+        except Exception as e:
+            conn.rollback()
+            return {'success': False, 'error': str(e)}
\ No newline at end of file
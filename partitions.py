@@ -0,0 +1,325 @@
+"""Partition maintenance and archival for the attendance tables.
+
+employee_attendance and student_attendance are range-partitioned on date
+(migration 8), one partition per month or per academic year, plus a
+DEFAULT partition that catches anything outside the ranges. ensure_partitions
+creates partitions ahead of time and moves any rows that landed in DEFAULT
+into proper ranges; init_db runs it on startup, and it can be run from cron
+with:
+
+    python partitions.py maintain
+    python partitions.py status
+    python partitions.py archive --before 2025-08-01 --format parquet --dir /var/archive
+
+With several schools (TENANT_MAP) each command runs for every school, or
+only the one given with --tenant; archives go to a subdirectory per school.
+
+Archiving exports each partition that ends on or before --before to a
+compressed file, then detaches and drops it. The daily/monthly rollups keep
+their counts and the student bitmaps (bitmaps.py) their terms, so dashboard
+stats and attendance summaries for archived months still work.
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import argparse
+from datetime import date, datetime
+
+PARTITIONED_TABLES = ('employee_attendance', 'student_attendance')
+
+# 'month' or 'year' (academic year starting in ACADEMIC_YEAR_START_MONTH)
+ATTENDANCE_PARTITION_INTERVAL = os.environ.get('ATTENDANCE_PARTITION_INTERVAL', 'month')
+ACADEMIC_YEAR_START_MONTH = int(os.environ.get('ACADEMIC_YEAR_START_MONTH', '8'))
+# Partitions are created this many months past today
+PARTITION_MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', '3'))
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+ARCHIVE_FORMATS = ('csv', 'parquet')
+
+# Arbitrary constant identifying the partition maintenance advisory lock
+PARTITION_LOCK_ID = 724311
+
+_BOUND_RE = re.compile(r"FOR VALUES FROM \('([0-9-]+)'\) TO \('([0-9-]+)'\)")
+
+class PartitionError(Exception):
+    """A partition can't be archived as requested"""
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+def partition_range(day, interval=None):
+    """(start, end) of the partition that should hold day"""
+    interval = interval or ATTENDANCE_PARTITION_INTERVAL
+    if interval == 'year':
+        year = day.year if day.month >= ACADEMIC_YEAR_START_MONTH else day.year - 1
+        start = date(year, ACADEMIC_YEAR_START_MONTH, 1)
+        return start, _add_months(start, 12)
+    start = day.replace(day=1)
+    return start, _add_months(start, 1)
+
+def list_partitions(conn, table):
+    """[{'name', 'start', 'end', 'default'}] for table, ordered by start (default last)"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    ''', (table,))
+    partitions = []
+    for row in cursor.fetchall():
+        match = _BOUND_RE.search(row['bound'])
+        partitions.append({
+            'name': row['name'],
+            'start': date.fromisoformat(match.group(1)) if match else None,
+            'end': date.fromisoformat(match.group(2)) if match else None,
+            'default': row['bound'] == 'DEFAULT'
+        })
+    partitions.sort(key=lambda p: (p['default'], p['start'] or date.min))
+    return partitions
+
+def _uncovered(start, end, partitions):
+    """Sub-ranges of [start, end) not already covered by a partition"""
+    pieces = [(start, end)]
+    for p in partitions:
+        if p['default']:
+            continue
+        clipped = []
+        for s, e in pieces:
+            if p['end'] <= s or p['start'] >= e:
+                clipped.append((s, e))
+                continue
+            if s < p['start']:
+                clipped.append((s, p['start']))
+            if p['end'] < e:
+                clipped.append((p['end'], e))
+        pieces = clipped
+    return pieces
+
+def _partition_name(table, start, end):
+    if end == _add_months(start, 1) and start.day == 1:
+        return f'{table}_{start:%Y_%m}'
+    if end == _add_months(start, 12) and start.day == 1:
+        return f'{table}_ay{start.year}'
+    return f'{table}_{start:%Y%m%d}_{end:%Y%m%d}'
+
+def _default_partition(partitions):
+    return next((p['name'] for p in partitions if p['default']), None)
+
+def ensure_partitions(conn, months_ahead=None, interval=None, today=None):
+    """Create partitions through months_ahead and drain the DEFAULT partition.
+
+    Returns the names of the partitions created. Commits.
+    """
+    months_ahead = PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    today = today or datetime.now().date()
+    cursor = conn.cursor()
+    cursor.execute('SELECT pg_advisory_xact_lock(%s)', (PARTITION_LOCK_ID,))
+    created = []
+    for table in PARTITIONED_TABLES:
+        partitions = list_partitions(conn, table)
+        default = _default_partition(partitions)
+
+        # Ranges for today..months_ahead, plus any dates that fell into DEFAULT
+        wanted = {partition_range(today, interval)}
+        day = today
+        while day < _add_months(today, months_ahead + 1):
+            wanted.add(partition_range(day, interval))
+            day = _add_months(day, 1)
+        stray_months = []
+        if default:
+            cursor.execute(f"SELECT DISTINCT date_trunc('month', date)::date AS month FROM {default}")
+            stray_months = [row['month'] for row in cursor.fetchall()]
+            wanted.update(partition_range(month, interval) for month in stray_months)
+
+        ranges = []
+        for start, end in sorted(wanted):
+            ranges.extend(_uncovered(start, end, partitions))
+            partitions.append({'name': None, 'start': start, 'end': end, 'default': False})
+        if not ranges:
+            continue
+
+        if not stray_months:
+            for start, end in ranges:
+                name = _partition_name(table, start, end)
+                cursor.execute(f'CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+                               (start, end))
+                created.append(name)
+            continue
+
+        # Rows in DEFAULT block creating overlapping partitions. Detach it
+        # (it keeps no parent triggers), build each range as a standalone
+        # table and attach it, so moved rows never re-fire the rollup triggers.
+        cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {default}')
+        for start, end in ranges:
+            name = _partition_name(table, start, end)
+            cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            cursor.execute(f'INSERT INTO {name} SELECT * FROM {default} WHERE date >= %s AND date < %s',
+                           (start, end))
+            # Lets ATTACH skip its validation scan
+            cursor.execute(f'ALTER TABLE {name} ADD CONSTRAINT {name}_range CHECK (date >= %s AND date < %s)',
+                           (start, end))
+            cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+                           (start, end))
+            cursor.execute(f'ALTER TABLE {name} DROP CONSTRAINT {name}_range')
+            created.append(name)
+        cursor.execute(f'DROP TABLE {default}')
+        cursor.execute(f'CREATE TABLE {default} PARTITION OF {table} DEFAULT')
+        # Fresh partitions have no statistics until autovacuum gets to them
+        cursor.execute(f'ANALYZE {table}')
+    conn.commit()
+    return created
+
+def partition_status(conn):
+    """Partitions of each table with their row estimates and on-disk size"""
+    cursor = conn.cursor()
+    status = {}
+    for table in PARTITIONED_TABLES:
+        rows = []
+        for p in list_partitions(conn, table):
+            cursor.execute('''
+                SELECT GREATEST(reltuples, 0)::bigint AS rows, pg_total_relation_size(oid) AS bytes
+                FROM pg_class WHERE oid = %s::regclass
+            ''', (p['name'],))
+            size = cursor.fetchone()
+            rows.append({
+                'name': p['name'],
+                'range': 'DEFAULT' if p['default'] else f"{p['start']}..{p['end']}",
+                'rows': size['rows'],
+                'bytes': size['bytes']
+            })
+        status[table] = rows
+    conn.rollback()
+    return status
+
+# ======================
+# ARCHIVAL
+# ======================
+
+def _export_csv(conn, name, path):
+    cursor = conn.cursor()
+    with gzip.open(path, 'wb') as f:
+        cursor.copy_expert(f'COPY (SELECT * FROM {name} ORDER BY date, id) TO STDOUT WITH (FORMAT csv, HEADER)', f)
+
+def _export_parquet(conn, name, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise PartitionError('Parquet export requires the pyarrow package')
+    # Typed from the catalog, so all-NULL columns don't come out as 'null'
+    arrow_types = {'integer': pa.int32(), 'bigint': pa.int64(), 'boolean': pa.bool_(), 'date': pa.date32(),
+                   'time without time zone': pa.time64('us'), 'timestamp without time zone': pa.timestamp('us'),
+                   'text': pa.string()}
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_name = %s ORDER BY ordinal_position
+    ''', (name,))
+    column_types = {row['column_name']: arrow_types.get(row['data_type'], pa.string()) for row in cursor.fetchall()}
+
+    # COPY is the fastest way out of PostgreSQL; pyarrow parses the CSV in C
+    tmp_path = path + '.csv.gz'
+    _export_csv(conn, name, tmp_path)
+    try:
+        table = pa_csv.read_csv(tmp_path, convert_options=pa_csv.ConvertOptions(
+            column_types=column_types, strings_can_be_null=True, quoted_strings_can_be_null=False))
+        pq.write_table(table, path, compression='zstd')
+    finally:
+        os.remove(tmp_path)
+
+def archive_partitions(conn, before, fmt='csv', directory=None, keep=False, dry_run=False):
+    """Export, detach and drop every partition that ends on or before `before`.
+
+    Files go to <directory>/<table>/<partition>.csv.gz or .parquet and are
+    fsynced before the partition is dropped. keep=True leaves the detached
+    table in place instead of dropping it. Returns [{'partition', 'file', 'rows'}].
+    """
+    if fmt not in ARCHIVE_FORMATS:
+        raise PartitionError(f'Format must be one of: {", ".join(ARCHIVE_FORMATS)}')
+    directory = directory or ARCHIVE_DIR
+    cursor = conn.cursor()
+    archived = []
+    for table in PARTITIONED_TABLES:
+        for p in list_partitions(conn, table):
+            if p['default'] or p['end'] > before:
+                continue
+            cursor.execute(f'SELECT COUNT(*) AS rows FROM {p["name"]}')
+            rows = cursor.fetchone()['rows']
+            path = os.path.join(directory, table, p['name'] + ('.parquet' if fmt == 'parquet' else '.csv.gz'))
+            archived.append({'partition': p['name'], 'file': path, 'rows': rows})
+            if dry_run:
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Holds off late writes to this range until it is detached
+            cursor.execute(f'LOCK TABLE {p["name"]} IN SHARE MODE')
+            (_export_parquet if fmt == 'parquet' else _export_csv)(conn, p['name'], path)
+            with open(path, 'rb') as f:
+                os.fsync(f.fileno())
+            # Detach and drop commit together, only once the file is safely written
+            cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {p["name"]}')
+            if not keep:
+                cursor.execute(f'DROP TABLE {p["name"]}')
+            conn.commit()
+    conn.rollback()
+    return archived
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Attendance partition maintenance and archival')
+    parser.add_argument('--tenant', help='Only this school (default: every school)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    maintain_cmd = commands.add_parser('maintain', help='Create upcoming partitions and drain DEFAULT')
+    maintain_cmd.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD)
+    commands.add_parser('status', help='List partitions with sizes')
+    archive_cmd = commands.add_parser('archive', help='Export and drop partitions ending on or before a date')
+    archive_cmd.add_argument('--before', required=True, help='YYYY-MM-DD; e.g. the first day of the current term')
+    archive_cmd.add_argument('--format', choices=ARCHIVE_FORMATS, default='csv')
+    archive_cmd.add_argument('--dir', default=ARCHIVE_DIR)
+    archive_cmd.add_argument('--keep', action='store_true', help='Detach but do not drop the partitions')
+    archive_cmd.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args(argv)
+
+    from database import SQLITE, get_db_connection
+    from tenants import TenantError, tenant_context, tenant_keys
+    if SQLITE:
+        print("❌ Partitions need a PostgreSQL database; a SQLite one is a single table per kind")
+        return 1
+    try:
+        tenants = [args.tenant] if args.tenant else tenant_keys()
+        for tenant in tenants:
+            with tenant_context(tenant), get_db_connection() as conn:
+                if tenant:
+                    print(f"🏫 {tenant}")
+                if _run_command(conn, args, os.path.join(args.dir, tenant) if tenant and args.command == 'archive' else None):
+                    return 1
+    except TenantError as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+def _run_command(conn, args, archive_dir=None):
+    """One school's part of main(); returns 1 on failure"""
+    if args.command == 'maintain':
+        created = ensure_partitions(conn, months_ahead=args.months_ahead)
+        print(f"✅ Created partitions: {', '.join(created)}" if created else "✅ Partitions are up to date")
+    elif args.command == 'status':
+        print(json.dumps(partition_status(conn), indent=2))
+    else:
+        try:
+            before = datetime.strptime(args.before, '%Y-%m-%d').date()
+            archived = archive_partitions(conn, before, args.format, archive_dir or args.dir, args.keep, args.dry_run)
+        except (ValueError, PartitionError) as e:
+            print(f"❌ {e}")
+            return 1
+        for entry in archived:
+            print(f"{'Would archive' if args.dry_run else '📦 Archived'} {entry['partition']} "
+                  f"({entry['rows']} rows) -> {entry['file']}")
+        if not archived:
+            print('Nothing to archive')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
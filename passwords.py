@@ -0,0 +1,50 @@
+import os
+from functools import lru_cache
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+from workers import WorkerPoolBusy, pool_map, submit_bounded
+
+# Any werkzeug method string, e.g. 'scrypt' or 'pbkdf2:sha256:1000000'. Existing
+# hashes with other parameters are upgraded on the user's next successful login.
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+# Longest a request waits for its hash once the pool has accepted it
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '15'))
+
+def hash_password(password):
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+def hash_passwords(passwords):
+    """Hash many passwords in parallel on the shared process pool"""
+    return pool_map(hash_password, passwords)
+
+@lru_cache(maxsize=None)
+def _hash_params(method):
+    # 'pbkdf2:sha256' -> 'pbkdf2:sha256:600000': werkzeug fills in its default cost
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+def needs_rehash(stored_hash):
+    """True if stored_hash was made with a different algorithm or cost than PASSWORD_HASH_METHOD"""
+    return stored_hash.split('$', 1)[0] != _hash_params(PASSWORD_HASH_METHOD)
+
+def verify_and_upgrade(stored_hash, password):
+    """(valid, new hash or None); one trip to the pool covers both the check and the rehash"""
+    if not check_password_hash(stored_hash, password):
+        return False, None
+    return True, hash_password(password) if needs_rehash(stored_hash) else None
+
+def _offloaded(fn, *args):
+    future = submit_bounded(fn, *args)
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except FutureTimeoutError:
+        # Still queued: give the slot back. Callers treat a slow pool like a full one
+        future.cancel()
+        raise WorkerPoolBusy(f"Password hash not done within {PASSWORD_HASH_TIMEOUT}s")
+
+def verify_password(stored_hash, password):
+    """verify_and_upgrade on the process pool; raises workers.WorkerPoolBusy when it is saturated or too slow"""
+    return _offloaded(verify_and_upgrade, stored_hash, password)
+
+def hash_password_offloaded(password):
+    """hash_password on the process pool (single accounts created from a request); may raise WorkerPoolBusy"""
+    return _offloaded(hash_password, password)
@@ -0,0 +1,421 @@
+"""Monthly attendance reports for teachers and students.
+
+Attendance for the whole range is fetched in one round-trip as parallel
+integer arrays (person, day offset, status code), scattered into a dense
+people x days matrix, and every metric is computed with NumPy operations
+over that matrix, so a school year of 3,000 students is a few million
+array cells rather than a Python loop per attendance row.
+"""
+import io
+import csv
+import zlib
+import zipfile
+from xml.sax.saxutils import escape
+from datetime import datetime, timedelta
+import numpy as np
+from database import SQLITE, get_db_connection
+from migrations import MONDAY_TO_FRIDAY, TEACHER_WORKDAYS_SQL
+
+REPORT_KINDS = ('teachers', 'students')
+REPORT_FORMATS = ('json', 'csv', 'xlsx', 'pdf')
+REPORT_GROUPS = ('month', 'total')
+# A school year plus change; longer ranges should be run year by year
+REPORT_MAX_DAYS = 400
+
+# Status codes in the attendance matrix (0 = no record that day)
+NO_RECORD, PRESENT, LATE, EARLY, LEAVE, ABSENT = range(6)
+ATTENDED = (PRESENT, LATE, EARLY)
+
+REPORT_COLUMNS = {
+    'teachers': ['user_id', 'name', 'grade', 'month', 'working_days', 'present', 'late', 'early',
+                 'leave', 'absent', 'attendance_pct', 'longest_present_streak', 'longest_absent_streak'],
+    'students': ['student_id', 'name', 'grade', 'section', 'month', 'recorded_days', 'present',
+                 'absent', 'attendance_pct', 'longest_present_streak', 'longest_absent_streak']
+}
+
+class ReportError(Exception):
+    """The report can't be produced as requested (bad kind, group or range)"""
+
+# school_calendar days in the range (offsets from %(from)s) and whether each
+# is a working day; they override everyone's weekdays
+_CALENDAR_SQL = '''
+    (SELECT COALESCE(array_agg(c.date - %(from)s::date ORDER BY c.date), '{}')::text
+     FROM school_calendar c WHERE c.date BETWEEN %(from)s AND %(to)s) AS calendar_days,
+    (SELECT COALESCE(array_agg(c.is_working_day::int ORDER BY c.date), '{}')::text
+     FROM school_calendar c WHERE c.date BETWEEN %(from)s AND %(to)s) AS calendar_working
+'''
+
+TEACHER_PEOPLE_SQL = f'''
+    SELECT u.id, u.user_id, u.name, u.grade, u.is_active, u.activated_at::date AS activated_on,
+           {TEACHER_WORKDAYS_SQL} AS workdays
+    FROM users u
+    WHERE u.role = 'teacher'
+      AND (%(grade)s::text IS NULL OR u.grade = %(grade)s)
+      AND (u.is_active OR EXISTS (
+          SELECT 1 FROM employee_attendance ea
+          WHERE ea.user_id = u.id AND ea.date BETWEEN %(from)s AND %(to)s
+      ))
+    ORDER BY u.name, u.id
+'''
+
+TEACHER_FACTS_SQL = f'''
+    SELECT
+        {_CALENDAR_SQL},
+        COALESCE(array_agg(ea.user_id), '{{}}')::text AS people,
+        COALESCE(array_agg(ea.date - %(from)s::date), '{{}}')::text AS days,
+        COALESCE(array_agg(CASE ea.status
+            WHEN 'Present' THEN {PRESENT} WHEN 'Late' THEN {LATE} WHEN 'Early' THEN {EARLY}
+            WHEN 'Leave' THEN {LEAVE} WHEN 'Absent' THEN {ABSENT} ELSE {NO_RECORD} END), '{{}}')::text AS codes
+    FROM employee_attendance ea
+    JOIN users u ON u.id = ea.user_id AND u.role = 'teacher'
+    WHERE ea.date BETWEEN %(from)s AND %(to)s
+      AND (%(grade)s::text IS NULL OR u.grade = %(grade)s)
+'''
+
+STUDENT_PEOPLE_SQL = '''
+    SELECT s.id, s.student_id, s.name, s.grade, s.section
+    FROM students s
+    WHERE (%(grade)s::text IS NULL OR s.grade = %(grade)s)
+      AND (%(section)s::text IS NULL OR s.section = %(section)s)
+      AND (s.is_active OR EXISTS (
+          SELECT 1 FROM student_attendance sa
+          WHERE sa.student_id = s.id AND sa.date BETWEEN %(from)s AND %(to)s
+      ))
+    ORDER BY s.grade, s.section, s.name, s.id
+'''
+
+STUDENT_FACTS_SQL = f'''
+    SELECT
+        {_CALENDAR_SQL},
+        COALESCE(array_agg(sa.student_id), '{{}}')::text AS people,
+        COALESCE(array_agg(sa.date - %(from)s::date), '{{}}')::text AS days,
+        COALESCE(array_agg(CASE WHEN sa.is_present THEN {PRESENT} ELSE {ABSENT} END), '{{}}')::text AS codes
+    FROM student_attendance sa
+    JOIN students s ON s.id = sa.student_id
+    WHERE sa.date BETWEEN %(from)s AND %(to)s
+      AND (%(grade)s::text IS NULL OR s.grade = %(grade)s)
+      AND (%(section)s::text IS NULL OR s.section = %(section)s)
+'''
+
+def _int_array(text):
+    """Parse a PostgreSQL int[] text literal like '{1,2,3}' in C"""
+    return np.fromstring(text[1:-1], dtype=np.int64, sep=',')
+
+def _fetch(kind, params):
+    """(people rows, calendar day offsets, their working flags, person ids, day offsets, status codes)"""
+    people_sql, facts_sql = ((TEACHER_PEOPLE_SQL, TEACHER_FACTS_SQL) if kind == 'teachers'
+                             else (STUDENT_PEOPLE_SQL, STUDENT_FACTS_SQL))
+    with get_db_connection(readonly=True) as conn:
+        # One snapshot, so the facts never name a person the people query missed
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(people_sql, params)
+            people = cursor.fetchall()
+            cursor.execute(facts_sql, params)
+            facts = cursor.fetchone()
+            conn.commit()
+        finally:
+            conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
+    return (people, _int_array(facts['calendar_days']), _int_array(facts['calendar_working']),
+            _int_array(facts['people']), _int_array(facts['days']), _int_array(facts['codes']))
+
+def _status_matrix(person_ids, people, days, codes, num_days):
+    """people x days int8 matrix of status codes"""
+    matrix = np.zeros((len(person_ids), num_days), dtype=np.int8)
+    if not len(person_ids) or not len(people):
+        return matrix
+    order = np.argsort(person_ids)
+    sorted_ids = person_ids[order]
+    slots = np.minimum(np.searchsorted(sorted_ids, people), len(sorted_ids) - 1)
+    known = sorted_ids[slots] == people
+    matrix[order[slots[known]], days[known]] = codes[known]
+    return matrix
+
+def _working_matrix(workdays, date_from, num_days, calendar_days, calendar_working):
+    """rows x days bool matrix of working days, one row per workdays mask (Monday = bit 0)"""
+    weekday = (date_from.weekday() + np.arange(num_days)) % 7
+    working = (np.asarray(workdays, dtype=np.int64).reshape(-1, 1) >> weekday) & 1 == 1
+    working[:, calendar_days] = (calendar_working == 1)
+    return working
+
+def longest_runs(mask, weight=None):
+    """Length of the longest run of True in each row of a 2-D boolean array.
+
+    With a same-shaped 0/1 weight, a run's length is the sum of its
+    weights, so cells of weight 0 neither break a run nor lengthen it.
+    """
+    result = np.zeros(mask.shape[0], dtype=np.int64)
+    if mask.shape[1] == 0:
+        return result
+    edges = np.diff(np.pad(mask.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    # Row-major nonzero order pairs each run's start with its end
+    start_rows, start_cols = np.nonzero(edges == 1)
+    _, end_cols = np.nonzero(edges == -1)
+    if weight is None:
+        lengths = end_cols - start_cols
+    else:
+        totals = np.pad(np.cumsum(weight, axis=1, dtype=np.int64), ((0, 0), (1, 0)))
+        lengths = totals[start_rows, end_cols] - totals[start_rows, start_cols]
+    np.maximum.at(result, start_rows, lengths)
+    return result
+
+def _month_bounds(date_from, date_to):
+    """([label], [first day offset]) for each calendar month touched by the range"""
+    labels, starts = [], []
+    month = date_from.replace(day=1)
+    while month <= date_to:
+        labels.append(month.strftime('%Y-%m'))
+        starts.append(max((month - date_from).days, 0))
+        month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return labels, starts
+
+def _period_metrics(matrix, counted, working, starts, num_days):
+    """Per-person metrics for each period starting at the given day offsets: {name: people x periods}"""
+    def per_period(mask):
+        return np.add.reduceat(mask, starts, axis=1, dtype=np.int64)
+
+    metrics = {
+        'days': per_period(counted),
+        'present': per_period(matrix == PRESENT),
+        'late': per_period(matrix == LATE),
+        'early': per_period(matrix == EARLY),
+        'leave': per_period(matrix == LEAVE),
+        'absent': per_period(matrix == ABSENT)
+    }
+    attended = metrics['present'] + metrics['late'] + metrics['early']
+    # Leave is excused: it counts neither for nor against the percentage
+    expected = metrics['days'] - metrics['leave']
+    metrics['attendance_pct'] = np.round(
+        np.divide(attended * 100.0, expected, out=np.full(expected.shape, np.nan), where=expected > 0), 1)
+
+    # Streaks run over each person's working days only, so their days off
+    # and holidays don't break them
+    working = np.broadcast_to(working, matrix.shape)
+    attended_mask = np.isin(matrix, ATTENDED) | ~working
+    absent_mask = (matrix == ABSENT) | ~working
+    present_streaks, absent_streaks = [], []
+    for start, end in zip(starts, list(starts[1:]) + [num_days]):
+        present_streaks.append(longest_runs(attended_mask[:, start:end], working[:, start:end]))
+        absent_streaks.append(longest_runs(absent_mask[:, start:end], working[:, start:end]))
+    metrics['longest_present_streak'] = np.column_stack(present_streaks)
+    metrics['longest_absent_streak'] = np.column_stack(absent_streaks)
+    return metrics
+
+def build_attendance_report(kind, date_from=None, date_to=None, grade=None, section=None, group='month'):
+    """Attendance metrics per person and month (group='month') or for the whole range ('total').
+
+    Teachers are expected on each of their working days (shift policy
+    weekdays, unless school_calendar says otherwise) from activation, and
+    such a day with no record counts as absent (as in the dashboard
+    stats). Students are measured on the days a roll-call recorded them.
+    Returns {'kind', 'from', 'to', 'group', 'columns', 'rows'}.
+    """
+    if SQLITE:
+        raise ReportError('Reports need a PostgreSQL database')
+    if kind not in REPORT_KINDS:
+        raise ReportError(f'Report kind must be one of: {", ".join(REPORT_KINDS)}')
+    if group not in REPORT_GROUPS:
+        raise ReportError(f'Group must be one of: {", ".join(REPORT_GROUPS)}')
+    today = datetime.now().date()
+    date_to = min(date_to or today, today)
+    date_from = date_from or date_to.replace(day=1)
+    if date_from > date_to:
+        raise ReportError('from must not be after to (or today)')
+    num_days = (date_to - date_from).days + 1
+    if num_days > REPORT_MAX_DAYS:
+        raise ReportError(f'Reports cover at most {REPORT_MAX_DAYS} days')
+
+    grade = grade if grade and grade != 'All' else None
+    params = {'from': date_from, 'to': date_to, 'grade': grade, 'section': section or None}
+    people, calendar_days, calendar_working, fact_people, fact_days, fact_codes = _fetch(kind, params)
+
+    person_ids = np.array([p['id'] for p in people], dtype=np.int64)
+    matrix = _status_matrix(person_ids, fact_people, fact_days, fact_codes, num_days)
+    recorded = matrix != NO_RECORD
+
+    if kind == 'teachers':
+        working = _working_matrix([p['workdays'] for p in people], date_from, num_days,
+                                  calendar_days, calendar_working)
+        # Active teachers are expected from their activation day; inactive ones only where recorded
+        first_day = np.array([
+            max((p['activated_on'] - date_from).days, 0) if p['is_active'] and p['activated_on'] else
+            (0 if p['is_active'] else num_days)
+            for p in people
+        ], dtype=np.int64).reshape(-1, 1)
+        expected = working & (np.arange(num_days) >= first_day)
+        matrix[expected & ~recorded] = ABSENT
+        counted = expected | recorded
+    else:
+        working = _working_matrix([MONDAY_TO_FRIDAY], date_from, num_days, calendar_days, calendar_working)
+        counted = recorded
+
+    if group == 'month':
+        labels, starts = _month_bounds(date_from, date_to)
+    else:
+        labels, starts = [f'{date_from.isoformat()}..{date_to.isoformat()}'], [0]
+    metrics = _period_metrics(matrix, counted, working, starts, num_days)
+
+    if kind == 'teachers':
+        identity = [(p['user_id'], p['name'], p['grade']) for p in people]
+        names = ['days', 'present', 'late', 'early', 'leave', 'absent', 'attendance_pct',
+                 'longest_present_streak', 'longest_absent_streak']
+    else:
+        identity = [(p['student_id'], p['name'], p['grade'], p['section']) for p in people]
+        names = ['days', 'present', 'absent', 'attendance_pct',
+                 'longest_present_streak', 'longest_absent_streak']
+    columns = REPORT_COLUMNS[kind]
+    values = [metrics[name].tolist() for name in names]
+    pct = columns.index('attendance_pct')
+    rows = []
+    for i, person in enumerate(identity):
+        for m, label in enumerate(labels):
+            row = [*person, label] + [v[i][m] for v in values]
+            # NaN (nothing expected in the period) becomes null
+            if row[pct] != row[pct]:
+                row[pct] = None
+            rows.append(dict(zip(columns, row)))
+
+    return {
+        'kind': kind,
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'group': group,
+        'columns': columns,
+        'rows': rows
+    }
+
+# ======================
+# EXPORTS
+# ======================
+
+def report_csv(report):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(report['columns'])
+    for row in report['rows']:
+        writer.writerow(['' if v is None else v for v in row.values()])
+    return buffer.getvalue().encode('utf-8')
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>')
+}
+
+def report_xlsx(report):
+    """Single-sheet workbook written directly as SpreadsheetML.
+
+    openpyxl (used for roster imports) builds a Python object per cell and
+    takes tens of seconds for a year of monthly student rows; the sheet
+    here is generated as one XML string instead.
+    """
+    sheet_name = escape(f"{report['kind'].title()} {report['from']} to {report['to']}"[:31])
+    rows = [report['columns']] + [list(row.values()) for row in report['rows']]
+    sheet = ''.join('<row>' + ''.join(map(_xlsx_cell, row)) + '</row>' for row in rows)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, xml in _XLSX_PARTS.items():
+            archive.writestr(name, xml)
+        archive.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets></workbook>'))
+        archive.writestr('xl/worksheets/sheet1.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            f'<sheetData>{sheet}</sheetData></worksheet>'))
+    return buffer.getvalue()
+
+# Landscape A4 in points, Courier: fixed-width columns line up without font metrics
+_PDF_PAGE_WIDTH, _PDF_PAGE_HEIGHT = 842, 595
+_PDF_MARGIN = 36
+_PDF_MAX_FONT_SIZE = 8
+_PDF_CHAR_WIDTH = 0.6  # Courier advance per point of font size
+_PDF_MAX_CELL = 28
+
+def _pdf_text(text):
+    text = text.encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def report_pdf(report):
+    """Tabular report as a plain PDF (standard Courier font, nothing embedded)"""
+    columns = report['columns']
+    cells = [[('' if v is None else str(v))[:_PDF_MAX_CELL] for v in row.values()] for row in report['rows']]
+    widths = [max([len(c)] + [len(row[i]) for row in cells]) for i, c in enumerate(columns)]
+    def line(values):
+        return '  '.join(v.ljust(w) for v, w in zip(values, widths)).rstrip()
+
+    title = f"{report['kind'].title()} attendance {report['from']} to {report['to']}"
+    header = [line(columns), line(['-' * w for w in widths])]
+    # Shrink the font until the widest line fits the page
+    usable = _PDF_PAGE_WIDTH - 2 * _PDF_MARGIN
+    font_size = min(_PDF_MAX_FONT_SIZE, usable / (_PDF_CHAR_WIDTH * max(len(header[0]), len(title) + 20)))
+    leading = font_size * 1.25
+    per_page = int((_PDF_PAGE_HEIGHT - 2 * _PDF_MARGIN) // leading) - len(header) - 2
+    body = [line(row) for row in cells] or ['No attendance in this range']
+    pages = [body[i:i + per_page] for i in range(0, len(body), per_page)]
+
+    objects = []
+    page_ids = []
+    font_id = 3
+    objects.append(b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>')
+    for number, page_lines in enumerate(pages, 1):
+        text = [f'{title}  (page {number} of {len(pages)})', ''] + header + page_lines
+        stream = zlib.compress((f'BT /F1 {font_size:.2f} Tf {leading:.2f} TL {_PDF_MARGIN} '
+                                f'{_PDF_PAGE_HEIGHT - _PDF_MARGIN} Td '
+                                + ' '.join(f'({_pdf_text(t)}) Tj T*' for t in text) + ' ET').encode('latin-1'))
+        content_id = 2 + len(objects) + 1
+        objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        page_ids.append(content_id + 1)
+        objects.append((f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_PDF_PAGE_WIDTH} {_PDF_PAGE_HEIGHT}] '
+                        f'/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>').encode())
+
+    kids = ' '.join(f'{i} 0 R' for i in page_ids)
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>',
+               f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'.encode()] + objects
+    output = io.BytesIO()
+    output.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body_bytes in enumerate(objects, 1):
+        offsets.append(output.tell())
+        output.write(b'%d 0 obj\n' % number + body_bytes + b'\nendobj\n')
+    xref = output.tell()
+    output.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        output.write(b'%010d 00000 n \n' % offset)
+    output.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+    return output.getvalue()
+
+REPORT_EXPORTS = {
+    'csv': (report_csv, 'text/csv'),
+    'xlsx': (report_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'pdf': (report_pdf, 'application/pdf')
+}
@@ -0,0 +1,220 @@
+import io
+import csv
+import zipfile
+from database import SQLITE, get_db_connection
+from models import roster_cache
+from passwords import hash_passwords
+
+# Rows validated and COPYed to staging per batch; bounds memory for big files
+IMPORT_CHUNK_SIZE = 500
+
+ROSTER_COLUMNS = {
+    'students': {
+        'required': ['student_id', 'name', 'grade', 'section', 'parent_contact'],
+        'optional': ['parent_name']
+    },
+    'teachers': {
+        'required': ['user_id', 'password', 'name', 'grade', 'email', 'phone'],
+        'optional': ['address']
+    }
+}
+
+class RosterImportError(Exception):
+    """The upload as a whole can't be imported (bad format or header)"""
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    # Spreadsheets store numeric ids and phone numbers as floats
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def _iter_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    for row in csv.reader(text):
+        yield [_cell_text(v) for v in row]
+
+def _iter_xlsx(stream):
+    try:
+        import openpyxl
+    except ImportError:
+        raise RosterImportError('XLSX import requires the openpyxl package')
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield [_cell_text(v) for v in row]
+    finally:
+        workbook.close()
+
+def _iter_records(stream, file_format, kind):
+    """Yield (row_number, {column: value}) from a CSV/XLSX upload, checking the header"""
+    rows = _iter_xlsx(stream) if file_format == 'xlsx' else _iter_csv(stream)
+    header = next(rows, None)
+    if not header:
+        raise RosterImportError('File is empty')
+    header = [h.lower().replace(' ', '_') for h in header]
+    missing = [c for c in ROSTER_COLUMNS[kind]['required'] if c not in header]
+    if missing:
+        raise RosterImportError(f'Missing required column(s): {", ".join(missing)}')
+
+    for row_number, values in enumerate(rows, start=2):
+        if not any(values):
+            continue
+        yield row_number, dict(zip(header, values))
+
+def _validate(kind, record, seen, teacher_grade):
+    columns = ROSTER_COLUMNS[kind]
+    missing = [c for c in columns['required'] if not record.get(c)]
+    if missing:
+        return f'Missing required field(s): {", ".join(missing)}'
+
+    key = record['student_id'] if kind == 'students' else record['user_id']
+    if key in seen:
+        return f'Duplicate {"student_id" if kind == "students" else "user_id"} in file (row {seen[key]})'
+
+    if teacher_grade is not None and record['grade'] != teacher_grade:
+        return 'You can only add students to your assigned grade'
+    return None
+
+def _copy_chunk(cursor, kind, chunk):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if kind == 'teachers':
+        hashes = hash_passwords([record['password'] for _, record in chunk])
+        for (row_number, r), hashed_pw in zip(chunk, hashes):
+            writer.writerow([row_number, r['user_id'], hashed_pw, r['name'], r['grade'],
+                             r['email'], r['phone'], r.get('address', '')])
+    else:
+        for row_number, r in chunk:
+            writer.writerow([row_number, r['student_id'], r['name'], r['grade'], r['section'],
+                             r.get('parent_name', ''), r['parent_contact']])
+    buffer.seek(0)
+    cursor.copy_expert(f'COPY import_{kind} FROM STDIN WITH (FORMAT csv)', buffer)
+
+_STAGING_SQL = {
+    'students': '''
+        CREATE TEMP TABLE import_students (
+            row_num INTEGER, student_id TEXT, name TEXT, grade TEXT,
+            section TEXT, parent_name TEXT, parent_contact TEXT
+        ) ON COMMIT DROP
+    ''',
+    'teachers': '''
+        CREATE TEMP TABLE import_teachers (
+            row_num INTEGER, user_id TEXT, password TEXT, name TEXT,
+            grade TEXT, email TEXT, phone TEXT, address TEXT
+        ) ON COMMIT DROP
+    '''
+}
+
+# Existing students are updated (teachers may only touch their own grade);
+# existing teacher accounts are never overwritten.
+_MERGE_SQL = {
+    'students': '''
+        WITH merged AS (
+            INSERT INTO students (student_id, name, grade, section, parent_name, parent_contact, created_by)
+            SELECT student_id, name, grade, section, parent_name, parent_contact, %(created_by)s
+            FROM import_students
+            ORDER BY row_num
+            ON CONFLICT (student_id) DO UPDATE SET
+                name = EXCLUDED.name,
+                grade = EXCLUDED.grade,
+                section = EXCLUDED.section,
+                parent_name = EXCLUDED.parent_name,
+                parent_contact = EXCLUDED.parent_contact,
+                is_active = TRUE
+            WHERE %(is_admin)s OR students.grade = EXCLUDED.grade
+            RETURNING student_id, (xmax = 0) AS inserted
+        )
+        SELECT
+            (SELECT COUNT(*) FROM merged WHERE inserted) AS inserted,
+            (SELECT COUNT(*) FROM merged WHERE NOT inserted) AS updated,
+            COALESCE((
+                SELECT json_agg(json_build_object('row', s.row_num, 'error', 'Student ID already exists in another grade')
+                                ORDER BY s.row_num)
+                FROM import_students s
+                WHERE s.student_id NOT IN (SELECT student_id FROM merged)
+            ), '[]') AS errors
+    ''',
+    'teachers': '''
+        WITH merged AS (
+            INSERT INTO users (user_id, password, role, name, grade, email, phone, address, is_active)
+            SELECT user_id, password, 'teacher', name, grade, email, phone, address, FALSE
+            FROM import_teachers
+            ORDER BY row_num
+            ON CONFLICT (user_id) DO NOTHING
+            RETURNING user_id
+        )
+        SELECT
+            (SELECT COUNT(*) FROM merged) AS inserted,
+            0 AS updated,
+            COALESCE((
+                SELECT json_agg(json_build_object('row', t.row_num, 'error', 'User ID already exists')
+                                ORDER BY t.row_num)
+                FROM import_teachers t
+                WHERE t.user_id NOT IN (SELECT user_id FROM merged)
+            ), '[]') AS errors
+    '''
+}
+
+def import_roster(kind, stream, file_format, created_by_user_id, user_role):
+    """Stream a CSV/XLSX roster into students or users in one transaction.
+
+    Rows are validated and COPYed into a temporary staging table in chunks
+    (teacher passwords are hashed on the process pool), then merged with a
+    single INSERT ... ON CONFLICT. Invalid rows are skipped and reported
+    as {'row': line number, 'error': message}; teachers come in inactive,
+    exactly like add_employee.
+    """
+    if kind not in ROSTER_COLUMNS:
+        return {'success': False, 'error': f'Unknown roster type: {kind}'}
+    if SQLITE:
+        # COPY into a staging table has no SQLite counterpart
+        return {'success': False, 'error': 'Roster import needs a PostgreSQL database'}
+
+    errors = []
+    seen = {}
+    chunk = []
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+
+            teacher_grade = None
+            if user_role == 'teacher':
+                cursor.execute('SELECT grade FROM users WHERE id = %s', (created_by_user_id,))
+                teacher = cursor.fetchone()
+                if not teacher:
+                    return {'success': False, 'error': 'Teacher not found'}
+                teacher_grade = teacher['grade']
+
+            cursor.execute(_STAGING_SQL[kind])
+            for row_number, record in _iter_records(stream, file_format, kind):
+                error = _validate(kind, record, seen, teacher_grade)
+                if error:
+                    errors.append({'row': row_number, 'error': error})
+                    continue
+                seen[record['student_id'] if kind == 'students' else record['user_id']] = row_number
+                chunk.append((row_number, record))
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    _copy_chunk(cursor, kind, chunk)
+                    chunk = []
+            if chunk:
+                _copy_chunk(cursor, kind, chunk)
+
+            cursor.execute(_MERGE_SQL[kind], {'created_by': created_by_user_id, 'is_admin': user_role == 'admin'})
+            result = cursor.fetchone()
+            conn.commit()
+        if kind == 'students':
+            # Imports are rare: drop this worker's rosters now, others follow via roster_versions
+            roster_cache.clear()
+    except (RosterImportError, UnicodeDecodeError, csv.Error, zipfile.BadZipFile) as e:
+        return {'success': False, 'error': f'Could not read file: {e}'}
+
+    errors = sorted(errors + result['errors'], key=lambda e: e['row'])
+    return {
+        'success': True,
+        'inserted': result['inserted'],
+        'updated': result['updated'],
+        'rejected': len(errors),
+        'errors': errors
+    }
@@ -0,0 +1,272 @@
+"""Response serialization: fast JSON, columnar lists and compression.
+
+JSON goes through orjson when it is installed (JSON_ENCODER=stdlib turns
+it off), which serializes dicts, database rows, dates and times natively.
+Dates and datetimes come out as ISO 8601 either way.
+
+List endpoints accept ?format=columns and answer
+{"columns": [...], "rows": [[...], ...]} in place of a list of objects,
+sending each key once instead of once per row.
+
+Responses of COMPRESS_MIN_BYTES or more are gzip- or brotli-compressed
+(brotli needs the Brotli package) when the client accepts it. Streamed
+exports are compressed as they go; server-sent events never are.
+"""
+import os
+import json
+import zlib
+import decimal
+import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_ENCODER = os.environ.get('JSON_ENCODER', 'orjson' if orjson else 'stdlib').lower()
+if JSON_ENCODER == 'orjson' and orjson is None:
+    print("⚠️  JSON_ENCODER=orjson but orjson is not installed; using the standard library")
+    JSON_ENCODER = 'stdlib'
+
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION', 'true').lower() == 'true'
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', '5'))
+# Brotli quality 4 compresses better than gzip -6 at a similar speed
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '4'))
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv', 'text/html', 'text/plain', 'text/css',
+                      'application/javascript', 'image/svg+xml')
+
+# ======================
+# JSON
+# ======================
+
+def _default(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+if JSON_ENCODER == 'orjson':
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """Compact UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    def dumps(obj):
+        """Compact UTF-8 JSON bytes"""
+        return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode()
+
+    loads = json.loads
+
+def fast_json_provider(base):
+    """Subclass of a Flask/Quart JSON provider that serializes with dumps()"""
+    class FastJSONProvider(base):
+        def dumps(self, obj, **kwargs):
+            return dumps(obj).decode()
+
+        def loads(self, s, **kwargs):
+            return loads(s)
+    return FastJSONProvider
+
+# ======================
+# COLUMNAR LISTS
+# ======================
+
+def wants_columns(args):
+    return args.get('format', '').lower() == 'columns'
+
+def columnar(records):
+    """{'columns', 'rows'} for a list of dicts that share their keys"""
+    if not records:
+        return {'columns': [], 'rows': []}
+    columns = list(records[0])
+    return {'columns': columns, 'rows': [[record[column] for column in columns] for record in records]}
+
+def list_payload(records, args):
+    """records as requested: a list of objects, or columnar with ?format=columns"""
+    return columnar(records) if wants_columns(args) else records
+
+def _stream_prefix(key, columns):
+    return b'{' + dumps(key) + (b':{"columns":' + dumps(columns) + b',"rows":[' if columns is not None else b':[')
+
+def stream_json_list(key, records, as_columns=False):
+    """Yield {key: [records]} as JSON bytes, one record at a time"""
+    first = True
+    columns = None
+    for record in records:
+        if first:
+            columns = list(record) if as_columns else None
+            yield _stream_prefix(key, columns)
+        yield (b'' if first else b',') + dumps([record[c] for c in columns] if as_columns else record)
+        first = False
+    if first:
+        yield _stream_prefix(key, [] if as_columns else None)
+    yield b']}}' if as_columns else b']}'
+
+async def stream_json_list_async(key, records, as_columns=False):
+    """stream_json_list over an async iterator of records"""
+    first = True
+    columns = None
+    async for record in records:
+        if first:
+            columns = list(record) if as_columns else None
+            yield _stream_prefix(key, columns)
+        yield (b'' if first else b',') + dumps([record[c] for c in columns] if as_columns else record)
+        first = False
+    if first:
+        yield _stream_prefix(key, [] if as_columns else None)
+    yield b']}}' if as_columns else b']}'
+
+# ======================
+# COMPRESSION
+# ======================
+
+def negotiate_encoding(accept_encoding):
+    """'br', 'gzip' or None for an Accept-Encoding header, honouring q-values"""
+    offered = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name] = quality
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best, best_quality = None, 0.0
+    for name in candidates:
+        quality = offered.get(name, offered.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+class _StreamCompressor:
+    """Incremental gzip/brotli; output is held until a block fills, so small chunks still compress well"""
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+            self.compress = self._compressor.process
+            self.flush = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+            self.compress = self._compressor.compress
+            self.flush = self._compressor.flush
+
+def _compress_iter(chunks, encoding):
+    compressor = _StreamCompressor(encoding)
+    try:
+        for chunk in chunks:
+            out = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+            if out:
+                yield out
+        yield compressor.flush()
+    finally:
+        # A disconnecting client closes this generator; pass that on so an
+        # export's server-side cursor returns its connection right away
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+async def _compress_aiter(body, encoding):
+    compressor = _StreamCompressor(encoding)
+    async with body as chunks:
+        async for chunk in chunks:
+            out = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+            if out:
+                yield out
+    yield compressor.flush()
+
+def _compressible(response):
+    if 'Content-Encoding' in response.headers or response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    return response.mimetype in COMPRESSIBLE_TYPES
+
+def _mark_encoded(response, encoding):
+    response.headers['Content-Encoding'] = encoding
+    # Encoded bytes differ from the original's, the representation does not
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+def _add_vary(response):
+    response.vary.add('Accept-Encoding')
+
+def compress_flask(app):
+    """Compress a Flask app's responses per the request's Accept-Encoding"""
+    from flask import request
+
+    @app.after_request
+    def _compress_response(response):
+        if not _compressible(response):
+            return response
+        if response.is_streamed:
+            # Generators only; send_file responses are passed through untouched
+            if response.direct_passthrough:
+                return response
+            _add_vary(response)
+            encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+            if encoding:
+                response.response = _compress_iter(response.response, encoding)
+                response.headers.pop('Content-Length', None)
+                _mark_encoded(response, encoding)
+            return response
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        _add_vary(response)
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if encoding:
+            response.set_data(compress(data, encoding))
+            _mark_encoded(response, encoding)
+        return response
+
+def compress_quart(app):
+    """Async counterpart of compress_flask"""
+    from quart import request
+    from quart.wrappers.response import DataBody, IterableBody
+
+    @app.after_request
+    async def _compress_response(response):
+        if not _compressible(response):
+            return response
+        if isinstance(response.response, IterableBody):
+            _add_vary(response)
+            encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+            if encoding:
+                response.response = IterableBody(_compress_aiter(response.response, encoding))
+                response.headers.pop('Content-Length', None)
+                _mark_encoded(response, encoding)
+            return response
+        if not isinstance(response.response, DataBody):
+            return response
+        data = await response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        _add_vary(response)
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if encoding:
+            response.set_data(compress(data, encoding))
+            _mark_encoded(response, encoding)
+        return response
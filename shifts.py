@@ -0,0 +1,508 @@
+"""Shift policies: when a teacher is Late or Early, and which days they work.
+
+A policy (shift_policies, migration 12) is a check-in deadline, a check-out
+time and the weekdays it applies to. shift_assignments gives one to a
+teacher, to a grade or to the whole school, the most specific winning;
+with none the school keeps SHIFT_CHECK_IN_BY/SHIFT_CHECK_OUT_FROM, Monday
+to Friday. A school_calendar entry decides a date for everyone: a holiday,
+a make-up day, or a half-day with its own policy. A scan on a day someone
+doesn't work is recorded as Present.
+
+ShiftSchedule loads a school's policies, assignments and calendar into
+dicts of minutes since midnight, so a scan's thresholds are a few lookups.
+It reloads every SHIFT_POLICY_REFRESH_SECONDS, and at once in the worker
+that made a change. Changing a policy only affects new scans; re-derive
+the statuses already recorded for a range with POST /api/shifts/recompute
+or:
+
+    python shifts.py recompute --from 2026-09-01 --to 2026-10-17
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import namedtuple
+from datetime import date, time as dt_time
+import numpy as np
+from database import SQLITE, IntegrityError, get_db_connection
+from migrations import MONDAY_TO_FRIDAY
+from tenants import TenantLocal
+
+SHIFT_CHECK_IN_BY = os.environ.get('SHIFT_CHECK_IN_BY', '09:05')
+SHIFT_CHECK_OUT_FROM = os.environ.get('SHIFT_CHECK_OUT_FROM', '16:55')
+SHIFT_POLICY_REFRESH_SECONDS = float(os.environ.get('SHIFT_POLICY_REFRESH_SECONDS', '30'))
+
+# Weekday bits of shift_policies.workdays: ISO weekday 1 (Monday) is bit 0
+ISO_WEEKDAYS = range(1, 8)
+
+class ShiftPolicyError(Exception):
+    """A policy, assignment or calendar change that can't be applied"""
+
+def parse_minutes(value):
+    """Minutes since midnight of a time or 'HH:MM[:SS]' text; ValueError if malformed"""
+    if isinstance(value, dt_time):
+        return value.hour * 60 + value.minute
+    parts = value.split(':') if isinstance(value, str) else ()
+    if len(parts) not in (2, 3) or not all(len(part) == 2 and part.isdigit() for part in parts):
+        raise ValueError(f'Invalid time: {value!r}')
+    hours, minutes = int(parts[0]), int(parts[1])
+    if hours > 23 or minutes > 59:
+        raise ValueError(f'Invalid time: {value!r}')
+    return hours * 60 + minutes
+
+def format_minutes(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+def workdays_mask(iso_weekdays):
+    return sum(1 << (day - 1) for day in set(iso_weekdays))
+
+def workdays_list(mask):
+    return [day for day in ISO_WEEKDAYS if mask >> (day - 1) & 1]
+
+# Times in minutes since midnight; check_in_by None on a day off (no rules)
+Shift = namedtuple('Shift', 'policy_id check_in_by check_out_from')
+
+DEFAULT_SHIFT = Shift(None, parse_minutes(SHIFT_CHECK_IN_BY), parse_minutes(SHIFT_CHECK_OUT_FROM))
+DAY_OFF = Shift(None, None, None)
+
+def shift_status(shift, check_in, check_out=None):
+    """'Late', 'Early' or 'Present' for a day's check-in/out minutes under shift"""
+    if shift.check_in_by is None:
+        return 'Present'
+    if check_in > shift.check_in_by:
+        return 'Late'
+    if check_out is not None and check_out < shift.check_out_from:
+        return 'Early'
+    return 'Present'
+
+# Status codes of the vectorized recompute
+PRESENT, LATE, EARLY = range(3)
+STATUS_NAMES = ('Present', 'Late', 'Early')
+
+class CompiledSchedule:
+    """A school's shift rules as lookups, built once per load.
+
+    Policies are indexes into parallel arrays, index 0 being the built-in
+    default, so the same tables serve one scan (shift_for) and a whole
+    date range of rows at once (derive_statuses).
+    """
+
+    def __init__(self, policies, assignments, calendar):
+        self.index = {None: 0}
+        check_in_by, check_out_from, workdays = [DEFAULT_SHIFT.check_in_by], [DEFAULT_SHIFT.check_out_from], [MONDAY_TO_FRIDAY]
+        for row in policies:
+            self.index[row['id']] = len(check_in_by)
+            check_in_by.append(parse_minutes(row['check_in_by']))
+            check_out_from.append(parse_minutes(row['check_out_from']))
+            workdays.append(row['workdays'])
+        self.policy_ids = [None, *(row['id'] for row in policies)]
+        self.check_in_by = np.array(check_in_by, dtype=np.int32)
+        self.check_out_from = np.array(check_out_from, dtype=np.int32)
+        self.workdays = np.array(workdays, dtype=np.int32)
+
+        self.by_user, self.by_grade, self.school = {}, {}, 0
+        for row in assignments:
+            policy = self.index[row['policy_id']]
+            if row['user_id'] is not None:
+                self.by_user[row['user_id']] = policy
+            elif row['grade'] is not None:
+                self.by_grade[row['grade']] = policy
+            else:
+                self.school = policy
+        # date: (is_working_day, policy index or -1)
+        self.calendar = {row['date']: (bool(row['is_working_day']), self.index.get(row['shift_policy_id'], -1))
+                         for row in calendar}
+
+    def policy_of(self, user_id, grade):
+        return self.by_user.get(user_id, self.by_grade.get(grade, self.school))
+
+    def shift_for(self, user_id, grade, day):
+        """The Shift a teacher works on day (DAY_OFF if they don't)"""
+        working, policy = self.calendar.get(day, (None, -1))
+        if policy < 0:
+            policy = self.policy_of(user_id, grade)
+        if working is None:
+            working = bool(self.workdays[policy] >> day.weekday() & 1)
+        if not working:
+            return DAY_OFF
+        return Shift(self.policy_ids[policy], int(self.check_in_by[policy]), int(self.check_out_from[policy]))
+
+    def derive_statuses(self, day_from, user_policies, offsets, check_in, check_out):
+        """Status codes for rows of (policy index, day offset from day_from, check-in, check-out or -1)"""
+        days, day_pos = np.unique(offsets, return_inverse=True)
+        dates = [date.fromordinal(day_from.toordinal() + int(offset)) for offset in days]
+        overrides = [self.calendar.get(day, (None, -1)) for day in dates]
+        calendar_working = np.array([-1 if working is None else int(working) for working, _ in overrides], dtype=np.int8)[day_pos]
+        calendar_policy = np.array([policy for _, policy in overrides], dtype=np.int32)[day_pos]
+        weekday = np.array([day.weekday() for day in dates], dtype=np.int32)[day_pos]
+
+        policy = np.where(calendar_policy >= 0, calendar_policy, user_policies)
+        working = np.where(calendar_working >= 0, calendar_working == 1, (self.workdays[policy] >> weekday) & 1 == 1)
+        late = check_in > self.check_in_by[policy]
+        early = (check_out >= 0) & (check_out < self.check_out_from[policy])
+        return np.where(working & late, LATE, np.where(working & early, EARLY, PRESENT)).astype(np.int8)
+
+SCHEDULE_POLICIES_SQL = 'SELECT id, check_in_by, check_out_from, workdays FROM shift_policies ORDER BY id'
+SCHEDULE_ASSIGNMENTS_SQL = 'SELECT policy_id, grade, user_id FROM shift_assignments'
+SCHEDULE_CALENDAR_SQL = 'SELECT date, is_working_day, shift_policy_id FROM school_calendar'
+
+def load_schedule(cursor):
+    cursor.execute(SCHEDULE_POLICIES_SQL)
+    policies = cursor.fetchall()
+    cursor.execute(SCHEDULE_ASSIGNMENTS_SQL)
+    assignments = cursor.fetchall()
+    cursor.execute(SCHEDULE_CALENDAR_SQL)
+    return CompiledSchedule(policies, assignments, cursor.fetchall())
+
+class ShiftSchedule:
+    """Per-process CompiledSchedule of one school (``tenant``), reloaded every ``refresh_after`` seconds"""
+
+    def __init__(self, refresh_after, tenant=None):
+        self.refresh_after = refresh_after
+        self.tenant = tenant
+        self._compiled = None
+        self._refresh_lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._counters = {'loads': 0, 'load_errors': 0}
+
+    def refresh(self):
+        with get_db_connection(self.tenant) as conn:
+            compiled = load_schedule(conn.cursor())
+        self._compiled = compiled
+        self._counters['loads'] += 1
+        self._loaded_at = time.monotonic()
+
+    def refresh_if_stale(self):
+        if self._compiled is not None and time.monotonic() - self._loaded_at < self.refresh_after:
+            return
+        if self._compiled is None:
+            # Nothing to serve from yet: wait for whoever is loading
+            with self._refresh_lock:
+                if self._compiled is None:
+                    self.refresh()
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            self._counters['load_errors'] += 1
+            self._loaded_at = time.monotonic()
+            print(f"⚠️  Shift schedule refresh failed: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def compiled(self):
+        self.refresh_if_stale()
+        return self._compiled
+
+    def loaded(self):
+        """The last CompiledSchedule without refreshing it (None before the first load)"""
+        return self._compiled
+
+    def shift_for(self, user_id, grade, day):
+        return self.compiled().shift_for(user_id, grade, day)
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+    def stats(self):
+        compiled = self._compiled
+        return {'policies': len(compiled.policy_ids) - 1 if compiled else 0,
+                'calendar_days': len(compiled.calendar) if compiled else 0, **self._counters}
+
+shift_schedule = TenantLocal(lambda tenant: ShiftSchedule(SHIFT_POLICY_REFRESH_SECONDS, tenant))
+
+def scan_thresholds(user_id, grade, day, schedule=None):
+    """('HH:MM' late, 'HH:MM' early) for the scan upsert; (None, None) on a day off.
+
+    schedule is a CompiledSchedule to use as is (default: the current
+    school's, refreshed if stale, which may query the database).
+    """
+    shift = (schedule or shift_schedule.compiled()).shift_for(user_id, grade, day)
+    if shift.check_in_by is None:
+        return None, None
+    return format_minutes(shift.check_in_by), format_minutes(shift.check_out_from)
+
+# ======================
+# POLICIES, ASSIGNMENTS AND CALENDAR
+# ======================
+
+def _policy_payload(row):
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'check_in_by': format_minutes(parse_minutes(row['check_in_by'])),
+        'check_out_from': format_minutes(parse_minutes(row['check_out_from'])),
+        'workdays': workdays_list(row['workdays'])
+    }
+
+def list_shift_policies():
+    """{'default', 'policies', 'assignments'}; an assignment's grade and user_id are both None for the school"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, name, check_in_by, check_out_from, workdays FROM shift_policies ORDER BY name')
+        policies = [_policy_payload(row) for row in cursor.fetchall()]
+        cursor.execute('''
+            SELECT a.policy_id, p.name AS policy, a.grade, a.user_id, u.user_id AS teacher, u.name AS teacher_name
+            FROM shift_assignments a
+            JOIN shift_policies p ON p.id = a.policy_id
+            LEFT JOIN users u ON u.id = a.user_id
+            ORDER BY a.user_id IS NOT NULL, a.grade IS NOT NULL, a.grade, u.name
+        ''')
+        assignments = cursor.fetchall()
+    default = {'check_in_by': format_minutes(DEFAULT_SHIFT.check_in_by),
+               'check_out_from': format_minutes(DEFAULT_SHIFT.check_out_from),
+               'workdays': workdays_list(MONDAY_TO_FRIDAY)}
+    return {'default': default, 'policies': policies, 'assignments': [dict(row) for row in assignments]}
+
+def save_shift_policy(data):
+    """Create or update (by name) a policy from {name, check_in_by, check_out_from, workdays}"""
+    name = (data.get('name') or '').strip()
+    if not name:
+        raise ShiftPolicyError('Policy name is required')
+    try:
+        check_in_by = parse_minutes(data.get('check_in_by'))
+        check_out_from = parse_minutes(data.get('check_out_from'))
+    except ValueError:
+        raise ShiftPolicyError('check_in_by and check_out_from must be HH:MM times') from None
+    workdays = data.get('workdays', workdays_list(MONDAY_TO_FRIDAY))
+    if not isinstance(workdays, list) or not all(day in ISO_WEEKDAYS for day in workdays):
+        raise ShiftPolicyError('workdays must be a list of ISO weekdays (1 = Monday ... 7 = Sunday)')
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO shift_policies (name, check_in_by, check_out_from, workdays)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (name) DO UPDATE SET
+                check_in_by = EXCLUDED.check_in_by,
+                check_out_from = EXCLUDED.check_out_from,
+                workdays = EXCLUDED.workdays
+            RETURNING id, name, check_in_by, check_out_from, workdays
+        ''', (name, format_minutes(check_in_by), format_minutes(check_out_from), workdays_mask(workdays)))
+        policy = _policy_payload(cursor.fetchone())
+        conn.commit()
+    shift_schedule.invalidate()
+    return policy
+
+def delete_shift_policy(policy_id):
+    """Delete a policy with its assignments (calendar days using it revert); False if there was none"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM shift_policies WHERE id = %s', (policy_id,))
+        deleted = cursor.rowcount > 0
+        conn.commit()
+    shift_schedule.invalidate()
+    return deleted
+
+def assign_shift_policy(policy_id, grade=None, user_id=None):
+    """Give a teacher (user_id), a grade, or with neither the whole school a policy; None removes it"""
+    if grade is not None and user_id is not None:
+        raise ShiftPolicyError('Assign a policy to a grade or to a teacher, not both')
+    if user_id is not None:
+        scope_sql, scope = 'user_id = %s', (user_id,)
+    elif grade is not None:
+        scope_sql, scope = 'grade = %s', (grade,)
+    else:
+        scope_sql, scope = 'grade IS NULL AND user_id IS NULL', ()
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if user_id is not None:
+                cursor.execute('SELECT 1 FROM users WHERE id = %s AND role = %s', (user_id, 'teacher'))
+                if cursor.fetchone() is None:
+                    raise ShiftPolicyError('Teacher not found')
+            cursor.execute(f'DELETE FROM shift_assignments WHERE {scope_sql}', scope)
+            if policy_id is not None:
+                cursor.execute('INSERT INTO shift_assignments (policy_id, grade, user_id) VALUES (%s, %s, %s)',
+                               (policy_id, grade, user_id))
+            conn.commit()
+        except IntegrityError:
+            conn.rollback()
+            raise ShiftPolicyError('Policy not found') from None
+    shift_schedule.invalidate()
+
+def list_calendar(date_from, date_to):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT c.date, c.is_working_day, c.description, c.shift_policy_id, p.name AS shift_policy
+            FROM school_calendar c
+            LEFT JOIN shift_policies p ON p.id = c.shift_policy_id
+            WHERE c.date BETWEEN %s AND %s
+            ORDER BY c.date
+        ''', (date_from, date_to))
+        return [{**row, 'date': row['date'].isoformat()} for row in cursor.fetchall()]
+
+def set_calendar_day(day, is_working_day, description=None, shift_policy_id=None):
+    """Mark a date a holiday (not working), a make-up day, or a half-day with shift_policy_id"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                INSERT INTO school_calendar (date, is_working_day, description, shift_policy_id)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (date) DO UPDATE SET
+                    is_working_day = EXCLUDED.is_working_day,
+                    description = EXCLUDED.description,
+                    shift_policy_id = EXCLUDED.shift_policy_id
+            ''', (day, is_working_day, description, shift_policy_id))
+            conn.commit()
+        except IntegrityError:
+            conn.rollback()
+            raise ShiftPolicyError('Policy not found') from None
+    shift_schedule.invalidate()
+
+def clear_calendar_day(day):
+    """Back to the weekday default; False if the date had no entry"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM school_calendar WHERE date = %s', (day,))
+        deleted = cursor.rowcount > 0
+        conn.commit()
+    shift_schedule.invalidate()
+    return deleted
+
+# ======================
+# BULK RECOMPUTE
+# ======================
+
+# A day's scanned rows as parallel arrays; Absent, Leave and rows without a
+# check-in were set by hand and are left alone
+_RECOMPUTE_WHERE_SQL = '''
+    WHERE ea.date BETWEEN %(from)s AND %(to)s AND ea.check_in IS NOT NULL
+      AND (ea.status IS NULL OR ea.status IN ('Present', 'Late', 'Early'))
+'''
+
+_STATUS_CODE_SQL = f"CASE ea.status WHEN 'Present' THEN {PRESENT} WHEN 'Late' THEN {LATE} WHEN 'Early' THEN {EARLY} ELSE -1 END"
+
+RECOMPUTE_ROWS_SQL = f'''
+    SELECT
+        COALESCE(array_agg(ea.id), '{{}}')::text AS ids,
+        COALESCE(array_agg(ea.user_id), '{{}}')::text AS users,
+        COALESCE(array_agg(ea.date - %(from)s::date), '{{}}')::text AS days,
+        COALESCE(array_agg(EXTRACT(HOUR FROM ea.check_in)::int * 60 + EXTRACT(MINUTE FROM ea.check_in)::int), '{{}}')::text AS check_in,
+        COALESCE(array_agg(COALESCE(EXTRACT(HOUR FROM ea.check_out)::int * 60 + EXTRACT(MINUTE FROM ea.check_out)::int, -1)), '{{}}')::text AS check_out,
+        COALESCE(array_agg({_STATUS_CODE_SQL}), '{{}}')::text AS codes
+    FROM employee_attendance ea
+    {_RECOMPUTE_WHERE_SQL}
+'''
+
+# SQLite times are 'HH:MM:SS' text; group_concat walks the rows in one order for every column
+SQLITE_RECOMPUTE_ROWS_SQL = f'''
+    SELECT
+        group_concat(ea.id) AS ids,
+        group_concat(ea.user_id) AS users,
+        group_concat(CAST(julianday(ea.date) - julianday(%(from)s) AS INTEGER)) AS days,
+        group_concat(CAST(substr(ea.check_in, 1, 2) AS INTEGER) * 60 + CAST(substr(ea.check_in, 4, 2) AS INTEGER)) AS check_in,
+        group_concat(COALESCE(CAST(substr(ea.check_out, 1, 2) AS INTEGER) * 60 + CAST(substr(ea.check_out, 4, 2) AS INTEGER), -1)) AS check_out,
+        group_concat({_STATUS_CODE_SQL}) AS codes
+    FROM employee_attendance ea
+    {_RECOMPUTE_WHERE_SQL}
+'''
+
+# The date column lets PostgreSQL prune to the range's partitions. A row a
+# scan changed since it was read keeps the scan's status.
+RECOMPUTE_UPDATE_SQL = '''
+    UPDATE employee_attendance ea SET status = c.status
+    FROM unnest(%(ids)s::int[], %(dates)s::date[], %(old_statuses)s::text[], %(statuses)s::text[])
+         AS c(id, date, old_status, status)
+    WHERE ea.id = c.id AND ea.date = c.date AND ea.status IS NOT DISTINCT FROM c.old_status
+'''
+
+SQLITE_RECOMPUTE_UPDATE_SQL = '''
+    UPDATE employee_attendance SET status = c.value ->> 1
+    FROM json_each(%(changes)s) AS c
+    WHERE employee_attendance.id = c.value ->> 0
+'''
+
+def _int_array(text):
+    """Ints of a PostgreSQL int[] literal ('{1,2}') or a group_concat ('1,2', None when empty)"""
+    if not text:
+        return np.zeros(0, dtype=np.int64)
+    return np.fromstring(text.strip('{}'), dtype=np.int64, sep=',')
+
+def recompute_statuses(conn, date_from, date_to):
+    """Re-derive Present/Late/Early of the scanned rows in a date range under the current policies.
+
+    The rows are read as arrays in one query, their statuses derived in
+    one NumPy pass, and only the rows whose status changed are written
+    back, by one UPDATE (the rollup triggers follow). SQLite holds the
+    write lock throughout; PostgreSQL leaves a row alone if a scan changed
+    it after the read. Returns
+    {'from', 'to', 'rows', 'changed', 'statuses': {status: rows now}};
+    the caller commits.
+    """
+    cursor = conn.cursor()
+    if SQLITE:
+        conn.begin_immediate()
+    compiled = load_schedule(cursor)
+    cursor.execute('SELECT id, grade FROM users')
+    grades = {row['id']: row['grade'] for row in cursor.fetchall()}
+
+    params = {'from': date_from, 'to': date_to}
+    cursor.execute(SQLITE_RECOMPUTE_ROWS_SQL if SQLITE else RECOMPUTE_ROWS_SQL, params)
+    facts = cursor.fetchone()
+    ids, users, offsets = _int_array(facts['ids']), _int_array(facts['users']), _int_array(facts['days'])
+    check_in, check_out, codes = _int_array(facts['check_in']), _int_array(facts['check_out']), _int_array(facts['codes'])
+
+    user_ids, user_pos = np.unique(users, return_inverse=True)
+    user_policies = np.array([compiled.policy_of(int(user_id), grades.get(int(user_id))) for user_id in user_ids],
+                             dtype=np.int32)[user_pos] if len(users) else np.zeros(0, dtype=np.int32)
+    statuses = compiled.derive_statuses(date_from, user_policies, offsets, check_in, check_out) if len(ids) else codes
+
+    changed = np.flatnonzero(statuses != codes)
+    if len(changed):
+        names = [STATUS_NAMES[code] for code in statuses[changed]]
+        if SQLITE:
+            cursor.execute(SQLITE_RECOMPUTE_UPDATE_SQL, {'changes': json.dumps(list(zip(ids[changed].tolist(), names)))})
+        else:
+            dates = [date.fromordinal(date_from.toordinal() + int(offset)) for offset in offsets[changed]]
+            old_statuses = [STATUS_NAMES[code] if code >= 0 else None for code in codes[changed]]
+            cursor.execute(RECOMPUTE_UPDATE_SQL, {'ids': ids[changed].tolist(), 'dates': dates,
+                                                  'old_statuses': old_statuses, 'statuses': names})
+
+    counts = np.bincount(statuses.astype(np.int64), minlength=len(STATUS_NAMES))
+    return {
+        'from': date_from.isoformat(),
+        'to': date_to.isoformat(),
+        'rows': int(len(ids)),
+        'changed': int(len(changed)),
+        'statuses': {name: int(count) for name, count in zip(STATUS_NAMES, counts)}
+    }
+
+def recompute_employee_statuses(date_from, date_to):
+    """recompute_statuses in its own transaction"""
+    with get_db_connection() as conn:
+        result = recompute_statuses(conn, date_from, date_to)
+        conn.commit()
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Shift policy maintenance')
+    parser.add_argument('--tenant', help='Only this school (default: every school)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    recompute = commands.add_parser('recompute', help='Re-derive recorded statuses under the current policies')
+    recompute.add_argument('--from', dest='date_from', required=True, type=date.fromisoformat)
+    recompute.add_argument('--to', dest='date_to', type=date.fromisoformat, default=date.today())
+    args = parser.parse_args(argv)
+
+    from tenants import TenantError, tenant_context, tenant_keys
+    try:
+        for tenant in [args.tenant] if args.tenant else tenant_keys():
+            with tenant_context(tenant):
+                started = time.perf_counter()
+                result = recompute_employee_statuses(args.date_from, args.date_to)
+                print(f"✅ {f'{tenant}: ' if tenant else ''}{result['changed']} of {result['rows']} statuses changed "
+                      f"({result['from']} to {result['to']}) in {time.perf_counter() - started:.2f}s")
+    except TenantError as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""Embedded SQLite storage for single-site deployments and service-free runs.
+
+DATABASE_URL=sqlite:///attendance.db (or sqlite:////var/lib/attendance.db
+for an absolute path) keeps the school in a local file instead of a
+PostgreSQL server, so a scan costs a local write rather than a network
+round-trip. Connections behave like the psycopg2 ones models.py was
+written against: %s and %(name)s parameters, rows as dicts, DATE, TIME,
+TIMESTAMP and BOOLEAN columns as Python dates, times, datetimes and bools,
+commit()/rollback() and an autocommit switch.
+
+The file runs in WAL mode, so readers never wait for the writer. A
+transaction takes the write lock at its first write (BEGIN IMMEDIATE)
+and waits up to SQLITE_BUSY_TIMEOUT_MS for another one to finish.
+
+The schema is migrations.SQLITE_MIGRATIONS. Statements the two databases
+disagree on have SQLite variants beside the PostgreSQL ones in models.py
+and auth.py. Partitions, the live feed (LISTEN/NOTIFY), reports, roster
+imports, read replicas, several schools and the async server stay
+PostgreSQL-only.
+"""
+import os
+import re
+import time
+import sqlite3
+import datetime
+import threading
+from functools import lru_cache
+from instrumentation import INSTRUMENTATION_ENABLED, record_query
+
+SQLITE_URL_PREFIX = 'sqlite:///'
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+# NORMAL is durable in WAL mode except for the last commits before a power loss
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', str(64 * 1024)))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+
+def is_sqlite_url(url):
+    return bool(url) and url.startswith(SQLITE_URL_PREFIX)
+
+def sqlite_path(url):
+    """Database file of a sqlite:///path URL"""
+    path = url[len(SQLITE_URL_PREFIX):]
+    if not path or path == ':memory:':
+        raise ValueError('A SQLite DATABASE_URL needs a file path: sqlite:///attendance.db')
+    return path
+
+# Python values in, the same types back out by declared column type
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(datetime.time, lambda value: value.isoformat())
+sqlite3.register_converter('DATE', lambda value: datetime.date.fromisoformat(value.decode()))
+sqlite3.register_converter('TIME', lambda value: datetime.time.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('BOOLEAN', lambda value: value not in (b'0', b''))
+
+_PARAMETER_RE = re.compile(r'%\((\w+)\)s|%s|%%')
+
+@lru_cache(maxsize=512)
+def translate_parameters(query):
+    """psycopg2 placeholders (%s, %(name)s, %%) as SQLite's (?, :name, %)"""
+    def replace(match):
+        if match.group(1):
+            return ':' + match.group(1)
+        return '?' if match.group(0) == '%s' else '%'
+    return _PARAMETER_RE.sub(replace, query)
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+class SQLiteCursor:
+    """sqlite3 cursor taking psycopg2-style parameters.
+
+    Like psycopg2, placeholders are only parsed when parameters are
+    passed. itersize is accepted for the server-side cursor call sites;
+    SQLite steps through rows lazily anyway.
+    """
+    itersize = 2000
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, vars=None):
+        if vars is None:
+            self._cursor.execute(query)
+        else:
+            self._cursor.execute(translate_parameters(query), vars)
+
+    def executemany(self, query, vars_list):
+        self._cursor.executemany(translate_parameters(query), vars_list)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size if size is not None else self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class InstrumentedSQLiteCursor(SQLiteCursor):
+    """SQLiteCursor that records each statement's timing and row count"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+CURSOR_CLASS = InstrumentedSQLiteCursor if INSTRUMENTATION_ENABLED else SQLiteCursor
+
+class SQLiteConnection:
+    """A connection to the database file with psycopg2's transaction behaviour"""
+    created_at = 0.0
+    last_used = 0.0
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(
+            path,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            # Writes open the transaction with the write lock already held
+            isolation_level='IMMEDIATE',
+            # The pool hands a connection to one thread at a time
+            check_same_thread=False
+        )
+        self._conn.row_factory = _dict_row
+        for pragma in (
+            'journal_mode = WAL',
+            f'synchronous = {SQLITE_SYNCHRONOUS}',
+            'foreign_keys = ON',
+            f'cache_size = {-SQLITE_CACHE_SIZE_KB}',
+            f'mmap_size = {SQLITE_MMAP_SIZE}',
+            'temp_store = MEMORY'
+        ):
+            self._conn.execute('PRAGMA ' + pragma)
+        self.closed = 0
+
+    def cursor(self, name=None):
+        return CURSOR_CLASS(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def begin_immediate(self):
+        """Take the write lock now, so the reads that decide a write see what it changes"""
+        if not self._conn.in_transaction:
+            self._conn.execute('BEGIN IMMEDIATE')
+
+    @property
+    def autocommit(self):
+        return self._conn.isolation_level is None
+
+    @autocommit.setter
+    def autocommit(self, value):
+        self._conn.isolation_level = None if value else 'IMMEDIATE'
+
+    def set_session(self, isolation_level=None, readonly=None, **kwargs):
+        # Every SQLite transaction is serializable; only read-only needs doing
+        if readonly is not None:
+            self._conn.execute(f"PRAGMA query_only = {'ON' if readonly is True else 'OFF'}")
+
+    def close(self):
+        if not self.closed:
+            self.closed = 1
+            self._conn.close()
+
+class SQLitePool:
+    """Reuses connections to one database file across threads.
+
+    SQLite does its own locking and opening a connection is cheap, so
+    unlike database.ConnectionPool there is no cap to wait on: up to
+    ``max_idle`` returned connections are kept for reuse and the rest are
+    closed. Same getconn/putconn/close/stats interface.
+    """
+
+    def __init__(self, path, max_idle=10):
+        self.path = path
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = []
+        self._in_use = 0
+        self._closed = False
+        self._counters = {'created': 0}
+
+    def getconn(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            self._in_use += 1
+        if conn is None:
+            try:
+                conn = SQLiteConnection(self.path)
+            except Exception:
+                with self._lock:
+                    self._in_use -= 1
+                raise
+            conn.created_at = time.monotonic()
+            with self._lock:
+                self._counters['created'] += 1
+        return conn
+
+    def putconn(self, conn):
+        """Return a connection, rolling back any transaction left open"""
+        if not conn.closed:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.autocommit = False
+                conn.set_session(readonly=False)
+            except sqlite3.Error:
+                conn.close()
+        conn.last_used = time.monotonic()
+        with self._lock:
+            self._in_use -= 1
+            keep = not conn.closed and not self._closed and len(self._idle) < self.max_idle
+            if keep:
+                self._idle.append(conn)
+        if not keep:
+            conn.close()
+
+    def close(self):
+        """Close idle connections, refreshing the planner's statistics on the way out"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for index, conn in enumerate(idle):
+            if index == 0:
+                try:
+                    conn.cursor().execute('PRAGMA optimize')
+                except sqlite3.Error:
+                    pass
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_idle': self.max_idle,
+                'size': len(self._idle) + self._in_use,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                **self._counters
+            }
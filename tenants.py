@@ -0,0 +1,185 @@
+"""Multi-school tenancy: one deployment serving several schools.
+
+Without TENANT_MAP the app serves a single school from DATABASE_URL, as it
+always has. TENANT_MAP (inline JSON, or the path of a .json file) maps each
+school's tenant key to the database that holds it:
+
+    {"north-high": "postgresql://db-1/attendance",
+     "lakeside": {"database_url": "postgresql://db-2/attendance", "schema": "lakeside",
+                  "replica_urls": ["postgresql://db-2-replica/attendance"]}}
+
+Every school's tables live in their own PostgreSQL schema (the tenant key
+with '-' as '_', unless "schema" is given), so several schools can share a
+database and ids like user_id only have to be unique within a school.
+Connections are pooled per school with search_path set to that schema,
+which scopes every query in models.py to the school without naming it.
+Moving a school to another shard is a dump/restore of its schema and a
+new database_url; an existing single-school database joins as a tenant
+with "schema": "public".
+
+A request's school comes from the TENANT_HEADER header (X-Tenant), else
+the first label of its Host; a token carries the school it was issued for.
+"""
+import os
+import re
+import json
+import threading
+import contextvars
+from collections import namedtuple
+from contextlib import contextmanager
+
+TENANT_MAP = os.environ.get('TENANT_MAP', '').strip()
+TENANT_HEADER = os.environ.get('TENANT_HEADER', 'X-Tenant')
+TENANT_FROM_SUBDOMAIN = os.environ.get('TENANT_FROM_SUBDOMAIN', 'true').lower() == 'true'
+
+# Schema names end up in channel names, which PostgreSQL caps at 63 bytes
+_SCHEMA_RE = re.compile(r'^[a-z_][a-z0-9_]{0,44}$')
+
+Tenant = namedtuple('Tenant', 'key database_url schema replica_urls')
+
+class TenantError(Exception):
+    """The request names no school, or one this deployment doesn't serve"""
+
+def load_tenants(source):
+    """{key: Tenant} from TENANT_MAP's JSON (inline or a file path); {} when unset"""
+    if not source:
+        return {}
+    if not source.startswith('{'):
+        with open(source) as f:
+            source = f.read()
+    tenants = {}
+    for key, entry in json.loads(source).items():
+        if isinstance(entry, str):
+            entry = {'database_url': entry}
+        schema = entry.get('schema') or key.lower().replace('-', '_')
+        if not _SCHEMA_RE.match(schema):
+            raise ValueError(f"Tenant {key!r}: schema {schema!r} must match {_SCHEMA_RE.pattern}")
+        if not entry.get('database_url'):
+            raise ValueError(f"Tenant {key!r} has no database_url")
+        tenants[key] = Tenant(key, entry['database_url'], schema, tuple(entry.get('replica_urls', ())))
+    return tenants
+
+TENANTS = load_tenants(TENANT_MAP)
+MULTI_TENANT = bool(TENANTS)
+
+_current_tenant = contextvars.ContextVar('tenant', default=None)
+
+def tenant_keys():
+    """Every tenant key; [None] for a single-school deployment"""
+    return list(TENANTS) if MULTI_TENANT else [None]
+
+def is_known_tenant(key):
+    return key in TENANTS if MULTI_TENANT else key is None
+
+def current_tenant_key():
+    """The school this request (or block) runs for; None if single-school or not chosen yet"""
+    return _current_tenant.get()
+
+def get_tenant(key=None):
+    """Tenant for key (default: the current one); None for a single-school deployment"""
+    if not MULTI_TENANT:
+        return None
+    key = key if key is not None else _current_tenant.get()
+    if key is None:
+        raise TenantError('School not specified')
+    try:
+        return TENANTS[key]
+    except KeyError:
+        raise TenantError(f'Unknown school: {key}') from None
+
+def set_current_tenant(key):
+    """Switch the current context to key's school; returns a token for reset"""
+    if key is not None and not is_known_tenant(key):
+        raise TenantError(f'Unknown school: {key}')
+    return _current_tenant.set(key)
+
+@contextmanager
+def tenant_context(key):
+    """Run a with-block (and anything it starts with asyncio.to_thread) as key's school"""
+    token = set_current_tenant(key)
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+def search_path_options(schema):
+    """libpq startup options pinning a connection to schema"""
+    return f'-c search_path={schema}'
+
+def request_tenant_key(headers, host):
+    """Tenant named by a request's header or subdomain, else None"""
+    key = headers.get(TENANT_HEADER)
+    if key:
+        if key not in TENANTS:
+            raise TenantError(f'Unknown school: {key}')
+        return key
+    if TENANT_FROM_SUBDOMAIN and host:
+        subdomain = host.split('.', 1)[0].split(':', 1)[0]
+        if subdomain in TENANTS:
+            return subdomain
+    return None
+
+class TenantLocal:
+    """One object per tenant, made by factory(tenant_key) on first use.
+
+    Attribute access goes to the current tenant's object, so per-process
+    caches keep their single-school call sites. stats() covers every
+    tenant: {key: stats} (the object's own stats for a single school).
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def instance(self, key=None):
+        """key's object (default: the current tenant's), created on first use"""
+        if key is None:
+            key = current_tenant_key()
+        if not is_known_tenant(key):
+            raise TenantError('School not specified' if key is None else f'Unknown school: {key}')
+        instance = self._instances.get(key)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(key)
+                if instance is None:
+                    instance = self._instances[key] = self._factory(key)
+        return instance
+
+    def instances(self):
+        """{key: object} for the tenants used so far in this process"""
+        return dict(self._instances)
+
+    def stats(self):
+        if not MULTI_TENANT:
+            return self.instance().stats()
+        return {key: instance.stats() for key, instance in self.instances().items()}
+
+    def __getattr__(self, name):
+        return getattr(self.instance(), name)
+
+def _tenant_error_response(error):
+    return {'error': str(error)}, 400
+
+def bind_tenant_flask(app):
+    """Select each request's school from its header/subdomain for a Flask app"""
+    from flask import request
+
+    @app.before_request
+    def _select_tenant():
+        # Always set: server threads are reused across requests
+        _current_tenant.set(request_tenant_key(request.headers, request.host) if MULTI_TENANT else None)
+
+    app.register_error_handler(TenantError, _tenant_error_response)
+
+def bind_tenant_quart(app):
+    """Async counterpart of bind_tenant_flask"""
+    from quart import request
+
+    @app.before_request
+    async def _select_tenant():
+        _current_tenant.set(request_tenant_key(request.headers, request.host) if MULTI_TENANT else None)
+
+    @app.errorhandler(TenantError)
+    async def _tenant_error(error):
+        return _tenant_error_response(error)
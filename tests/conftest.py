@@ -0,0 +1,108 @@
+"""Shared fixtures: the Flask app on a fresh SQLite database.
+
+Modules read their settings from the environment when first imported, so
+the database and cache intervals are set here, before any test module
+imports the app.
+"""
+import os
+import shutil
+import tempfile
+import itertools
+from datetime import date, datetime, timedelta
+import jwt
+import pytest
+
+TEST_DB_DIR = tempfile.mkdtemp(prefix='attendance-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TEST_DB_DIR, 't.db')}"
+os.environ['SECRET_KEY'] = 'test-secret'
+# Every request sees revocations and roster changes at once
+os.environ['REVOCATION_REFRESH_SECONDS'] = '0'
+os.environ['ROSTER_CACHE_REFRESH_SECONDS'] = '0'
+os.environ['SHIFT_CHECK_IN_BY'] = '09:05'
+os.environ['SHIFT_CHECK_OUT_FROM'] = '16:55'
+os.environ['CPU_WORKERS'] = '2'
+for name in ('TENANT_MAP', 'DATABASE_REPLICA_URLS', 'INGEST_WAL_DIR'):
+    os.environ.pop(name, None)
+
+from app import app as flask_app
+from auth import SECRET_KEY, TOKEN_LIFETIME_HOURS, generate_token
+from database import get_db_connection
+
+_unique = itertools.count(1)
+
+@pytest.fixture(scope='session', autouse=True)
+def test_database():
+    yield os.environ['DATABASE_URL']
+    shutil.rmtree(TEST_DB_DIR, ignore_errors=True)
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture(scope='session')
+def admin_headers(app):
+    response = app.test_client().post('/api/login', json={'user_id': 'ADMIN001', 'password': 'admin123', 'role': 'admin'})
+    assert response.status_code == 200
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+def auth_headers(user_id, role='teacher'):
+    return {'Authorization': f'Bearer {generate_token(user_id, role)}'}
+
+def execute(sql, params=()):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        conn.commit()
+
+@pytest.fixture
+def make_teacher(client, admin_headers):
+    """Create and activate a teacher in a grade of their own (activated long ago)"""
+    def make(grade=None):
+        n = next(_unique)
+        user_id = f'T{n:04d}'
+        response = client.post('/api/employees', headers=admin_headers, json={
+            'user_id': user_id, 'password': 'pw123456', 'name': f'Teacher {n}',
+            'grade': grade or f'G{n}', 'email': f'{user_id}@school.test', 'phone': '555'})
+        assert response.status_code == 201
+        teacher_id = response.get_json()['user_id']
+        assert client.post(f'/api/employees/{teacher_id}/activate', headers=admin_headers).status_code == 200
+        # Expected at work on every day the tests look at
+        execute("UPDATE users SET activated_at = '2000-01-01 00:00:00' WHERE id = %s", (teacher_id,))
+        return {'id': teacher_id, 'user_id': user_id, 'grade': grade or f'G{n}', 'headers': auth_headers(teacher_id)}
+    return make
+
+@pytest.fixture
+def make_student(client, admin_headers):
+    def make(grade, section='A'):
+        n = next(_unique)
+        response = client.post('/api/students', headers=admin_headers, json={
+            'student_id': f'S{n:04d}', 'name': f'Student {n}', 'grade': grade, 'section': section,
+            'parent_contact': '555'})
+        assert response.status_code == 201
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id FROM students WHERE student_id = %s', (f'S{n:04d}',))
+            return cursor.fetchone()['id']
+    return make
+
+def past_week(weeks_ago=2):
+    """Monday to Friday of an earlier week"""
+    today = date.today()
+    monday = today - timedelta(days=today.weekday(), weeks=weeks_ago)
+    return [monday + timedelta(days=i) for i in range(5)]
+
+def qr_data(user_id, issued_at):
+    """Badge contents with a token issued at issued_at, for offline (batch) scans"""
+    iat = int(issued_at.timestamp())
+    token = jwt.encode({'user_id': user_id, 'role': 'qr_scan', 'iat': iat, 'exp': iat + TOKEN_LIFETIME_HOURS * 3600},
+                       SECRET_KEY, algorithm='HS256')
+    return f'ATTENDANCE:{user_id}:{token}'
+
+def offline_scan(user_id, day, hhmm):
+    scanned_at = datetime.combine(day, datetime.strptime(hhmm, '%H:%M').time())
+    return {'qr_data': qr_data(user_id, scanned_at - timedelta(hours=1)), 'scanned_at': scanned_at.isoformat()}
@@ -0,0 +1,61 @@
+from conftest import offline_scan, past_week
+
+def record_week(client, teacher, scans):
+    """Apply {day index: (check-in, check-out)} for the teacher in past_week()"""
+    week = past_week()
+    batch = [offline_scan(teacher['id'], week[i], time) for i, times in scans.items() for time in times if time]
+    assert client.post('/api/attendance/scan/batch', json={'scans': batch}).get_json()['applied'] == len(batch)
+    return week
+
+def test_history_pages_with_keyset_cursor(client, make_teacher):
+    teacher = make_teacher()
+    week = record_week(client, teacher, {i: ('08:30', '17:00') for i in range(5)})
+
+    seen, cursor = [], None
+    while True:
+        url = '/api/attendance/employees?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        body = client.get(url, headers=teacher['headers']).get_json()
+        assert len(body['attendance']) <= 2
+        seen += [row['date'] for row in body['attendance']]
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+
+    # Teachers only see their own rows, newest first, each exactly once
+    assert seen == [day.isoformat() for day in reversed(week)]
+
+def test_history_rejects_bad_cursor(client, admin_headers):
+    response = client.get('/api/attendance/employees?cursor=not-a-cursor', headers=admin_headers)
+    assert response.status_code == 400
+
+def test_stats_count_missing_working_days_as_absent(client, admin_headers, make_teacher):
+    teacher = make_teacher()
+    week = record_week(client, teacher, {0: ('08:30', '17:00'), 1: ('09:30', '17:00'), 2: ('08:30', '15:00')})
+
+    url = f"/api/attendance/employees/stats?from={week[0]}&to={week[-1]}&grade={teacher['grade']}"
+    body = client.get(url, headers=admin_headers).get_json()
+    assert body['stats'] == {'Present': 1, 'Late': 1, 'Early': 1, 'Absent': 2, 'Leave': 0}
+
+    # A teacher's own stats come from the monthly rollup plus the rows at either end
+    own = client.get(f'/api/attendance/employees/stats?from={week[0]}&to={week[-1]}', headers=teacher['headers']).get_json()
+    assert own['stats'] == body['stats']
+
+def test_stats_follow_recomputed_statuses(client, admin_headers, make_teacher):
+    teacher = make_teacher()
+    week = record_week(client, teacher, {0: ('08:30', '17:00')})
+    url = f"/api/attendance/employees/stats?from={week[0]}&to={week[0]}&grade={teacher['grade']}"
+    assert client.get(url, headers=admin_headers).get_json()['stats']['Present'] == 1
+
+    policy = client.post('/api/shifts', headers=admin_headers, json={
+        'name': f"early-{teacher['user_id']}", 'check_in_by': '08:00', 'check_out_from': '16:00',
+        'workdays': [1, 2, 3, 4, 5]}).get_json()['policy']
+    client.put('/api/shifts/assignments', headers=admin_headers, json={'policy_id': policy['id'], 'user_id': teacher['id']})
+    client.post('/api/shifts/recompute', headers=admin_headers, json={'from': week[0].isoformat(), 'to': week[0].isoformat()})
+
+    # The rollup triggers follow the recomputed row
+    stats = client.get(url, headers=admin_headers).get_json()['stats']
+    assert (stats['Present'], stats['Late']) == (0, 1)
+    client.delete(f"/api/shifts/{policy['id']}", headers=admin_headers)
+
+def test_stats_reject_bad_dates(client, admin_headers):
+    assert client.get('/api/attendance/employees/stats?from=yesterday', headers=admin_headers).status_code == 400
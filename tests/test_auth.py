@@ -0,0 +1,77 @@
+from app import make_qr_token
+from badges import badge_cache, get_badge
+from conftest import auth_headers
+from database import get_db_connection
+
+def badge_user(user_id):
+    # The columns the QR routes select
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, user_id, name, is_active, activated_at FROM users WHERE id = %s', (user_id,))
+        return cursor.fetchone()
+
+def scan_badge(client, user_id, token):
+    return client.post('/api/attendance/scan', json={'qr_data': f'ATTENDANCE:{user_id}:{token}'})
+
+def test_login_rejects_wrong_password(client):
+    response = client.post('/api/login', json={'user_id': 'ADMIN001', 'password': 'wrong', 'role': 'admin'})
+    assert response.status_code == 401
+
+def test_routes_require_a_token(client):
+    assert client.get('/api/employees').status_code == 401
+    assert client.get('/api/employees', headers={'Authorization': 'Bearer nonsense'}).status_code == 401
+
+def test_teacher_cannot_use_admin_routes(client, make_teacher):
+    teacher = make_teacher()
+    assert client.get('/api/employees', headers=teacher['headers']).status_code == 403
+
+def test_deactivation_revokes_issued_tokens(client, admin_headers, make_teacher):
+    teacher = make_teacher()
+    url = f"/api/students?grade={teacher['grade']}&section=A"
+    assert client.get(url, headers=teacher['headers']).status_code == 200
+
+    assert client.delete(f"/api/employees/{teacher['id']}", headers=admin_headers).status_code == 200
+    assert client.get(url, headers=teacher['headers']).status_code == 401
+
+def test_reactivated_teacher_gets_a_badge_that_scans(client, admin_headers, make_teacher):
+    teacher = make_teacher()
+    old_token, _, _ = get_badge(badge_user(teacher['id']), make_qr_token)
+
+    # Reactivated within the same second: new tokens must still verify
+    client.delete(f"/api/employees/{teacher['id']}", headers=admin_headers)
+    client.post(f"/api/employees/{teacher['id']}/activate", headers=admin_headers)
+
+    new_token, _, _ = get_badge(badge_user(teacher['id']), make_qr_token)
+    assert new_token != old_token
+    assert scan_badge(client, teacher['id'], old_token).status_code == 401
+    assert scan_badge(client, teacher['id'], new_token).status_code == 200
+    assert client.get(f"/api/students?grade={teacher['grade']}&section=A",
+                      headers=auth_headers(teacher['id'])).status_code == 200
+
+def test_cached_badge_with_revoked_token_is_rendered_again(client, admin_headers, make_teacher):
+    teacher = make_teacher()
+    user = badge_user(teacher['id'])
+    old_token, _, _ = get_badge(user, make_qr_token)
+    hits = badge_cache.stats()['hits']
+    assert get_badge(user, make_qr_token)[0] == old_token
+    assert badge_cache.stats()['hits'] == hits + 1
+
+    # Same cache key (activated_at unchanged), but the token is now revoked
+    client.delete(f"/api/employees/{teacher['id']}", headers=admin_headers)
+    assert get_badge(user, make_qr_token)[0] != old_token
+
+def test_qr_route_serves_new_badge_after_reactivation(client, admin_headers, make_teacher):
+    teacher = make_teacher()
+    url = f"/api/qr/generate/{teacher['id']}?format=svg"
+    first = client.get(url, headers=admin_headers).get_json()['qr_code']
+    assert client.get(url, headers=admin_headers).get_json()['qr_code'] == first
+
+    client.delete(f"/api/employees/{teacher['id']}", headers=admin_headers)
+    assert client.get(url, headers=admin_headers).status_code == 403
+    client.post(f"/api/employees/{teacher['id']}/activate", headers=admin_headers)
+    assert client.get(url, headers=admin_headers).get_json()['qr_code'] != first
+
+def test_teacher_may_only_generate_own_badge(client, make_teacher):
+    teacher, other = make_teacher(), make_teacher()
+    assert client.get(f"/api/qr/generate/{other['id']}", headers=teacher['headers']).status_code == 403
+    assert client.get(f"/api/qr/generate/{teacher['id']}", headers=auth_headers(teacher['id'])).status_code == 200
@@ -0,0 +1,29 @@
+from datetime import date
+import numpy as np
+import pytest
+from reports import _status_matrix, _working_matrix, build_attendance_report, longest_runs, ReportError
+
+def test_longest_runs():
+    mask = np.array([[1, 1, 0, 1, 1, 1], [0, 0, 0, 0, 0, 0], [1, 0, 1, 0, 1, 1]], dtype=bool)
+    assert longest_runs(mask).tolist() == [3, 0, 2]
+
+def test_longest_runs_skips_zero_weight_days():
+    # Day 2 is a day off: it neither breaks nor lengthens the run
+    mask = np.array([[1, 1, 1, 1, 0]], dtype=bool)
+    weight = np.array([[1, 1, 0, 1, 1]])
+    assert longest_runs(mask, weight).tolist() == [3]
+
+def test_working_matrix_uses_each_teachers_weekdays_and_the_calendar():
+    monday = date(2026, 8, 31)
+    # Mon-Fri, and Mondays only; day 2 (Wednesday) is a holiday, day 5 (Saturday) a make-up day
+    working = _working_matrix([0b0011111, 0b0000001], monday, 7, np.array([2, 5]), np.array([0, 1]))
+    assert working.astype(int).tolist() == [[1, 1, 0, 1, 1, 1, 0],
+                                             [1, 0, 0, 0, 0, 1, 0]]
+
+def test_status_matrix_ignores_unknown_people():
+    matrix = _status_matrix(np.array([7, 3]), np.array([3, 9, 7]), np.array([0, 1, 2]), np.array([1, 2, 5]), 3)
+    assert matrix.tolist() == [[0, 0, 5], [1, 0, 0]]
+
+def test_reports_need_postgresql():
+    with pytest.raises(ReportError):
+        build_attendance_report('teachers')
@@ -0,0 +1,85 @@
+from auth import generate_token
+from conftest import offline_scan, past_week
+
+def scan(client, user_id):
+    response = client.post('/api/attendance/scan', json={'qr_data': f"ATTENDANCE:{user_id}:{generate_token(user_id, 'qr_scan')}"})
+    return response.status_code, response.get_json()
+
+def test_scan_checks_in_then_out_once(client, make_teacher):
+    teacher = make_teacher()
+
+    status, first = scan(client, teacher['id'])
+    assert status == 200
+    assert first['attendance']['check_in'] is not None
+    assert first['attendance']['check_out'] is None
+
+    status, second = scan(client, teacher['id'])
+    assert status == 200
+    assert second['attendance']['check_in'] == first['attendance']['check_in']
+    assert second['attendance']['check_out'] is not None
+
+    # Checked in and out: further scans that day change nothing
+    status, third = scan(client, teacher['id'])
+    assert status == 200
+    assert third['attendance'] == second['attendance']
+
+def test_scan_rejects_another_users_token(client, make_teacher):
+    teacher, other = make_teacher(), make_teacher()
+    response = client.post('/api/attendance/scan', json={
+        'qr_data': f"ATTENDANCE:{teacher['id']}:{generate_token(other['id'], 'qr_scan')}"})
+    assert response.status_code == 401
+
+def test_scan_rejects_malformed_qr(client):
+    assert client.post('/api/attendance/scan', json={'qr_data': 'NOT-A-BADGE'}).status_code == 400
+    assert client.post('/api/attendance/scan', json={}).status_code == 400
+
+def test_batch_applies_offline_scans_with_statuses(client, make_teacher):
+    teacher = make_teacher()
+    monday, tuesday = past_week()[:2]
+    scans = [
+        offline_scan(teacher['id'], monday, '08:50'),
+        offline_scan(teacher['id'], monday, '17:10'),
+        offline_scan(teacher['id'], tuesday, '09:30'),
+        offline_scan(teacher['id'], tuesday, '16:00'),
+    ]
+
+    response = client.post('/api/attendance/scan/batch', json={'kiosk_id': 'gate', 'scans': scans})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['applied'], body['duplicates'], body['rejected']) == (4, 0, [])
+    days = {row['date']: row for row in body['attendance']}
+    assert days[monday.isoformat()]['status'] == 'Present'
+    assert days[monday.isoformat()]['check_out'] == '17:10'
+    # Late stays Late even when leaving early
+    assert days[tuesday.isoformat()]['status'] == 'Late'
+
+    # A kiosk re-sending the same batch is a no-op
+    again = client.post('/api/attendance/scan/batch', json={'kiosk_id': 'gate', 'scans': scans}).get_json()
+    assert (again['applied'], again['duplicates']) == (0, 4)
+
+def test_batch_checkout_before_shift_end_is_early(client, make_teacher):
+    teacher = make_teacher()
+    wednesday = past_week()[2]
+    body = client.post('/api/attendance/scan/batch', json={'scans': [
+        offline_scan(teacher['id'], wednesday, '08:00'),
+        offline_scan(teacher['id'], wednesday, '15:00'),
+    ]}).get_json()
+    assert body['attendance'][0]['status'] == 'Early'
+
+def test_batch_rejects_invalid_entries_individually(client, make_teacher):
+    teacher = make_teacher()
+    monday = past_week()[0]
+    valid = offline_scan(teacher['id'], monday, '08:30')
+    # Token issued after the scan time it claims
+    forged = offline_scan(teacher['id'], monday, '08:40')
+    forged['scanned_at'] = monday.isoformat() + 'T06:00:00'
+
+    body = client.post('/api/attendance/scan/batch', json={'scans': [
+        valid, forged, {'qr_data': 'garbage', 'scanned_at': monday.isoformat()}, {'scanned_at': 'x'}
+    ]}).get_json()
+    assert body['applied'] == 1
+    assert [(r['index'], r['reason']) for r in body['rejected']] == [
+        (1, 'Invalid QR token'),
+        (2, 'Invalid QR format'),
+        (3, 'Invalid entry (qr_data and ISO scanned_at required)'),
+    ]
@@ -0,0 +1,102 @@
+from datetime import date
+import numpy as np
+import pytest
+from conftest import offline_scan, past_week
+from models import calculate_status
+from shifts import DEFAULT_SHIFT, LATE, PRESENT, EARLY, CompiledSchedule, parse_minutes, workdays_list, workdays_mask
+
+def test_parse_minutes():
+    assert parse_minutes('09:05') == 545
+    assert parse_minutes('23:59:30') == 1439
+    for value in ('9:05', '24:00', '09:60', 'late', None):
+        with pytest.raises(ValueError):
+            parse_minutes(value)
+
+def test_workdays_round_trip():
+    assert workdays_mask([1, 2, 3, 4, 5]) == 0b0011111
+    assert workdays_list(workdays_mask([7, 1, 3])) == [1, 3, 7]
+
+def test_calculate_status():
+    assert calculate_status(None) == 'Absent'
+    assert calculate_status('09:05') == 'Present'
+    assert calculate_status('09:06') == 'Late'
+    assert calculate_status('08:00', '16:00') == 'Early'
+    with pytest.raises(ValueError):
+        calculate_status('nine')
+
+def test_compiled_schedule_precedence_and_calendar():
+    policies = [{'id': 10, 'check_in_by': '08:00', 'check_out_from': '15:00', 'workdays': 0b0000001},
+                {'id': 11, 'check_in_by': '10:00', 'check_out_from': '18:00', 'workdays': 0b0011111}]
+    assignments = [{'policy_id': 10, 'grade': None, 'user_id': 1},
+                   {'policy_id': 11, 'grade': '5', 'user_id': None}]
+    holiday, half_day = date(2026, 9, 2), date(2026, 9, 3)
+    calendar = [{'date': holiday, 'is_working_day': False, 'shift_policy_id': None},
+                {'date': half_day, 'is_working_day': True, 'shift_policy_id': 10}]
+    schedule = CompiledSchedule(policies, assignments, calendar)
+    monday, tuesday = date(2026, 8, 31), date(2026, 9, 1)
+
+    # The user's policy beats the grade's, which beats the school default
+    assert schedule.shift_for(1, '5', monday).check_in_by == 480
+    assert schedule.shift_for(2, '5', monday).check_in_by == 600
+    assert schedule.shift_for(3, '6', monday) == DEFAULT_SHIFT
+    # Policy 10 only works Mondays
+    assert schedule.shift_for(1, '5', tuesday).check_in_by is None
+    assert schedule.shift_for(2, '5', holiday).check_in_by is None
+    assert schedule.shift_for(3, '6', half_day).check_out_from == 900
+
+    statuses = schedule.derive_statuses(
+        monday,
+        np.array([schedule.policy_of(1, '5'), schedule.policy_of(2, '5'), 0, 0]),
+        np.array([0, 0, 2, 3]),
+        np.array([parse_minutes('08:30'), parse_minutes('09:00'), parse_minutes('11:00'), parse_minutes('08:00')]),
+        np.array([parse_minutes('17:00'), parse_minutes('17:00'), -1, parse_minutes('14:00')]))
+    assert statuses.tolist() == [LATE, EARLY, PRESENT, EARLY]
+
+def test_shift_policy_validation(client, admin_headers):
+    response = client.post('/api/shifts', headers=admin_headers, json={'name': 'bad', 'check_in_by': '9am',
+                                                                       'check_out_from': '17:00', 'workdays': [1]})
+    assert response.status_code == 400
+    response = client.put('/api/shifts/assignments', headers=admin_headers, json={'policy_id': 999999, 'user_id': None})
+    assert response.status_code == 400
+
+def test_recompute_rederives_recorded_statuses(client, admin_headers, make_teacher):
+    teacher = make_teacher()
+    week = past_week()
+    scans = [offline_scan(teacher['id'], week[0], '08:30'), offline_scan(teacher['id'], week[0], '17:00'),
+             offline_scan(teacher['id'], week[1], '08:50'), offline_scan(teacher['id'], week[1], '16:30')]
+    client.post('/api/attendance/scan/batch', json={'scans': scans})
+
+    policy = client.post('/api/shifts', headers=admin_headers, json={
+        'name': f"grade-{teacher['grade']}", 'check_in_by': '08:45', 'check_out_from': '16:00',
+        'workdays': [1, 2, 3, 4, 5]}).get_json()['policy']
+    assert client.put('/api/shifts/assignments', headers=admin_headers,
+                      json={'policy_id': policy['id'], 'grade': teacher['grade']}).status_code == 200
+
+    response = client.post('/api/shifts/recompute', headers=admin_headers,
+                           json={'from': week[0].isoformat(), 'to': week[-1].isoformat()})
+    assert response.status_code == 200
+
+    rows = client.get(f'/api/attendance/employees?from={week[0]}&to={week[-1]}', headers=teacher['headers']).get_json()
+    statuses = {row['date']: row['status'] for row in rows['attendance']}
+    # Monday stays Present; Tuesday's 08:50 is now Late (was Early under the default)
+    assert statuses == {week[0].isoformat(): 'Present', week[1].isoformat(): 'Late'}
+    client.delete(f"/api/shifts/{policy['id']}", headers=admin_headers)
+
+def test_recompute_rejects_bad_ranges(client, admin_headers):
+    assert client.post('/api/shifts/recompute', headers=admin_headers, json={}).status_code == 400
+    assert client.post('/api/shifts/recompute', headers=admin_headers,
+                       json={'from': '2026-09-02', 'to': '2026-09-01'}).status_code == 400
+    assert client.post('/api/shifts/recompute', headers=admin_headers,
+                       json={'from': '2024-01-01', 'to': '2026-01-01'}).status_code == 400
+
+def test_part_time_teacher_is_not_absent_on_days_off(client, admin_headers, make_teacher):
+    teacher = make_teacher()
+    week = past_week()
+    policy = client.post('/api/shifts', headers=admin_headers, json={
+        'name': f"mondays-{teacher['user_id']}", 'check_in_by': '09:00', 'check_out_from': '17:00',
+        'workdays': [1]}).get_json()['policy']
+    client.put('/api/shifts/assignments', headers=admin_headers, json={'policy_id': policy['id'], 'user_id': teacher['id']})
+
+    url = f"/api/attendance/employees/stats?from={week[0]}&to={week[-1]}&grade={teacher['grade']}"
+    assert client.get(url, headers=admin_headers).get_json()['stats']['Absent'] == 1
+    client.delete(f"/api/shifts/{policy['id']}", headers=admin_headers)
@@ -0,0 +1,50 @@
+def test_roll_call_rejects_other_grades_and_unknown_students(client, make_teacher, make_student):
+    teacher = make_teacher()
+    own, other = make_student(teacher['grade']), make_student('elsewhere')
+
+    response = client.post('/api/attendance/students', headers=teacher['headers'], json={'attendance': [
+        {'student_id': own, 'present': False},
+        {'student_id': own, 'present': True},
+        {'student_id': other, 'present': True},
+        {'student_id': 999999, 'present': True},
+        {'present': True},
+    ]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['count'] == 1
+    assert sorted((r['student_id'] or 0, r['reason']) for r in body['rejected']) == sorted([
+        (0, 'Invalid entry (student_id and present required)'),
+        (other, 'Student is not in your assigned grade'),
+        (999999, 'Student not found'),
+    ])
+
+    # The last entry for a student wins
+    summary = client.get(f'/api/students/{own}/attendance', headers=teacher['headers']).get_json()
+    assert [day['present'] for day in summary['calendar']] == [True]
+
+def test_roll_call_requires_a_teacher(client, admin_headers):
+    response = client.post('/api/attendance/students', headers=admin_headers, json={'attendance': []})
+    assert response.status_code == 403
+
+def test_roster_etag_revalidates_until_it_changes(client, make_teacher, make_student):
+    teacher = make_teacher()
+    make_student(teacher['grade'])
+    url = f"/api/students?grade={teacher['grade']}&section=A"
+
+    first = client.get(url, headers=teacher['headers'])
+    assert first.status_code == 200
+    assert len(first.get_json()['students']) == 1
+    etag = first.headers['ETag']
+
+    unchanged = client.get(url, headers={**teacher['headers'], 'If-None-Match': etag})
+    assert unchanged.status_code == 304
+    assert unchanged.data == b''
+
+    make_student(teacher['grade'])
+    changed = client.get(url, headers={**teacher['headers'], 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert len(changed.get_json()['students']) == 2
+    assert changed.headers['ETag'] != etag
+
+def test_roster_requires_grade_and_section(client, admin_headers):
+    assert client.get('/api/students?grade=1', headers=admin_headers).status_code == 400
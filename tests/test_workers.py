@@ -0,0 +1,22 @@
+import passwords
+from workers import pool_map, process_pool_stats
+
+def square(n):
+    return n * n
+
+def test_pool_map_keeps_order_and_releases_slots():
+    assert pool_map(square, range(200)) == [n * n for n in range(200)]
+    assert process_pool_stats()['pending'] == 0
+
+def test_login_answers_busy_when_hashing_times_out(client, monkeypatch):
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_TIMEOUT', 0)
+    response = client.post('/api/login', json={'user_id': 'ADMIN001', 'password': 'admin123', 'role': 'admin'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+def test_add_employee_answers_busy_when_hashing_times_out(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(passwords, 'PASSWORD_HASH_TIMEOUT', 0)
+    response = client.post('/api/employees', headers=admin_headers, json={
+        'user_id': 'SLOWHASH', 'password': 'pw123456', 'name': 'Slow', 'grade': '1', 'email': 'a@b', 'phone': '1'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
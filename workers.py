@@ -0,0 +1,110 @@
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Shared process pool for CPU-bound work (badge rendering, password hashing)
+CPU_WORKERS = int(os.environ.get('CPU_WORKERS', str(os.cpu_count() or 2)))
+# Tasks submit_bounded lets into the pool (running + queued) before turning callers away
+CPU_QUEUE_MAX = int(os.environ.get('CPU_QUEUE_MAX', str(CPU_WORKERS * 8)))
+# Most items pool_map sends to a worker as one task; smaller chunks let a
+# login waiting behind bulk work (badge sheets, roster imports) in sooner
+CPU_MAP_CHUNK_MAX = int(os.environ.get('CPU_MAP_CHUNK_MAX', '16'))
+
+# Modules whose functions run in the pool; imported once by the fork server
+WORKER_MODULES = ['badges', 'passwords']
+
+class WorkerPoolBusy(Exception):
+    """The process pool's queue is full; retry later"""
+
+_executor = None
+_executor_lock = threading.Lock()
+_queue_slots = threading.BoundedSemaphore(CPU_QUEUE_MAX)
+_queue_counters = {'submitted': 0, 'rejected': 0}
+# Tasks holding a queue slot, for stats (the semaphore's count is private)
+_pending = 0
+_pending_lock = threading.Lock()
+
+def get_process_pool():
+    """Lazily created process pool, one per gunicorn worker.
+
+    Children fork from a clean forkserver that only imported WORKER_MODULES,
+    never from a threaded gunicorn worker and never re-running app.py.
+    Daemonic processes (hypercorn's workers) may not have children, so
+    they get a thread pool instead; hashlib's key derivation and zlib
+    release the GIL, so hashing still runs in parallel there.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None and multiprocessing.current_process().daemon:
+            _executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='cpu-worker')
+        if _executor is None:
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(WORKER_MODULES)
+            _executor = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=context)
+        return _executor
+
+def _map_chunk(fn, chunk):
+    return [fn(item) for item in chunk]
+
+def pool_map(fn, items, inline_below=4):
+    """map() over the process pool; tiny batches run inline to skip IPC overhead.
+
+    Items go in chunks of at most CPU_MAP_CHUNK_MAX, each holding a
+    submit_bounded slot, and at most CPU_WORKERS chunks are queued at a
+    time, so bulk work waits its turn for slots instead of filling the
+    pool's queue ahead of logins.
+    """
+    items = list(items)
+    if len(items) < inline_below:
+        return [fn(item) for item in items]
+    size = max(1, min(len(items) // (CPU_WORKERS * 4), CPU_MAP_CHUNK_MAX))
+    results, in_flight = [], deque()
+    for start in range(0, len(items), size):
+        if len(in_flight) >= CPU_WORKERS:
+            results.extend(in_flight.popleft().result())
+        in_flight.append(_submit(_map_chunk, (fn, items[start:start + size]), blocking=True))
+    while in_flight:
+        results.extend(in_flight.popleft().result())
+    return results
+
+def submit_bounded(fn, *args):
+    """Submit one task unless CPU_QUEUE_MAX tasks are already pending; raises WorkerPoolBusy.
+
+    Rejecting at the door keeps a login burst from queueing minutes of
+    hashing behind requests whose clients have long since given up.
+    """
+    return _submit(fn, args, blocking=False)
+
+def _submit(fn, args, blocking):
+    # Blocking callers (pool_map) wait for a slot rather than being turned away
+    global _pending
+    if not _queue_slots.acquire(blocking=blocking):
+        _queue_counters['rejected'] += 1
+        raise WorkerPoolBusy(f"{CPU_QUEUE_MAX} CPU tasks already pending")
+    with _pending_lock:
+        _pending += 1
+    try:
+        future = get_process_pool().submit(fn, *args)
+    except BaseException:
+        _release_slot()
+        raise
+    _queue_counters['submitted'] += 1
+    future.add_done_callback(lambda _: _release_slot())
+    return future
+
+def _release_slot():
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+    _queue_slots.release()
+
+def process_pool_stats():
+    """Bounded-queue statistics for this worker process"""
+    return {
+        'workers': CPU_WORKERS,
+        'queue_max': CPU_QUEUE_MAX,
+        'pending': _pending,
+        **_queue_counters
+    }